@@ -0,0 +1,216 @@
+"""
+Alert State Machine - One alert per change, not one per tick.
+
+Debouncing used to be a single global timestamp (10s) in the simulation branch
+only: a long X-flare re-sent every 10 seconds and live NOAA data never alerted.
+AlertTracker keeps one incident per threat type (flux, wind, kp, proton) of a
+HybridEngine stream and only emits on transitions:
+
+- open:     quiet -> active (severity >= 1)
+- escalate: severity rises above the highest level already alerted
+- resolve:  quiet for `resolve_hold` seconds (hold-down; the engine already
+            applies value hysteresis before a status clears)
+Severity falling back inside an incident is not announced, so flapping around
+a threshold never re-sends. Each event goes out once over WS (alert_update)
+and by email (mailer.py) to the users subscribed to that threat/severity.
+
+The live tracker persists its state (models.AlertState), so a restart or a
+leader failover in the middle of a storm does not re-open it.
+"""
+
+import time
+from derivative_engine import TELEMETRY_RULES
+from models import SessionLocal, AlertState
+from subscribers import THREAT_TYPES
+
+FLUX_DETAILS = {
+    "RAPID_INTENSIFICATION": "Early Warning: Flux Rising Fast",
+    "M_CLASS_FLARE": "Moderate Flare Ongoing",
+    "X_CLASS_FLARE": "MAJOR EVENT IN PROGRESS",
+}
+
+# Value -> severity steps (1-5, roughly the NOAA R/G/S scales)
+SEVERITY_STEPS = {
+    "flux": [(1e-5, 2), (5e-5, 3), (1e-4, 4), (1e-3, 5)],  # M1 R1, M5 R2, X1 R3, X10 R4+
+    "wind": [(800, 2), (1000, 3), (1200, 4)],  # km/s
+    "kp": [(7, 3), (8, 4), (9, 5)],  # G3-G5
+    "proton": [(10, 1), (100, 2), (1e3, 3), (1e4, 4), (1e5, 5)],  # pfu, S1-S5
+}
+
+TELEMETRY_BY_CHANNEL = {rule["channel"]: rule for rule in TELEMETRY_RULES}
+
+
+def severity(channel, status, value):
+    """0 when the engine says STABLE, else 1-5."""
+    if status == "STABLE" or value is None:
+        return 0
+    level = 1  # Active but below the first step (e.g. RAPID_INTENSIFICATION)
+    for threshold, step in SEVERITY_STEPS[channel]:
+        if value >= threshold:
+            level = step
+    return level
+
+
+def describe(channel, status, value):
+    """(details, value_display) in the same wording as the engine results."""
+    if channel == "flux":
+        return FLUX_DETAILS.get(status, "Calm"), f"{value:.2e} W/m²"
+    rule = TELEMETRY_BY_CHANNEL[channel]
+    return rule["details"].format(value=value), rule["display"].format(value=value)
+
+
+class ThreatState:
+    __slots__ = ("level", "status", "value", "opened_at", "clear_since")
+
+    def __init__(self, level=0, status=None, value=None, opened_at=None, clear_since=None):
+        self.level = level
+        self.status = status
+        self.value = value  # Peak of the current incident
+        self.opened_at = opened_at
+        self.clear_since = clear_since
+
+
+class AlertTracker:
+    def __init__(self, stream="live", resolve_hold=600.0, persist=True):
+        self.stream = stream
+        self.resolve_hold = resolve_hold
+        self.persist = persist
+        self.states = {channel: ThreatState() for channel in THREAT_TYPES}
+        self.dirty = set()
+        self.stats = {"opened": 0, "escalated": 0, "resolved": 0}
+
+    def observe(self, engine, now=None):
+        """
+        Reads the engine's per-channel state for our stream and returns the
+        transition events (usually none).
+        """
+        now = time.time() if now is None else now
+        events = []
+        for channel in THREAT_TYPES:
+            channel_state = engine.streams.get((self.stream, channel))
+            if channel_state is None or channel_state.last_value is None:
+                continue
+            t = channel_state.last_time or now
+            event = self._step(channel, channel_state, t)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _step(self, channel, channel_state, t):
+        state = self.states[channel]
+        status, value = channel_state.status, channel_state.last_value
+        level = severity(channel, status, value)
+
+        if level > 0:
+            changed = state.clear_since is not None
+            state.clear_since = None
+            if state.level == 0 or level > state.level:
+                transition = "open" if state.level == 0 else "escalate"
+                previous = state.level
+                if state.level == 0:
+                    state.opened_at, state.value = t, value
+                state.level, state.status = level, status
+                state.value = max(value, state.value)
+                self.dirty.add(channel)
+                return self._event(channel, transition, level, previous, status, value, channel_state.slope, t)
+            if value > state.value:
+                state.value = value  # New peak at the same level: no alert
+                changed = True
+            if changed:
+                self.dirty.add(channel)
+            return None
+
+        if state.level == 0:
+            return None
+        if state.clear_since is None:
+            state.clear_since = t
+            self.dirty.add(channel)
+            return None
+        if t - state.clear_since < self.resolve_hold:
+            return None
+        return self._resolve(channel, t)
+
+    def resolve_all(self, now=None):
+        """Closes every open incident now (e.g. a simulation ended)."""
+        now = time.time() if now is None else now
+        return [self._resolve(channel, now)
+                for channel, state in self.states.items() if state.level > 0]
+
+    def _resolve(self, channel, t):
+        state = self.states[channel]
+        # Resolve events carry the peak, so they reach the same subscribers
+        event = self._event(channel, "resolve", state.level, state.level, state.status, state.value, 0.0, t)
+        self.states[channel] = ThreatState()
+        self.dirty.add(channel)
+        return event
+
+    def _event(self, channel, transition, level, previous, status, value, slope, t):
+        self.stats[{"open": "opened", "escalate": "escalated", "resolve": "resolved"}[transition]] += 1
+        details, value_display = describe(channel, status, value)
+        if transition == "resolve":
+            details = "All clear: back below alert levels"
+        state = self.states[channel]
+        return {
+            "stream": self.stream,
+            "threat_type": channel,
+            "transition": transition,
+            "severity": level,
+            "previous_severity": previous,
+            "status": status,
+            "details": details,
+            "value": value,
+            "value_display": value_display,
+            "slope": slope,
+            "opened_at": state.opened_at,
+            "time": t,
+        }
+
+    # --- PERSISTENCE (blocking; run via asyncio.to_thread) ---
+
+    def _key(self, channel):
+        return f"{self.stream}:{channel}"
+
+    def load(self):
+        if not self.persist:
+            return
+        db = SessionLocal()
+        try:
+            for channel in THREAT_TYPES:
+                row = db.get(AlertState, self._key(channel))
+                if row is not None:
+                    self.states[channel] = ThreatState(row.level, row.status, row.value,
+                                                       row.opened_at, row.clear_since)
+        finally:
+            db.close()
+        self.dirty.clear()
+
+    def save(self):
+        """Writes the incidents that changed since the last save."""
+        if not self.persist or not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, set()
+        db = SessionLocal()
+        try:
+            for channel in dirty:
+                state = self.states[channel]
+                row = db.get(AlertState, self._key(channel)) or AlertState(key=self._key(channel))
+                row.level, row.status, row.value = state.level, state.status, state.value
+                row.opened_at, row.clear_since = state.opened_at, state.clear_since
+                db.merge(row)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.dirty |= dirty
+            print(f"[WARN] Could not persist alert state: {e}")
+        finally:
+            db.close()
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            "incidents": {
+                channel: {"severity": state.level, "status": state.status, "peak_value": state.value,
+                          "opened_at": state.opened_at, "clear_since": state.clear_since}
+                for channel, state in self.states.items() if state.level > 0
+            },
+        }
@@ -1,17 +1,39 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, status
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 import asyncio
 import json
+import logging
+import os
 import secrets
-from datetime import datetime
-from schemas import WSMessage
-from fetcher import fetch_noaa_data
-from simulator import generate_flare
+import time
+import numpy as np
+from typing import List, Optional
+from datetime import datetime, timezone
+from schemas import WSMessage, SolarPoint
+from fetcher import start_http_client, close_http_client, get_conditional_stats, series_store
+from fetcher import FEEDS, DEFAULT_TELEMETRY, HISTORY_WINDOW_SECONDS, fetch_feed
+from archive import archive, ROLLUP_RESOLUTIONS, STAT_RESOLUTIONS
+from downsample import ALGORITHMS, minmax, lttb
+from timeseries import SeriesStore, series_records, epoch_to_iso
+from ingest import classify_flux
+from simulator import Simulation, build_components, compile_scenario, load_scenario, list_scenarios
+from simulator import EVENT_COMPONENTS, TICK_SECONDS
+from replay import ReplayEngine, EVENTS, MIN_SPEED, MAX_SPEED, TELEMETRY_KEYS, archived_dataset, storm_dataset
 from derivative_engine import HybridEngine  # NEW: Hybrid Layer
-from pydantic import BaseModel, EmailStr
-from brownie_auth.routes import router as brownie_router, send_alert_email
-from models import SessionLocal, User  # For fetching users for alerts
+from snapshot import Snapshot, SnapshotStore
+from broadcast import BroadcastHub
+from wire import encode_message, negotiate_format
+from pubsub import create_pubsub
+from leader import LeaderElector
+from scheduler import FeedScheduler, FeedJob
+from mailer import AlertMailer
+from subscribers import subscriber_cache
+from alerts import AlertTracker
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from brownie_auth.routes import router as brownie_router
+
+logger = logging.getLogger(__name__)
 
 # THIS IS THE MISSING LINE CAUSING YOUR ERROR
 app = FastAPI()
@@ -40,13 +62,27 @@ app.add_middleware(
 
 
 
-active_connections = set()
-simulation_queue = []  # Stores fake points to be sent
+# Per-client bounded queues + writer tasks (broadcast.py)
+hub = BroadcastHub(stamp=os.getenv("HELIOS_STAMP_FRAMES") == "1")
+simulations = {}  # name -> Simulation, played by the heartbeat (fetcher process only)
+
+# --- MULTI-WORKER FAN-OUT (pubsub.py) ---
+# Broadcasts, /simulate requests and NOAA snapshots travel over the bus, so any
+# number of workers can each serve their own WebSocket clients.
+bus = create_pubsub(os.getenv("HELIOS_PUBSUB_URL", "memory://"))
+# Only the fetcher polls NOAA and runs simulations; the others relay its frames.
+# HELIOS_FETCHER: "1" always fetch, "0" never, "auto" elect one via a DB lease
+# (leader.py). A local bus cannot reach other processes, so each one fetches.
+FETCHER_MODE = os.getenv("HELIOS_FETCHER", "1" if bus.is_local else "auto")
 
-is_simulating = False
 hybrid_engine = HybridEngine() # Instantiate Hybrid Engine
-data_cache = []  # Cache for historical data
-last_alert_time = datetime.min  # For email debouncing
+snapshot_store = SnapshotStore(hybrid_engine)  # Shared NOAA snapshot for all clients
+# Alert state machines (one incident per threat type); live survives restarts
+live_alerts = AlertTracker("live", resolve_hold=float(os.getenv("HELIOS_ALERT_RESOLVE_HOLD", "600")))
+sim_alerts = {}  # Simulation name -> its own AlertTracker
+# Replays run on dataset time, so the live hold-down applies
+replay_alerts = AlertTracker("replay", resolve_hold=600.0, persist=False)
+mailer = AlertMailer.from_env()  # Threat alert emails (started with the app)
 
 # --- AUTH STORAGE (In-Memory for Demo) ---
 otp_store = {}  # {email: otp}
@@ -62,189 +98,694 @@ def send_email_mock(email: str, otp: str):
 # Global event for instant wake-up
 update_event = asyncio.Event()
 
+def on_leadership_change(is_leader):
+    # Wake the heartbeat so it starts/stops right away; a new leader picks up
+    # the alert incidents the previous one left open
+    update_event.set()
+    if is_leader:
+        asyncio.create_task(asyncio.to_thread(live_alerts.load))
+        if snapshot_store.snapshot is not None:
+            asyncio.create_task(publish_snapshot(snapshot_store.snapshot))
+
+elector = LeaderElector(
+    ttl=float(os.getenv("HELIOS_LEADER_TTL", "30")),
+    renew_interval=float(os.getenv("HELIOS_LEADER_RENEW", "10")),
+    on_change=on_leadership_change,
+) if FETCHER_MODE == "auto" else None
+
+def is_fetcher():
+    if elector is not None:
+        return elector.is_leader
+    return FETCHER_MODE == "1"
+
 @app.get("/health")
 async def health_check():
-    return {"status": "online", "mode": "live"}
+    return {"status": "online", "mode": "live", "role": "fetcher" if is_fetcher() else "follower"}
+
+@app.get("/api/metrics/leader")
+async def leader_metrics():
+    # Who fetches NOAA right now, and how often leadership has moved
+    if elector is None:
+        return {"election": False, "is_leader": is_fetcher()}
+    return {"election": True, **elector.get_stats()}
+
+@app.get("/api/metrics/fetch")
+async def fetch_metrics():
+    # Conditional GET effectiveness (304s, bytes & parse time saved)
+    return get_conditional_stats()
+
+@app.get("/api/metrics/feeds")
+async def feed_metrics():
+    # Per-feed cadence, retries, timeouts and circuit breaker state
+    return feed_scheduler.get_stats()
+
+@app.get("/api/metrics/archive")
+async def archive_metrics():
+    # Rows written, upsert time, warm-start size, newest archived sample per channel
+    return archive.get_stats()
+
+@app.get("/api/metrics/alerts")
+async def alert_metrics():
+    # Email delivery: throughput per batch, retries, failures, SMTP reconnects
+    return {
+        **mailer.get_stats(),
+        "subscribers": subscriber_cache.get_stats(),
+        "live": live_alerts.get_stats(),
+    }
+
+@app.get("/api/metrics/broadcast")
+async def broadcast_metrics():
+    # Fan-out health: queued/dropped/coalesced frames, lag disconnects
+    return hub.get_stats()
+
+@app.get("/api/analysis/flux")
+async def analyze_flux_window(
+    t_from: Optional[int] = Query(None, alias="from"),
+    t_to: Optional[int] = Query(None, alias="to"),
+):
+    # Backfill classifications for the whole live window in one vectorized pass
+    # from/to: epoch seconds (default: everything in the series store)
+    result = hybrid_engine.analyze_series(series_store["flux"], t_from, t_to)
+    return {
+        "timestamps": result["timestamps"].tolist(),
+        "slope": result["slope"].tolist(),
+        "smoothed_slope": result["smoothed_slope"].tolist(),
+        "status": result["status"].tolist(),
+        "crossings": result["crossings"],
+    }
+
+# Rollup chosen so a query reads at most this many rows (sub-100ms on SQLite)
+SERIES_ROW_BUDGET = 10000
+
+def read_archive_series(channel, t_from, t_to, max_points, resolution):
+    # Blocking (runs in a thread): raw samples or the finest rollup within budget
+    if resolution == "auto":
+        span = max(t_to - t_from, 1)
+        budget = max(SERIES_ROW_BUDGET, 4 * max_points)
+        resolution = next((name for name, seconds in ROLLUP_RESOLUTIONS.items() if span / seconds <= budget), "1d")
+    if resolution == "raw":
+        times, values = archive.query(channel, t_from, t_to)
+        return resolution, times, values, values, values
+    return (resolution,) + archive.query_rollup(channel, ROLLUP_RESOLUTIONS[resolution], t_from, t_to)[:4]
+
+def series_points(channel, t_from, t_to, max_points, resolution, algorithm, columns=None):
+    # Blocking (runs in a thread): (times, values) from memory (columns) or the
+    # archive, downsampled. Returns (resolution, rows read, times, values)
+    if columns is not None:
+        times, values = columns
+        mins = maxs = values
+        resolution = "raw"
+    else:
+        resolution, times, values, mins, maxs = read_archive_series(channel, t_from, t_to, max_points, resolution)
+
+    count_in = len(times)
+    if algorithm == "lttb":
+        if mins is not values:
+            # Rollup buckets: feed LTTB each bucket's min and max, not its mean,
+            # so peaks survive
+            order = np.argsort(np.concatenate([times, times]), kind="stable")
+            times = np.concatenate([times, times])[order]
+            values = np.concatenate([mins, maxs])[order]
+        times, values = lttb(times, values, max_points)
+    else:
+        times, values = minmax(times, values, max_points, mins, maxs)
+    return resolution, count_in, times, values
+
+@app.get("/api/series/{channel}")
+async def get_series(
+    channel: str,
+    t_from: Optional[int] = Query(None, alias="from"),
+    t_to: Optional[int] = Query(None, alias="to"),
+    max_points: int = Query(1000, ge=10, le=20000),
+    resolution: str = "auto",
+    algorithm: str = "minmax",
+):
+    # Chart-sized history of one channel: from/to in epoch seconds (default: last 24h)
+    # resolution: auto | raw | 1m | 5m | 1h | 1d; algorithm: minmax (keeps every peak) | lttb
+    if channel not in SeriesStore.CHANNELS:
+        raise HTTPException(status_code=404, detail=f"Unknown channel: {channel}")
+    if resolution not in ("auto", "raw", *ROLLUP_RESOLUTIONS):
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+    if algorithm not in ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"Unknown algorithm: {algorithm}")
+
+    started = time.perf_counter()
+    t_to = int(time.time()) if t_to is None else t_to
+    t_from = t_to - 86400 if t_from is None else t_from
+
+    # Recent ranges come straight from memory; older ones from the archive
+    series = series_store[channel]
+    in_memory = len(series) and t_from >= series.times[0] and resolution in ("auto", "raw")
+    if in_memory:
+        # Copied here, on the loop: the feeds keep merging into the series. Kept in
+        # the storage dtype (float32 for most channels): series_records converts
+        # via to_float_list, as the archive did on the way in (1.71, not 1.7100000381)
+        times, values = series.slice(t_from, t_to)
+        columns = (times.copy(), values.copy())
+        source = "memory"
+    else:
+        columns = None
+        source = "archive"
+    # Archive read and downsampling both off the event loop (20000 points take
+    # tens of ms): broadcasts keep flowing meanwhile
+    resolution, count_in, times, values = await asyncio.to_thread(
+        series_points, channel, t_from, t_to, max_points, resolution, algorithm, columns
+    )
+
+    return {
+        "channel": channel,
+        "from": t_from,
+        "to": t_to,
+        "source": source,
+        "resolution": resolution,
+        "algorithm": algorithm,
+        "count_in": count_in,
+        "count": len(times),
+        "points": series_records(times, values),
+        "took_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+def read_archive_stats(channel, t_from, t_to, resolution):
+    # Blocking (runs in a thread): rollup extremes plus the event counters per bucket
+    seconds = STAT_RESOLUTIONS[resolution]
+    # One SELECT for values and sample counts: the rollups refresh every minute
+    times, means, mins, maxs, counts = archive.query_rollup(channel, seconds, t_from, t_to)
+    counters = archive.query_stats(channel, seconds, t_from, t_to)
+    return times, means, mins, maxs, counts, counters
+
+@app.get("/api/stats/{channel}")
+async def get_channel_stats(
+    channel: str,
+    t_from: Optional[int] = Query(None, alias="from"),
+    t_to: Optional[int] = Query(None, alias="to"),
+    resolution: str = "1d",
+):
+    # Long-range statistics from the precomputed tables: daily (or hourly) min/max/mean,
+    # flares per class (flux) and the Kp histogram (kp). from/to: epoch seconds (default: last 30 days)
+    if channel not in SeriesStore.CHANNELS:
+        raise HTTPException(status_code=404, detail=f"Unknown channel: {channel}")
+    if resolution not in STAT_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+
+    started = time.perf_counter()
+    t_to = int(time.time()) if t_to is None else t_to
+    t_from = t_to - 30 * 86400 if t_from is None else t_from
+    times, means, mins, maxs, counts, counters = await asyncio.to_thread(
+        read_archive_stats, channel, t_from, t_to, resolution
+    )
+
+    totals = {}
+    for bucket in counters.values():
+        for key, count in bucket.items():
+            totals[key] = totals.get(key, 0) + count
+    buckets = [
+        {"timestamp": ts, "min": float(lo), "max": float(hi), "mean": float(mean),
+         "samples": int(samples), "counters": counters.get(int(t), {})}
+        for ts, t, lo, hi, mean, samples in zip(epoch_to_iso(times), times, mins, maxs, means, counts)
+    ]
+    return {
+        "channel": channel,
+        "from": t_from,
+        "to": t_to,
+        "resolution": resolution,
+        "buckets": buckets,
+        "totals": {
+            "min": float(mins.min()) if len(mins) else None,
+            "max": float(maxs.max()) if len(maxs) else None,
+            "samples": int(counts.sum()),
+            "counters": dict(sorted(totals.items())),
+        },
+        "took_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept() # CRITICAL: MUST BE FIRST
     print(f"WebSocket connected: {websocket.client}")
-    active_connections.add(websocket)
 
-    try:
-        # Send Initial 6-Hour History
-        points = await fetch_noaa_data()
-        if points:
-            # We send a special 'history_update'
-            msg = WSMessage(
-                type="history_update", 
-                payload={"history": [p.model_dump() for p in points]}
+    params = websocket.query_params
+    # Opt-in compact history encoding: /ws?format=compact|msgpack (see wire.py)
+    wire_format = negotiate_format(params.get("format"))
+
+    # Resume: /ws?stream=<id>&since_seq=<n> (or since=<epoch|ISO>) replays only
+    # the frames missed while disconnected (see broadcast.py)
+    initial_frames = None
+    if params.get("stream"):
+        try:
+            initial_frames = hub.resume_frames(
+                params.get("stream"),
+                since_seq=int(params["since_seq"]) if params.get("since_seq") else None,
+                since_time=parse_since(params["since"]) if params.get("since") else None,
             )
-            await websocket.send_text(msg.json())
-            
-            # --- HYBRID LAYER (Immediate Update) ---
-            # Send initial calculus data so UI doesn't say "Loading..."
-            calc_data = hybrid_engine.analyze(points)
-            msg_calc = WSMessage(type="calculus_update", payload=calc_data)
-            await websocket.send_text(msg_calc.json())
-
-        # --- TELEMETRY HISTORY (Wind & Kp) ---
-        from fetcher import fetch_telemetry_history
-        telemetry_hist = await fetch_telemetry_history()
-        msg_telem_hist = WSMessage(type="telemetry_history_update", payload=telemetry_hist)
-        await websocket.send_text(msg_telem_hist.json())
-
-    except Exception as e:
-        print(f"Error sending initial data: {e}")
-
+        except ValueError:
+            initial_frames = None
+    mode = "replay" if initial_frames is not None else "snapshot"
+
+    if initial_frames is None:
+        # Served from the shared snapshot (no per-client NOAA fetch):
+        # 'history_update', then calculus data so UI doesn't say "Loading...",
+        # then TELEMETRY HISTORY (Wind & Kp). Pre-encoded once per snapshot.
+        initial_frames = []
+        try:
+            # Followers never poll NOAA: the fetcher's last published snapshot
+            snapshot = await snapshot_store.get(fetch=is_fetcher())
+            if snapshot is not None:
+                initial_frames = snapshot.initial_frames(wire_format)
+        except Exception as e:
+            print(f"Error sending initial data: {e}")
+
+    # 'sync' tells the client where it stands so it can resume next time
+    sync = WSMessage(type="sync", payload={
+        "stream_id": hub.stream_id, "seq": hub.seq, "mode": mode, "frames": len(initial_frames)
+    })
+
+    # The hub's writer task owns all sends from here on
+    client = hub.connect(websocket, [encode_message(sync)] + initial_frames)
     try:
         while True:
             await websocket.receive_text()
-    except WebSocketDisconnect:
-        active_connections.remove(websocket)
-
-async def heartbeat():
-    global is_simulating, simulation_queue, update_event, data_cache, last_alert_time
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # RuntimeError: the hub already closed a lagging client
+    finally:
+        hub.disconnect(client)
 
+def parse_since(value):
+    """?since= as epoch seconds or an ISO-8601 timestamp -> epoch seconds."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+async def announce(*messages):
+    """Publishes messages to every worker's hub (including ours) via the bus."""
+    for msg in messages:
+        await bus.publish("broadcast", msg.model_dump(mode="json"))
+
+async def relay_broadcasts(subscription):
+    # Every worker: bus -> local BroadcastHub -> its own WebSocket clients
+    async for data in subscription:
+        hub.publish(WSMessage(type=data["type"], payload=data["payload"]))
+
+async def consume_simulations(subscription):
+    # Fetcher only: /simulate requests from any worker
+    async for data in subscription:
+        if not is_fetcher():
+            continue
+        name = data["name"]
+        if name in simulations:
+            await process_alerts(*end_simulation(name))  # Same name: the new one replaces it
+        if data.get("action") == "stop":
+            continue
+        try:
+            if data.get("scenario"):
+                simulation = compile_scenario(data["scenario"], name, data["seed"], data.get("compression"))
+            else:
+                components = build_components(data["components"], data["duration"])
+                simulation = Simulation(name, components, data["duration"], seed=data["seed"])
+        except ValueError as e:
+            print(f"[WARN] Simulation not started: {e}")
+            continue
+        simulations[name] = simulation
+        # Hold-down of ten samples, in simulated time
+        sim_alerts[name] = AlertTracker(simulation.stream, resolve_hold=10.0 * simulation.cadence, persist=False)
+        # WAKE UP THE LOOP INSTANTLY!
+        update_event.set()
+
+def end_simulation(name):
+    # Forget the session and its engine state; returns the resolve events
+    simulation = simulations.pop(name)
+    tracker = sim_alerts.pop(name)
+    hybrid_engine.reset(simulation.stream)
+    return tracker, tracker.resolve_all()
+
+async def consume_replays(subscription):
+    # Fetcher only: /api/replay start/stop requests from any worker
+    async for data in subscription:
+        if not is_fetcher():
+            continue
+        if data["action"] == "stop":
+            await replayer.stop()
+            continue
+        try:
+            if data.get("event"):
+                dataset = storm_dataset(data["event"])
+            else:
+                dataset = await asyncio.to_thread(archived_dataset, data["from"], data["to"])
+            await replayer.start(dataset, data["speed"], send_emails=data["send_emails"])
+            update_event.set()
+        except ValueError as e:
+            print(f"[WARN] Replay not started: {e}")
+
+# Leader: republish at least this often, so followers never serve an old
+# snapshot for long while the feeds are paused (simulation, replay)
+SNAPSHOT_PUBLISH_INTERVAL = 30.0
+snapshot_published_at = 0.0  # time.monotonic() of the last publish
+
+async def publish_snapshot(snapshot):
+    global snapshot_published_at
+    if bus.is_local or not is_fetcher():
+        return
+    snapshot_published_at = time.monotonic()
+    await bus.publish("snapshot", snapshot.to_dict())
+
+async def republish_snapshots():
+    # Leader only: covers startup (warm start) and paused feeds
     while True:
-        if active_connections:
-            # MODE 1: SIMULATION
-            if is_simulating and simulation_queue:
-                item = simulation_queue.pop(0)
-                
-                # Check for Telemetry Dict (Wind/Kp/Proton)
-                if isinstance(item, dict) and item.get("type") == "telemetry_sim":
-                    # Send as Telemetry Update
-                    msg = WSMessage(type="telemetry_update", payload=item)
-                else:
-                    # Send as Flux Data Update (SolarPoint object)
-                    msg = WSMessage(type="data_update", payload=item.model_dump())
-
-                for connection in list(active_connections):
-                    try:
-                        await connection.send_text(msg.json())
-                    except:
-                        active_connections.remove(connection)
-
-                if not simulation_queue:
-                    is_simulating = False
-
-                # Fast updates for smooth animation (adjusted to 300ms as requested)
-                # Fast updates for smooth animation (adjusted to 300ms as requested)
-                # ALERT LOGIC (Simulation Mode)
-                # ALERT LOGIC (Simulation Mode)
-                # Check EVERY item (Flux List OR Telemetry Dict)
-                # if not isinstance(item, dict):
-                #     calc_data = hybrid_engine.analyze([item]) 
-                # else:
-                #     calc_data = hybrid_engine.analyze(item)
-                
-                # SIMPLIFIED: Just pass it. The Engine now handles both.
-                calc_data = hybrid_engine.analyze(item if isinstance(item, dict) else [item])
-
-                if calc_data['is_warning']:
-                        now = datetime.utcnow()
-                        if (now - last_alert_time).total_seconds() > 10:
-                            last_alert_time = now
-                            print(f"⚠ THREAT DETECTED (SIM): {calc_data['status']} - SENDING ALERTS...")
-                            import threading
-                            def dispatch_alerts():
-                                try:
-                                    db = SessionLocal()
-                                    users = db.query(User).all()
-                                    if not users: print("⚠ No users found in DB to alert!")
-                                    for user in users:
-                                        send_alert_email(user.email, calc_data)
-                                        print(f"✔ Alert sent to {user.email}")
-                                    db.close()
-                                except Exception as e:
-                                    print(f"Alert Dispatch Error: {e}")
-                            threading.Thread(target=dispatch_alerts).start()
-
-                await asyncio.sleep(0.3)
-                continue
-
-            # MODE 2: LIVE NOAA
-            elif not is_simulating:
-                # 1. Fetch Flux Chart Data
-                points = await fetch_noaa_data()
-                if points:
-                    # Update cache
-                    data_cache = points
-                    latest = points[-1]
-                    msg = WSMessage(type="data_update", payload=latest.model_dump())
-                    
-                    # --- HYBRID LAYER ---
-                    # Calculate dFlux/dt + Thresholds
-                    calc_data = hybrid_engine.analyze(points)
-                    msg_calc = WSMessage(type="calculus_update", payload=calc_data)
-                    
-                    for connection in list(active_connections):
-                        try:
-                            await connection.send_text(msg.json())
-                            await connection.send_text(msg_calc.json())
-                        except:
-                            active_connections.remove(connection)
-
-                # 2. Fetch Detailed Telemetry (Physics View)
-                from fetcher import fetch_telemetry, fetch_solar_regions
-                
-                # Parallel Fetch
-                telemetry_data, active_regions = await asyncio.gather(
-                    fetch_telemetry(),
-                    fetch_solar_regions()
-                )
-                
-                # Send Telemetry
-                msg_telemetry = WSMessage(type="telemetry_update", payload=telemetry_data)
-                
-                # Send Regions
-                msg_regions = WSMessage(type="regions_update", payload={"regions": active_regions})
-
-                for connection in list(active_connections):
-                    try:
-                        await connection.send_text(msg_telemetry.json())
-                        await connection.send_text(msg_regions.json())
-                    except:
-                        pass
-
-                # Wait 60 seconds OR until an event is set (instant wake-up)
-                try:
-                    await asyncio.wait_for(update_event.wait(), timeout=60.0)
-                    update_event.clear()  # Reset event after waking up
-                except asyncio.TimeoutError:
-                    pass  # Just a normal timeout, loop again
-
-
-
+        await asyncio.sleep(SNAPSHOT_PUBLISH_INTERVAL / 3)
+        due = time.monotonic() - snapshot_published_at >= SNAPSHOT_PUBLISH_INTERVAL
+        if due and snapshot_store.snapshot is not None:
+            try:
+                await publish_snapshot(snapshot_store.snapshot)
+            except Exception as e:
+                print(f"[WARN] Snapshot publish failed: {e}")
+
+async def consume_snapshots(subscription):
+    # Followers: serve new connections from the fetcher's snapshot, not NOAA
+    async for data in subscription:
+        if is_fetcher():
+            continue
+        snapshot_store.install(Snapshot.from_dict(data))
+
+async def dispatch_alerts(event):
+    # Pooled SMTP sessions + rate limit + retries (mailer.py); never blocks the loop
+    try:
+        # Only users subscribed to this threat type/severity (subscribers.py)
+        emails = await asyncio.to_thread(subscriber_cache.recipients, event["threat_type"], event["severity"])
+        if not emails:
+            logger.info("No subscribers matched threat %s at severity %s", event["threat_type"], event["severity"])
+            return
+        if event["transition"] == "resolve":
+            event = {**event, "status": f"RESOLVED {event['status']}"}
+        mailer.send_batch(emails, event)
+    except Exception as e:
+        print(f"Alert Dispatch Error: {e}")
+
+async def process_alerts(tracker, events, email=True):
+    # Each state change goes out exactly once: WS alert_update + email
+    if tracker.persist and tracker.dirty:
+        await asyncio.to_thread(tracker.save)
+    for event in events:
+        print(f"⚠ THREAT {event['transition'].upper()} ({tracker.stream}): {event['status']} severity {event['severity']} - SENDING ALERTS...")
+        await announce(WSMessage(type="alert_update", payload=event))
+        if email:
+            asyncio.create_task(dispatch_alerts(event))
+
+# --- EVENT REPLAY (replay.py) ---
+# Samples go through the same engine/alert/broadcast path as live data. Frames
+# are marked as simulation data (plus the replay name), so dashboards never mix
+# them into the real history.
+replay_telemetry = {}  # Latest replayed wind/Kp/proton, merged like latest_telemetry
+
+async def on_replay_samples(dataset, batch):
+    for channel, t, value in batch:
+        timestamp = datetime.fromtimestamp(t, tz=timezone.utc)
+        if channel == "flux":
+            point = SolarPoint(timestamp=timestamp, flux=value, class_type=classify_flux(value), source="simulation")
+            hybrid_engine.push(point, stream="replay")
+            msg = WSMessage(type="data_update", payload={**point.model_dump(), "replay": dataset.name})
         else:
-            await asyncio.sleep(1)
+            sample = {"timestamp": timestamp.isoformat(), TELEMETRY_KEYS[channel]: value}
+            replay_telemetry.update(sample)
+            hybrid_engine.push(sample, stream="replay")
+            msg = WSMessage(type="telemetry_update",
+                            payload={"type": "telemetry_sim", **replay_telemetry, "replay": dataset.name})
+        await announce(msg)
+        events = replay_alerts.observe(hybrid_engine)
+        if events:
+            await process_alerts(replay_alerts, events, email=replayer.options.get("send_emails", False))
+
+async def on_replay_end(dataset):
+    events = replay_alerts.resolve_all()
+    hybrid_engine.reset("replay")
+    replay_telemetry.clear()
+    await process_alerts(replay_alerts, events, email=replayer.options.get("send_emails", False))
+    update_event.set()  # Live feeds resume
+
+replayer = ReplayEngine(on_replay_samples, on_replay_end)
+
+async def heartbeat():
+    # Live NOAA data is pushed by feed_scheduler as it arrives; this loop plays
+    # back simulations. Followers idle: the leader's frames reach our clients
+    # via relay_broadcasts.
+    while True:
+        # MODE 1: SIMULATION (every running session's due steps per tick: one,
+        # or more for time-compressed scenarios)
+        # With a networked bus other workers may have clients we cannot see
+        if is_fetcher() and (hub.clients or not bus.is_local) and simulations:
+            for name, simulation in list(simulations.items()):
+                tracker = sim_alerts[name]
+                for step in simulation.next_steps(TICK_SECONDS):
+                    for item in step:
+                        # Check for Telemetry Dict (Wind/Kp/Proton)
+                        if isinstance(item, dict):
+                            msg = WSMessage(type="telemetry_update", payload={**item, "simulation": name})
+                        else:
+                            # Send as Flux Data Update (SolarPoint object)
+                            msg = WSMessage(type="data_update", payload={**item.model_dump(), "simulation": name})
+                        await announce(msg)
+                        # STREAMING: the engine remembers previous simulated samples, so
+                        # the slope is real (RAPID_INTENSIFICATION can fire)
+                        hybrid_engine.push(item, stream=simulation.stream)
+                    # ALERTS: once per open/escalate/resolve, not once per tick (alerts.py)
+                    await process_alerts(tracker, tracker.observe(hybrid_engine))
+                    # Compressed scenarios play many steps per tick: let the relay
+                    # and the client writers drain between steps
+                    await asyncio.sleep(0)
+
+                if simulation.done:
+                    await process_alerts(*end_simulation(name))
+
+            # Fast updates for smooth animation (300ms ticks)
+            await asyncio.sleep(TICK_SECONDS)
+            continue
+
+        # Idle until /simulate (or a leadership change) wakes us
+        update_event.clear()
+        try:
+            await asyncio.wait_for(update_event.wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            pass
+
+# --- LIVE NOAA FEEDS (scheduler.py) ---
+# Every feed polls on its own cadence and broadcasts as soon as it lands.
+# telemetry_update always carries the full merged dict (last good values).
+latest_telemetry = dict(DEFAULT_TELEMETRY)
+
+def feeds_active():
+    # Same conditions the old 60s loop had: leader, someone listening, no simulation/replay
+    return is_fetcher() and (bool(hub.clients) or not bus.is_local) and not simulations and not replayer.active
+
+async def on_xray(flux):
+    # dFlux/dt + Thresholds for the new samples (HYBRID LAYER), in the snapshot
+    snapshot = snapshot_store.rebuild()
+    await publish_snapshot(snapshot)
+    if snapshot.latest is not None:
+        msg = WSMessage(type="data_update", payload=snapshot.latest.model_dump())
+        msg_calc = WSMessage(type="calculus_update", payload=snapshot.calculus)
+        await announce(msg, msg_calc)
+        await process_alerts(live_alerts, live_alerts.observe(hybrid_engine))
+
+async def on_history(series):
+    # Telemetry history only feeds connect-time frames
+    snapshot_store.rebuild()
+
+async def on_telemetry(values):
+    latest_telemetry.update(values)
+    await announce(WSMessage(type="telemetry_update", payload=dict(latest_telemetry)))
+    # Live telemetry thresholds (wind/Kp/proton) feed the same alert machine
+    hybrid_engine.push(dict(latest_telemetry), stream="live")
+    await process_alerts(live_alerts, live_alerts.observe(hybrid_engine))
+
+async def on_kp(kp_index):
+    snapshot_store.rebuild()  # _parse_kp also merged the Kp history
+    await on_telemetry({"kp_index": kp_index})
+
+async def on_proton(proton_flux):
+    if proton_flux is not None:
+        await on_telemetry({"proton_flux": proton_flux})
+
+async def on_regions(active_regions):
+    await asyncio.to_thread(archive.write_regions, active_regions)
+    await announce(WSMessage(type="regions_update", payload={"regions": active_regions}))
+
+feed_scheduler = FeedScheduler(gate=feeds_active)
+FEED_HANDLERS = {
+    "xray": on_xray, "plasma": on_telemetry, "proton": on_proton, "kp": on_kp,
+    "wind_history": on_history, "proton_history": on_history, "regions": on_regions,
+}
+archive_tasks = set()  # In-flight archive.sync() calls (strong refs; awaited on shutdown)
+
+def archived(channel, handler):
+    # Broadcast first, then persist in the background (archive.py): the write and
+    # its rollup/counter refresh (or a WAL checkpoint) never delay live frames
+    async def on_result(result):
+        await handler(result)
+        if channel is not None:
+            task = asyncio.create_task(archive.sync(channel, series_store[channel]))
+            archive_tasks.add(task)
+            task.add_done_callback(archive_tasks.discard)
+    return on_result
+
+for name, handler in FEED_HANDLERS.items():
+    feed = FEEDS[name]
+    feed_scheduler.add(FeedJob(
+        name, lambda name=name: fetch_feed(name), archived(feed.get("channel"), handler),
+        interval=feed["interval"], jitter=feed["jitter"],
+        # Attempts get a little more than the HTTP timeout
+        timeout=feed["timeout"] + 1.0,
+    ))
 
 @app.on_event("startup")
 async def startup_event():
+    # Warm the shared NOAA client before the first heartbeat uses it
+    await start_http_client()
+    # Subscribe before anything can be published
+    asyncio.create_task(relay_broadcasts(await bus.subscribe("broadcast")))
+    # Every worker listens; is_fetcher() decides who acts (leadership can move)
+    asyncio.create_task(consume_simulations(await bus.subscribe("simulate")))
+    asyncio.create_task(consume_snapshots(await bus.subscribe("snapshot")))
+    asyncio.create_task(consume_replays(await bus.subscribe("replay")))
+    if elector is not None:
+        elector.start()
+    await asyncio.to_thread(live_alerts.load)
+    # Warm start: serve the first clients from the archive, not from NOAA
+    warmed = await asyncio.to_thread(archive.warm, series_store, HISTORY_WINDOW_SECONDS)
+    if len(series_store["flux"]):
+        await publish_snapshot(snapshot_store.rebuild())
+        print(f"Warm start: {warmed} archived samples loaded")
+    asyncio.create_task(republish_snapshots())
+    feed_scheduler.start()
+    await mailer.start()
     asyncio.create_task(heartbeat())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await feed_scheduler.stop()
+    # Let the last polls reach the archive (sync() never raises)
+    await asyncio.gather(*archive_tasks)
+    await replayer.stop()
+    await mailer.stop()
+    if elector is not None:
+        await elector.stop()  # Hand over now instead of after the lease TTL
+    await close_http_client()
+    await bus.close()
+
+class SimulationComponent(BaseModel):
+    kind: str = "flare"  # "flare", "cme" (wind + Kp), "wind", "kp", "proton"
+    level: Optional[str] = None  # Flare class ("C", "M", "X") when no peak is given
+    peak: Optional[float] = None  # Peak value (W/m², km/s, Kp, pfu)
+    start: int = 0  # Seconds into the simulation
+    duration: Optional[int] = None  # Default: the whole simulation
+    noise: Optional[float] = None  # Relative noise (default 5% on flux, none on telemetry)
+
 class SimulationRequest(BaseModel):
-    type: str  # "M", "X" (for Flux) OR "wind", "kp", "proton" (for Metrics)
-    duration: int
+    # type and duration are required, except with a scenario/spec (and components replace type)
+    type: Optional[str] = None  # "M", "X" (for Flux) OR "wind", "kp", "proton" (for Metrics)
+    duration: Optional[int] = None
     event_type: str = "flux" # "flux", "wind", "kp", "proton"
+    name: Optional[str] = None  # Concurrent simulations need distinct names
+    seed: Optional[int] = None  # Same seed + components = same samples (random if omitted)
+    components: Optional[List[SimulationComponent]] = None  # Overlays; replaces type/event_type
+    scenario: Optional[str] = None  # Bundled scenario (GET /api/scenarios)...
+    spec: Optional[dict] = None  # ...or an inline one (scenarios/*.json format); duration is then optional
+    compression: Optional[float] = Field(None, gt=0)  # Scenario seconds per wall second
+
+    @model_validator(mode="after")
+    def check_required(self):
+        if self.scenario or self.spec:
+            return self
+        missing = [field for field in ("type", "duration")
+                   if getattr(self, field) is None and not (field == "type" and self.components)]
+        if missing:
+            raise ValueError(f"{' and '.join(missing)} required without a scenario or spec")
+        return self
 
 @app.post("/simulate")
 async def trigger_simulation(req: SimulationRequest):
-    global is_simulating, simulation_queue, update_event
-
-    # Generate the fake points (Flux Objects OR Telemetry Dicts)
-    points = generate_flare(req.type, req.duration, req.event_type)
-
-    # Add to queue
-    simulation_queue.extend(points)
-    is_simulating = True
-    
-    # WAKE UP THE LOOP INSTANTLY!
-    update_event.set()
-
-    return {"status": "started", "points": len(points)}
+    # The fetcher process generates the fake points (Flux Objects OR Telemetry
+    # Dicts) and drives the simulation, whichever worker received the request
+    if req.scenario or req.spec:
+        # Bundled names only: a path here would read any file on the server
+        if req.scenario and not req.spec and req.scenario not in await asyncio.to_thread(list_scenarios):
+            raise HTTPException(status_code=404, detail=f"Unknown scenario: {req.scenario}")
+        try:
+            spec = req.spec or await asyncio.to_thread(load_scenario, req.scenario)
+            simulation = compile_scenario(spec, req.name, req.seed, req.compression)  # Validates; lazy
+        except (ValueError, OSError, RuntimeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        seed = simulation.seed if simulation.seed is not None else secrets.randbelow(2 ** 32)
+        await bus.publish("simulate", {
+            "name": simulation.name, "seed": seed, "scenario": spec, "compression": req.compression,
+        })
+        return {"status": "started", "points": simulation.steps, "name": simulation.name, "seed": seed,
+                "duration": simulation.duration, "compression": simulation.compression}
+
+    name = req.name or "default"
+    if req.components:
+        components = [component.model_dump() for component in req.components]
+    elif req.event_type in EVENT_COMPONENTS:
+        components = [{"kind": EVENT_COMPONENTS[req.event_type], "level": req.type}]
+    else:
+        return {"status": "started", "points": 0}
+    try:
+        build_components(components, req.duration)  # Reject bad kinds here, not on the fetcher
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    seed = req.seed if req.seed is not None else secrets.randbelow(2 ** 32)
+    await bus.publish("simulate", {
+        "name": name, "duration": max(req.duration, 0), "seed": seed, "components": components,
+    })
+
+    return {"status": "started", "points": max(req.duration, 0), "name": name, "seed": seed}
+
+@app.get("/api/scenarios")
+async def get_scenarios():
+    return {"scenarios": await asyncio.to_thread(list_scenarios)}
+
+@app.get("/api/simulations")
+async def list_simulations():
+    # This worker's sessions (only the fetcher runs them)
+    return {"simulations": [simulation.get_stats() for simulation in simulations.values()]}
+
+@app.delete("/api/simulations/{name}")
+async def stop_simulation(name: str):
+    await bus.publish("simulate", {"action": "stop", "name": name})
+    return {"status": "stopped", "name": name}
+
+class ReplayRequest(BaseModel):
+    event: Optional[str] = None  # A bundled storm (GET /api/replay/events)...
+    t_from: Optional[int] = Field(None, alias="from")  # ...or an archived range (epoch seconds)
+    t_to: Optional[int] = Field(None, alias="to")
+    speed: float = Field(60.0, ge=MIN_SPEED, le=MAX_SPEED)  # Dataset seconds per second
+    send_emails: bool = False  # Alert emails to real subscribers (load tests of the mailer)
+
+@app.get("/api/replay/events")
+async def list_replay_events():
+    return {"events": [{"id": name, **event} for name, event in EVENTS.items()]}
+
+@app.get("/api/replay")
+async def replay_status():
+    # This worker's replay (only the fetcher runs them)
+    return replayer.get_stats()
+
+@app.post("/api/replay")
+async def start_replay(req: ReplayRequest):
+    # Like /simulate: whichever worker receives it, the fetcher plays it
+    if req.event is not None:
+        if req.event not in EVENTS:
+            raise HTTPException(status_code=404, detail=f"Unknown event: {req.event}")
+    elif req.t_from is None or req.t_to is None or req.t_to <= req.t_from:
+        raise HTTPException(status_code=400, detail="Give an event, or from < to")
+    await bus.publish("replay", {
+        "action": "start", "event": req.event, "from": req.t_from, "to": req.t_to,
+        "speed": req.speed, "send_emails": req.send_emails,
+    })
+    return {"status": "started", "event": req.event, "speed": req.speed}
+
+@app.delete("/api/replay")
+async def stop_replay():
+    await bus.publish("replay", {"action": "stop"})
+    return {"status": "stopped"}
 
 # --- AUTH ENDPOINTS ---
 
@@ -305,3 +846,8 @@ async def get_current_user(request: Request):
         return {"user": user}
     # Legacy string format (email only)
     return {"user": {"id": 0, "email": user}}
+
+if __name__ == "__main__":
+    import uvicorn
+    # permessage-deflate compresses every frame (history payloads shrink ~10x)
+    uvicorn.run("app:app", host="127.0.0.1", port=8000, ws_per_message_deflate=True)
@@ -0,0 +1,421 @@
+"""
+Time-Series Archive - Every ingested sample, kept beyond NOAA's rolling window.
+
+The in-memory RingSeries only hold what the NOAA feeds still publish (3-7
+days). The archive stores every flux / wind / Kp / proton sample and every
+observed sunspot region in the app database (models.SeriesSample,
+models.RegionObservation; SQLite runs in WAL mode so writes never block API
+reads), upserting by timestamp so NOAA corrections overwrite older values.
+
+- sync(): after each feed poll, writes what is new in the series (plus the
+  ingest backfill horizon, for corrections). One executemany per feed.
+- warm(): at startup, reloads the recent window into series_store, so the
+  first /ws client is served from disk instead of waiting on NOAA.
+- query(): any time range, months back (for the series/statistics APIs).
+- rollups: min/max/sum/count per 1m, 5m, 1h and 1d bucket (series_rollups)
+  and hourly/daily event counters (series_stats: flares per class, Kp
+  histogram), recomputed for just the buckets each write touched, so long
+  ranges and statistics read O(buckets) rows instead of raw samples. A
+  write only re-reads its own raw samples (plus a flare's rise and decay):
+  coarser buckets are aggregated from finer ones, days from hours.
+
+ARCHIVE_RETENTION_DAYS (default 0 = keep everything) prunes older samples.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+from sqlalchemy import delete, func, select
+from ingest import classify_flux_array
+from models import engine, SessionLocal, SeriesSample, SeriesRollup, SeriesStat, RegionObservation
+from timeseries import to_float_list
+
+HOUR, DAY = 3600, 86400
+
+# Bucket widths kept in series_rollups
+ROLLUP_RESOLUTIONS = {"1m": 60, "5m": 300, "1h": 3600, "1d": DAY}
+
+# Bucket widths kept in series_stats
+STAT_RESOLUTIONS = {"1h": HOUR, "1d": DAY}
+
+FLARE_NAMES = {"C": "flare_C", "M": "flare_M", "X": "flare_X"}
+
+# Flare events, after the NOAA SWPC GOES X-ray event definition: the start is
+# the first of FLARE_RISE_SAMPLES minutes of monotonic increase whose last
+# flux is >= FLARE_RISE_RATIO x the first; the end is when the flux has
+# decayed halfway back from the peak to the start level. Jitter around a
+# class threshold is neither a start nor an end. Counted from a C1 peak up,
+# when they last at least FLARE_MIN_SECONDS.
+FLARE_RISE_SAMPLES = 4
+FLARE_RISE_RATIO = 1.4
+FLARE_MIN_SECONDS = 600
+FLARE_MAX_SECONDS = 12 * 3600  # Search horizon for the end (long-duration events)
+
+
+def flare_events(times, values):
+    """
+    [(start, peak, end)] sample indexes of the flares in 1-minute flux
+    columns, oldest first; end is None while the flare is still decaying
+    at the last sample. Any peak level (filter by class afterwards).
+    """
+    n, k = len(values), FLARE_RISE_SAMPLES
+    if n < k:
+        return []
+    rising = values[1:] > values[:-1]
+    starts = values[k - 1:] >= FLARE_RISE_RATIO * values[:n - k + 1]
+    for step in range(k - 1):
+        starts &= rising[step:step + n - k + 1]
+
+    events, resume = [], 0
+    for s in np.flatnonzero(starts).tolist():
+        if s < resume:
+            continue  # Still inside the previous event
+        horizon = int(np.searchsorted(times, times[s] + FLARE_MAX_SECONDS, side="right"))
+        tail = values[s:horizon]
+        peaks = np.maximum.accumulate(tail)
+        decayed = np.flatnonzero(tail[k:] <= (peaks[k:] + tail[0]) / 2)
+        if len(decayed):
+            end = s + k + int(decayed[0])
+        else:
+            end = None if horizon >= n else horizon - 1
+        peak = s + int(np.argmax(values[s:(n if end is None else end + 1)]))
+        events.append((s, peak, end))
+        resume = n if end is None else end
+    return events
+
+
+def channel_events(channel, times, values):
+    """
+    [(start, end or None, key)] epoch seconds of the counted events, for the
+    channels with events (None for the others):
+    - flux: flares per class (flare_events), classed by their peak. A flare
+      still decaying (end None) counts once it has lasted FLARE_MIN_SECONDS,
+      with its peak so far.
+    - kp: every reading in its integer bin (kp_0 .. kp_9), a histogram.
+    """
+    if channel == "flux":
+        events = []
+        for s, peak, end in flare_events(times, values):
+            level = str(classify_flux_array(values[peak]))
+            duration = times[-1 if end is None else end] - times[s]
+            if level in FLARE_NAMES and duration >= FLARE_MIN_SECONDS:
+                events.append((int(times[s]), None if end is None else int(times[end]), FLARE_NAMES[level]))
+        return events
+    if channel == "kp":
+        return [(t, t, f"kp_{min(int(kp), 9)}") for t, kp in zip(times.tolist(), values.tolist())]
+    return None
+
+
+def event_counters(events, resolution=HOUR):
+    """{(bucket start, key): count}: each event in the bucket of its start."""
+    counters = {}
+    for start, _, key in events:
+        bucket = (start // resolution * resolution, key)
+        counters[bucket] = counters.get(bucket, 0) + 1
+    return counters
+
+
+def _buckets(times, mins, maxs, sums, counts):
+    # Rows sharing a bucket start (sorted) -> one (t, min, max, sum, count) row each
+    starts = np.flatnonzero(np.append(True, times[1:] != times[:-1]))
+    return (times[starts], np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts),
+            np.add.reduceat(sums, starts), np.add.reduceat(counts, starts))
+
+
+def _upsert(table, rows, keys, update_columns):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE, batched (SQLite / PostgreSQL)."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={column: stmt.excluded[column] for column in update_columns}
+    )
+    with engine.begin() as conn:
+        conn.execute(stmt, rows)
+
+
+class SeriesArchive:
+    def __init__(self, backfill_seconds=1800, retention_days=0):
+        self.backfill_seconds = backfill_seconds  # Same horizon as FluxIngester
+        self.retention_days = retention_days
+        self.archived_until = {}  # channel -> newest archived epoch second
+        self._last_prune = 0.0
+        self._sync_locks = {}  # channel -> asyncio.Lock: one write in flight per channel
+        self.stats = {"writes": 0, "rows_written": 0, "write_seconds": 0.0,
+                      "warm_rows": 0, "regions_written": 0, "pruned": 0, "errors": 0}
+
+    # --- WRITE PATH ---
+
+    def pending(self, channel, series):
+        """
+        Copies the samples not yet archived (plus the backfill horizon) out of
+        the live series. Call on the event loop: the series may change later.
+        """
+        last = self.archived_until.get(channel)
+        t_from = None if last is None else last - self.backfill_seconds
+        times, values = series.slice(t_from, None)
+        # float32 channels via their shortest repr: Kp 4.08 is stored as 4.08, not 4.0799999
+        return times.copy(), np.array(to_float_list(values), dtype=np.float64)
+
+    def write(self, channel, times, values):
+        """Upserts (times, values) for one channel. Blocking."""
+        if len(times) == 0:
+            return 0
+        started = time.perf_counter()
+        rows = [{"channel": channel, "t": t, "value": v}
+                for t, v in zip(times.tolist(), values.tolist())]
+        _upsert(SeriesSample.__table__, rows, ["channel", "t"], ["value"])
+        self.refresh_rollups(channel, int(times[0]), int(times[-1]))
+        self.archived_until[channel] = max(self.archived_until.get(channel) or 0, int(times[-1]))
+        self.stats["writes"] += 1
+        self.stats["rows_written"] += len(rows)
+        self.stats["write_seconds"] += time.perf_counter() - started
+        return len(rows)
+
+    async def sync(self, channel, series):
+        """
+        Archives a channel after a feed poll (the DB write runs in a thread).
+        Concurrent syncs of one channel queue up, so each starts from the
+        archived_until of the one before it.
+        """
+        async with self._sync_locks.setdefault(channel, asyncio.Lock()):
+            times, values = self.pending(channel, series)
+            try:
+                await asyncio.to_thread(self.write, channel, times, values)
+                if self.retention_days and time.monotonic() - self._last_prune > 3600:
+                    await asyncio.to_thread(self.prune)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[WARN] Archive write failed ({channel}): {e}")
+
+    def refresh_rollups(self, channel, t_from=None, t_to=None):
+        """
+        Recomputes the rollup buckets and event counters touched by samples
+        in [t_from, t_to] (so corrections are reflected too). Without a
+        range, rebuilds the whole channel. Blocking.
+        Reads stay proportional to the range: 1m buckets come from its raw
+        samples, each coarser resolution from the one below, daily counters
+        from the hourly ones.
+        """
+        rows = self._refresh_buckets(channel, t_from, t_to)
+        self._refresh_stats(channel, t_from, t_to)
+        return rows
+
+    def _refresh_buckets(self, channel, t_from, t_to):
+        written = 0
+        finer = None
+        for resolution in sorted(ROLLUP_RESOLUTIONS.values()):
+            lo = None if t_from is None else t_from // resolution * resolution
+            hi = None if t_to is None else t_to // resolution * resolution + resolution - 1
+            if finer is None:
+                times, values = self.query(channel, lo, hi)
+                columns = (times // resolution * resolution, values, values, values, np.ones(len(times), np.int64))
+            else:
+                times, mins, maxs, sums, counts = self._query_buckets(channel, finer, lo, hi)
+                columns = (times // resolution * resolution, mins, maxs, sums, counts)
+            if len(columns[0]) == 0:
+                return written
+            rows = [
+                {"channel": channel, "resolution": resolution, "t": t, "min": low, "max": high, "sum": total, "count": count}
+                for t, low, high, total, count in zip(*(column.tolist() for column in _buckets(*columns)))
+            ]
+            _upsert(SeriesRollup.__table__, rows, ["channel", "resolution", "t"], ["min", "max", "sum", "count"])
+            written += len(rows)
+            finer = resolution
+        return written
+
+    def _query_buckets(self, channel, resolution, t_from=None, t_to=None):
+        # (t, min, max, sum, count) columns of one rollup resolution
+        table = SeriesRollup
+        stmt = select(table.t, table.min, table.max, table.sum, table.count).where(
+            table.channel == channel, table.resolution == resolution
+        )
+        if t_from is not None:
+            stmt = stmt.where(table.t >= t_from)
+        if t_to is not None:
+            stmt = stmt.where(table.t <= t_to)
+        with engine.connect() as conn:
+            rows = conn.execute(stmt.order_by(table.t)).all()
+        columns = list(zip(*rows)) or [(), (), (), (), ()]
+        return (np.array(columns[0], dtype=np.int64), np.array(columns[1], dtype=np.float64),
+                np.array(columns[2], dtype=np.float64), np.array(columns[3], dtype=np.float64),
+                np.array(columns[4], dtype=np.int64))
+
+    def _refresh_stats(self, channel, t_from, t_to):
+        if channel not in ("flux", "kp"):
+            return
+        # Flares need context: the rise before the range, the decay after it
+        context = FLARE_MAX_SECONDS if channel == "flux" else 0
+        lo = None if t_from is None else t_from // HOUR * HOUR
+        hi = None if t_to is None else t_to // HOUR * HOUR + HOUR - 1
+        times, values = self.query(channel, None if lo is None else lo - context,
+                                   None if hi is None else hi + context)
+        events = channel_events(channel, times, values)
+        if lo is not None:
+            # A flare that started before the range and is still running (or
+            # ended inside it) is recounted in its start hour, with its final peak
+            lo = min([lo] + [start // HOUR * HOUR for start, end, _ in events
+                             if start < lo and (end is None or end >= t_from)])
+        hourly = {bucket: count for bucket, count in event_counters(events, HOUR).items()
+                  if (lo is None or bucket[0] >= lo) and (hi is None or bucket[0] <= hi)}
+        self._replace_stats(channel, HOUR, hourly, lo, hi)
+
+        # Days touched: the sum of their hourly counters
+        day_lo = None if lo is None else lo // DAY * DAY
+        day_hi = None if hi is None else hi // DAY * DAY + DAY - 1
+        stmt = select(SeriesStat.t, SeriesStat.key, SeriesStat.count).where(
+            SeriesStat.channel == channel, SeriesStat.resolution == HOUR
+        )
+        if day_lo is not None:
+            stmt = stmt.where(SeriesStat.t >= day_lo, SeriesStat.t <= day_hi)
+        daily = {}
+        with engine.connect() as conn:
+            for t, key, count in conn.execute(stmt):
+                bucket = (t // DAY * DAY, key)
+                daily[bucket] = daily.get(bucket, 0) + count
+        self._replace_stats(channel, DAY, daily, day_lo, day_hi)
+
+    def _replace_stats(self, channel, resolution, counters, t_from, t_to):
+        # Delete + insert: a corrected sample can make a counter disappear
+        rows = [
+            {"channel": channel, "resolution": resolution, "t": t, "key": key, "count": count}
+            for (t, key), count in counters.items()
+        ]
+        with engine.begin() as conn:
+            stmt = delete(SeriesStat).where(SeriesStat.channel == channel, SeriesStat.resolution == resolution)
+            if t_from is not None:
+                stmt = stmt.where(SeriesStat.t >= t_from, SeriesStat.t <= t_to)
+            conn.execute(stmt)
+            if rows:
+                conn.execute(SeriesStat.__table__.insert(), rows)
+
+    def write_regions(self, regions):
+        """Upserts one regions poll, keyed by (observed_date, region_number). Blocking."""
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        rows = {}
+        for region in regions:
+            key = (region.get("observed_date") or today, int(region["region_number"]))
+            rows[key] = {
+                "observed_date": key[0], "region_number": key[1],
+                "latitude": region.get("latitude"), "longitude": region.get("longitude"),
+                "class_type": region.get("class_type"),
+            }
+        if not rows:
+            return 0
+        try:
+            _upsert(RegionObservation.__table__, list(rows.values()),
+                    ["observed_date", "region_number"], ["latitude", "longitude", "class_type"])
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"[WARN] Archive write failed (regions): {e}")
+            return 0
+        self.stats["regions_written"] += len(rows)
+        return len(rows)
+
+    def prune(self):
+        cutoff = int(time.time()) - int(self.retention_days * 86400)
+        with engine.begin() as conn:
+            result = conn.execute(delete(SeriesSample).where(SeriesSample.t < cutoff))
+            conn.execute(delete(SeriesRollup).where(SeriesRollup.t < cutoff))
+            conn.execute(delete(SeriesStat).where(SeriesStat.t < cutoff))
+        self._last_prune = time.monotonic()
+        self.stats["pruned"] += result.rowcount or 0
+
+    # --- READ PATH ---
+
+    def query(self, channel, t_from=None, t_to=None):
+        """(times int64, values float64) for t_from <= t <= t_to, oldest first. Blocking."""
+        stmt = select(SeriesSample.t, SeriesSample.value).where(SeriesSample.channel == channel)
+        if t_from is not None:
+            stmt = stmt.where(SeriesSample.t >= t_from)
+        if t_to is not None:
+            stmt = stmt.where(SeriesSample.t <= t_to)
+        with engine.connect() as conn:
+            rows = conn.execute(stmt.order_by(SeriesSample.t)).all()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        times, values = zip(*rows)
+        return np.array(times, dtype=np.int64), np.array(values, dtype=np.float64)
+
+    def query_rollup(self, channel, resolution, t_from=None, t_to=None):
+        """
+        (times, mean, min, max, count) columns of one rollup resolution (seconds)
+        for buckets starting in [t_from, t_to]. Blocking.
+        """
+        table = SeriesRollup
+        stmt = select(table.t, table.sum / table.count, table.min, table.max, table.count).where(
+            table.channel == channel, table.resolution == resolution
+        )
+        if t_from is not None:
+            stmt = stmt.where(table.t >= t_from // resolution * resolution)
+        if t_to is not None:
+            stmt = stmt.where(table.t <= t_to)
+        with engine.connect() as conn:
+            rows = conn.execute(stmt.order_by(table.t)).all()
+        if not rows:
+            empty = np.empty(0, dtype=np.float64)
+            return np.empty(0, dtype=np.int64), empty, empty, empty, np.empty(0, dtype=np.int64)
+        times, means, mins, maxs, counts = zip(*rows)
+        return (np.array(times, dtype=np.int64), np.array(means, dtype=np.float64),
+                np.array(mins, dtype=np.float64), np.array(maxs, dtype=np.float64),
+                np.array(counts, dtype=np.int64))
+
+    def has_rollups(self, channel):
+        # The daily rollup is the newest addition: its absence means "rebuild"
+        with engine.connect() as conn:
+            return conn.execute(
+                select(SeriesRollup.t).where(SeriesRollup.channel == channel, SeriesRollup.resolution == DAY).limit(1)
+            ).first() is not None
+
+    def query_stats(self, channel, resolution, t_from=None, t_to=None):
+        """{bucket start: {key: count}} of series_stats. Blocking."""
+        stmt = select(SeriesStat.t, SeriesStat.key, SeriesStat.count).where(
+            SeriesStat.channel == channel, SeriesStat.resolution == resolution
+        )
+        if t_from is not None:
+            stmt = stmt.where(SeriesStat.t >= t_from // resolution * resolution)
+        if t_to is not None:
+            stmt = stmt.where(SeriesStat.t <= t_to)
+        counters = {}
+        with engine.connect() as conn:
+            for t, key, count in conn.execute(stmt):
+                counters.setdefault(t, {})[key] = count
+        return counters
+
+    def newest(self, channel):
+        session = SessionLocal()
+        try:
+            return session.query(func.max(SeriesSample.t)).filter(SeriesSample.channel == channel).scalar()
+        finally:
+            session.close()
+
+    def warm(self, store, windows):
+        """
+        Loads the last `windows[channel]` seconds of each channel into the
+        series store (startup). Returns the number of samples loaded. Blocking.
+        """
+        loaded = 0
+        for channel, window in windows.items():
+            newest = self.newest(channel)
+            if newest is None:
+                continue
+            if not self.has_rollups(channel):
+                self.refresh_rollups(channel)  # Archive written before rollups existed
+            times, values = self.query(channel, newest - window, None)
+            store[channel].merge(times, values.astype(store[channel].values.dtype))
+            self.archived_until[channel] = int(newest)
+            loaded += len(times)
+        self.stats["warm_rows"] += loaded
+        return loaded
+
+    def get_stats(self):
+        return {**self.stats, "archived_until": dict(self.archived_until),
+                "retention_days": self.retention_days}
+
+
+archive = SeriesArchive(retention_days=float(os.getenv("ARCHIVE_RETENTION_DAYS", "0")))
@@ -0,0 +1,225 @@
+"""
+Broadcast Hub - Concurrent, backpressure-aware WebSocket fan-out.
+
+Every client gets a bounded outbound queue drained by its own writer task, so
+publishing never awaits a socket: one slow dashboard can no longer stall the
+heartbeat (or the 300ms simulation tick) for everybody else.
+
+Slow consumers are handled by policy:
+- "drop_oldest": a full queue drops its oldest pending frame.
+- "coalesce": a pending frame of a latest-value type (calculus, telemetry,
+  regions) is replaced in place by the newer one; if the queue is still full
+  the oldest frame is dropped.
+A client that falls more than `max_lag` frames behind (or whose socket write
+times out) is disconnected; the browser reconnects and gets a fresh snapshot.
+
+Resume: every published message carries a sequence number (`seq`), and the
+hub keeps a replay buffer of recent data_update/telemetry_update frames. A
+client reconnecting with /ws?stream=<stream_id>&since_seq=N (or since=<time>)
+gets only what it missed, plus the newest calculus/regions frames, instead
+of the full 3-day history. If the gap is older than the buffer, or the stream
+id belongs to a previous server process, it gets the full snapshot instead.
+
+stamp=True (HELIOS_STAMP_FRAMES=1, used by loadtest.py) adds the publish time
+(epoch seconds) to every payload as "sent_at", so clients can measure fan-out
+latency. Off by default: it costs bytes on every frame.
+"""
+
+import asyncio
+import secrets
+import time
+from collections import deque
+from wire import encode_message
+
+# Message types where only the newest value matters to a lagging client
+COALESCE_TYPES = {"calculus_update", "telemetry_update", "regions_update"}
+
+# Series frames kept for reconnect replay; other types only keep their latest
+REPLAY_TYPES = {"data_update", "telemetry_update"}
+
+
+class ClientChannel:
+    """One connected WebSocket: its pending frames and its writer task."""
+
+    def __init__(self, hub, websocket):
+        self.hub = hub
+        self.websocket = websocket
+        self.pending = deque()  # [key, frame, droppable]
+        self.wakeup = asyncio.Event()
+        self.lag = 0  # Frames dropped since the last successful write
+        self.closed = False
+        self.task = None
+
+    def enqueue(self, key, frame, droppable=True):
+        if self.closed:
+            return
+
+        if droppable and self.hub.policy == "coalesce" and key in COALESCE_TYPES:
+            for item in self.pending:
+                if item[0] == key and item[2]:
+                    item[1] = frame
+                    self.hub.stats["coalesced"] += 1
+                    return
+
+        if droppable and len(self.pending) >= self.hub.max_queue:
+            if not self._drop_oldest():
+                return
+        self.pending.append([key, frame, droppable])
+        self.wakeup.set()
+
+    def _drop_oldest(self):
+        for index, item in enumerate(self.pending):
+            if item[2]:
+                del self.pending[index]
+                self.hub.stats["dropped"] += 1
+                self.lag += 1
+                if self.lag > self.hub.max_lag:
+                    self.hub.stats["lag_disconnects"] += 1
+                    self.close()
+                    return False
+                return True
+        return True  # Only pinned (connect-time) frames pending; let it grow
+
+    async def writer(self):
+        try:
+            while not self.closed:
+                if not self.pending:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                _, frame, _ = self.pending.popleft()
+                # bytes = binary frame (msgpack history), str = JSON text
+                send = self.websocket.send_bytes if isinstance(frame, bytes) else self.websocket.send_text
+                await asyncio.wait_for(send(frame), self.hub.send_timeout)
+                self.lag = 0
+                self.hub.stats["sent"] += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Dead socket or write timeout
+            self.hub.stats["send_failures"] += 1
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.clear()
+        self.wakeup.set()
+        self.hub.clients.discard(self)
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            # 1013 = Try Again Later (the client reconnects and resyncs)
+            await self.websocket.close(code=1013)
+        except Exception:
+            pass
+
+
+class BroadcastHub:
+    def __init__(self, max_queue=64, max_lag=256, send_timeout=10.0, policy="coalesce",
+                 replay_size=2048, stamp=False):
+        self.max_queue = max_queue
+        self.stamp = stamp
+        self.max_lag = max_lag
+        self.send_timeout = send_timeout
+        self.policy = policy  # "coalesce" or "drop_oldest"
+        self.clients = set()
+        self.stats = {
+            "published": 0, "sent": 0, "coalesced": 0, "dropped": 0,
+            "lag_disconnects": 0, "send_failures": 0,
+            "resumed": 0, "replayed_frames": 0, "resume_misses": 0,
+        }
+
+        # --- RESUME STATE ---
+        self.stream_id = secrets.token_hex(4)  # Changes per process: seqs restart at 0
+        self.seq = 0
+        self.replay = deque(maxlen=replay_size)  # (seq, published_at, type, frame)
+        self.latest = {}  # type -> (seq, frame) for non-replay types
+        self.evicted_seq = 0  # Newest seq that fell out of the replay buffer
+        self.evicted_at = 0.0  # ...and its publish time
+
+    def __len__(self):
+        return len(self.clients)
+
+    def connect(self, websocket, initial_frames=()):
+        """
+        Registers an accepted WebSocket. initial_frames (sync + snapshot or
+        replay) are queued first and are never dropped or coalesced.
+        Synchronous on purpose: frames published after resume_frames() and
+        before connect() cannot slip through the gap.
+        """
+        client = ClientChannel(self, websocket)
+        for frame in initial_frames:
+            client.enqueue("initial", frame, droppable=False)
+        client.task = asyncio.create_task(client.writer())
+        self.clients.add(client)
+        return client
+
+    def disconnect(self, client):
+        client.close()
+        if client.task is not None:
+            client.task.cancel()
+
+    def publish(self, *messages):
+        """
+        Stamps each message with the next sequence number, encodes it once and
+        queues the frame for every client (and for reconnect replay).
+        """
+        frames = []
+        now = time.time()
+        for msg in messages:
+            self.seq += 1
+            msg.seq = self.seq
+            if self.stamp:
+                msg.payload = {**msg.payload, "sent_at": now}
+            frame = encode_message(msg)
+            frames.append((msg.type, frame))
+            if msg.type in REPLAY_TYPES:
+                if len(self.replay) == self.replay.maxlen:
+                    self.evicted_seq, self.evicted_at = self.replay[0][0], self.replay[0][1]
+                self.replay.append((self.seq, now, msg.type, frame))
+            else:
+                self.latest[msg.type] = (self.seq, frame)
+
+        self.stats["published"] += len(frames)
+        for client in list(self.clients):
+            for key, frame in frames:
+                client.enqueue(key, frame)
+
+    def resume_frames(self, stream_id, since_seq=None, since_time=None):
+        """
+        Frames a reconnecting client missed, or None when the gap cannot be
+        replayed (unknown stream, or older than the replay buffer).
+        since_time: epoch seconds (server publish time).
+        """
+        if stream_id != self.stream_id or (since_seq is None and since_time is None):
+            self.stats["resume_misses"] += 1
+            return None
+        if since_seq is None:
+            if since_time < self.evicted_at:
+                self.stats["resume_misses"] += 1
+                return None
+            since_seq = next((seq - 1 for seq, at, _, _ in self.replay if at > since_time), self.seq)
+        if since_seq > self.seq:
+            self.stats["resume_misses"] += 1
+            return None
+        # The buffer must still hold every replay frame after since_seq
+        if since_seq < self.evicted_seq:
+            self.stats["resume_misses"] += 1
+            return None
+
+        missed = [(seq, frame) for seq, _, _, frame in self.replay if seq > since_seq]
+        missed += [(seq, frame) for seq, frame in self.latest.values() if seq > since_seq]
+        missed.sort(key=lambda item: item[0])
+        self.stats["resumed"] += 1
+        self.stats["replayed_frames"] += len(missed)
+        return [frame for _, frame in missed]
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["clients"] = len(self.clients)
+        stats["queued"] = sum(len(client.pending) for client in self.clients)
+        return stats
@@ -15,7 +15,8 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 from pathlib import Path
-from models import get_db, save_otp_to_user, verify_otp, log_user_login, User
+from models import get_db, save_otp_to_user, verify_otp, log_user_login, User, AlertPreference
+from subscribers import THREAT_TYPES, DEFAULT_MIN_SEVERITY
 
 # Load environment variables from .env file
 env_path = Path(__file__).resolve().parent.parent / '.env'
@@ -40,6 +41,13 @@ class OTPVerifyRequest(BaseModel):
     otp_code: str
 
 
+class AlertPreferenceRequest(BaseModel):
+    """Schema for one alert preference (per threat type)."""
+    threat_type: str  # "flux", "wind", "kp", "proton"
+    min_severity: int = DEFAULT_MIN_SEVERITY  # 1 (watch) .. 5 (extreme)
+    enabled: bool = True
+
+
 # ============ EMAIL CONFIGURATION ============
 
 GMAIL_SMTP_SERVER = "smtp.gmail.com"
@@ -240,25 +248,84 @@ def verify_otp_endpoint(request: OTPVerifyRequest, req: Request, db: Session = D
         'email': user.email
     }
 
-def send_alert_email(email: str, alert_data: dict) -> dict:
+def _session_user_id(req: Request) -> int:
+    """The logged-in Brownie user's id, or 401."""
+    user_id = req.session.get('user_id')
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Not authenticated'
+        )
+    return user_id
+
+
+def _preference_dict(pref: AlertPreference) -> dict:
+    return {
+        'threat_type': pref.threat_type,
+        'min_severity': pref.min_severity,
+        'enabled': pref.enabled
+    }
+
+
+@router.get("/alert-preferences")
+def get_alert_preferences(req: Request, db: Session = Depends(get_db)):
     """
-    Send Threat Alert via Gmail SMTP.
+    List the session user's alert preferences.
+    Threat types without a preference receive alerts of severity
+    default_min_severity and above.
     """
-    if not EMAIL_USER or not EMAIL_PASS:
-        print(f"DEBUG: Alert to {email} skipped (Console Mode)")
-        return {'success': False, 'message': 'No SMTP config'}
+    user_id = _session_user_id(req)
+    prefs = db.query(AlertPreference).filter(AlertPreference.user_id == user_id).all()
+    return {
+        'threat_types': list(THREAT_TYPES),
+        'default_min_severity': DEFAULT_MIN_SEVERITY,
+        'preferences': [_preference_dict(pref) for pref in prefs]
+    }
 
-    try:
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(GMAIL_SMTP_SERVER, GMAIL_SMTP_PORT, context=context) as server:
-            server.login(EMAIL_USER, EMAIL_PASS)
 
-            msg = MIMEMultipart()
-            msg['From'] = EMAIL_USER
-            msg['To'] = email
-            msg['Subject'] = f"⚠ HELIOS ALERT: {alert_data.get('status', 'Threat Detected')}"
+@router.put("/alert-preferences")
+def set_alert_preference(request: AlertPreferenceRequest, req: Request, db: Session = Depends(get_db)):
+    """
+    Create or update the session user's preference for one threat type.
+    """
+    user_id = _session_user_id(req)
+
+    if request.threat_type not in THREAT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Unknown threat type. Expected one of: {", ".join(THREAT_TYPES)}'
+        )
+    if not 1 <= request.min_severity <= 5:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='min_severity must be between 1 and 5'
+        )
+
+    pref = db.query(AlertPreference).filter(
+        AlertPreference.user_id == user_id,
+        AlertPreference.threat_type == request.threat_type
+    ).first()
+    if not pref:
+        pref = AlertPreference(user_id=user_id, threat_type=request.threat_type)
+        db.add(pref)
+
+    pref.min_severity = request.min_severity
+    pref.enabled = request.enabled
+    db.commit()
 
-            body = f"""⚠ SPACE WEATHER ALERT ⚠
+    return {'success': True, 'preference': _preference_dict(pref)}
+
+
+def build_alert_message(email: str, alert_data: dict) -> MIMEMultipart:
+    """
+    Compose the Threat Alert email (shared with the pooled dispatcher in mailer.py).
+    """
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_USER
+    msg['To'] = email
+    msg['Subject'] = f"⚠ HELIOS ALERT: {alert_data.get('status', 'Threat Detected')}"
+
+    body = f"""⚠ SPACE WEATHER ALERT ⚠
 
 Status: {alert_data.get('status', 'Threat Detected')}
 Details: {alert_data.get('details', 'No details provided')}
@@ -268,8 +335,24 @@ Observed Value: {alert_data.get('value_display', 'N/A')}
 
 Please check the Helios Watch Dashboard immediately.
 """
-            msg.attach(MIMEText(body, 'plain'))
-            server.send_message(msg)
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+def send_alert_email(email: str, alert_data: dict) -> dict:
+    """
+    Send Threat Alert via Gmail SMTP (one connection per call).
+    Bulk alerts go through mailer.AlertMailer instead.
+    """
+    if not EMAIL_USER or not EMAIL_PASS:
+        print(f"DEBUG: Alert to {email} skipped (Console Mode)")
+        return {'success': False, 'message': 'No SMTP config'}
+
+    try:
+        context = ssl.create_default_context()
+        with smtplib.SMTP_SSL(GMAIL_SMTP_SERVER, GMAIL_SMTP_PORT, context=context) as server:
+            server.login(EMAIL_USER, EMAIL_PASS)
+            server.send_message(build_alert_message(email, alert_data))
             print(f"✔ Alert sent to {email}")
     
         return {'success': True, 'message': 'Alert sent'}
@@ -1,8 +1,9 @@
 import httpx
 import asyncio
 import json
+from fetcher import NOAA_BASE_URL  # NOAA SWPC, or a stand-in with the same paths
 
-URL = "https://services.swpc.noaa.gov/json/goes/primary/integral-protons-1-day.json"
+URL = f"{NOAA_BASE_URL}/json/goes/primary/integral-protons-1-day.json"
 
 async def check():
     async with httpx.AsyncClient() as client:
@@ -1,4 +1,42 @@
-from datetime import datetime
+from datetime import datetime, timezone
+import math
+import time
+import numpy as np
+
+# Telemetry threat rules, in the same priority order as analyze()
+# "release": the status only clears once the value drops below this (hysteresis)
+TELEMETRY_RULES = [
+    {"channel": "wind", "key": "wind_speed", "status": "FAST_SOLAR_WIND",
+     "enter": 800, "strict": True, "release": 700,
+     "details": "Wind Speed Critical: {value:.1f} km/s", "display": "{value} km/s"},
+    {"channel": "kp", "key": "kp_index", "status": "GEOMAGNETIC_STORM",
+     "enter": 7, "strict": False, "release": 6,
+     "details": "Severe Storm Detected (Kp-{value})", "display": "Kp {value}"},
+    {"channel": "proton", "key": "proton_flux", "status": "RADIATION_STORM",
+     "enter": 100, "strict": False, "release": 80,
+     "details": "High Proton Flux: {value:.1f} pfu", "display": "{value} pfu"},
+]
+
+
+def _epoch(timestamp):
+    # Naive datetimes (simulator uses utcnow) are UTC
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class ChannelState:
+    """Streaming memory for one channel: O(1) per pushed sample."""
+    __slots__ = ("last_time", "last_value", "slope", "ema_slope", "status", "samples")
+
+    def __init__(self):
+        self.last_time = None
+        self.last_value = None
+        self.slope = 0.0
+        self.ema_slope = 0.0
+        self.status = "STABLE"
+        self.samples = 0
+
 
 class HybridEngine:
     def __init__(self):
@@ -9,6 +47,11 @@ class HybridEngine:
         self.M_CLASS_LIMIT = 1e-5
         self.X_CLASS_LIMIT = 1e-4
 
+        # 3. Streaming (push) settings
+        self.EMA_TAU_SECONDS = 120.0  # Time constant of the slope EMA
+        self.HYSTERESIS = 0.8         # Flux status clears below 80% of its entry threshold
+        self.streams = {}             # (stream, channel) -> ChannelState
+
     def calculate_slope(self, points):
         """
         Calculates the rate of change (slope) from the last few points.
@@ -114,3 +157,198 @@ class HybridEngine:
             "value_display": value_display,
             "engine_type": "HYBRID (Calculus + Threshold)"
         }
+
+    # --- C. BATCH MODE (whole windows, vectorized) ---
+
+    def analyze_batch(self, timestamps, flux, smoothing_window=5):
+        """
+        Vectorized Hybrid Analysis over a whole window in one pass.
+        Args:
+            timestamps: epoch seconds (int64 array, e.g. RingSeries.times)
+            flux: X-ray flux (float array, e.g. RingSeries.values)
+            smoothing_window: samples in the trailing mean of the slope
+        Returns: dict of per-sample arrays
+            slope (W/m²/min vs previous sample), smoothed_slope, status, is_warning
+        plus "crossings": class-threshold and derivative-warning crossings.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        flux = np.asarray(flux, dtype=np.float64)
+        n = len(flux)
+        if n == 0:
+            empty = np.empty(0)
+            return {
+                "timestamps": timestamps, "flux": flux, "slope": empty,
+                "smoothed_slope": empty, "status": np.empty(0, dtype="<U21"),
+                "is_warning": np.empty(0, dtype=bool),
+                "crossings": {"class": [], "derivative": []}
+            }
+
+        # 1. CALCULUS: dFlux/dt between consecutive samples (same as calculate_slope)
+        slope = np.zeros(n)
+        d_minutes = np.diff(timestamps) / 60.0
+        np.divide(np.diff(flux), d_minutes, out=slope[1:], where=d_minutes != 0)
+
+        # Trailing moving average (cumsum trick) to damp single-sample noise
+        window = max(1, min(smoothing_window, n))
+        csum = np.cumsum(np.insert(slope, 0, 0.0))
+        counts = np.minimum(np.arange(1, n + 1), window)
+        smoothed = (csum[1:] - csum[np.arange(1, n + 1) - counts]) / counts
+
+        # 2. STATUS: same priority as analyze() (Thresholds first, then Calculus)
+        status = np.select(
+            [flux >= self.X_CLASS_LIMIT, flux >= self.M_CLASS_LIMIT, slope > self.DERIVATIVE_WARNING],
+            ["X_CLASS_FLARE", "M_CLASS_FLARE", "RAPID_INTENSIFICATION"],
+            default="STABLE"
+        )
+        is_warning = status != "STABLE"
+
+        # 3. CROSSINGS: where the flare class or the derivative warning flips
+        levels = np.searchsorted([1e-6, self.M_CLASS_LIMIT, self.X_CLASS_LIMIT], flux, side="right")
+        class_names = np.array(["Quiet", "C", "M", "X"])
+        class_idx = np.flatnonzero(np.diff(levels)) + 1
+        rising = slope > self.DERIVATIVE_WARNING
+        deriv_idx = np.flatnonzero(np.diff(rising.astype(np.int8))) + 1
+
+        return {
+            "timestamps": timestamps,
+            "flux": flux,
+            "slope": slope,
+            "smoothed_slope": smoothed,
+            "status": status,
+            "is_warning": is_warning,
+            "crossings": {
+                "class": [
+                    {"index": int(i), "timestamp": int(timestamps[i]),
+                     "from": str(class_names[levels[i - 1]]), "to": str(class_names[levels[i]])}
+                    for i in class_idx
+                ],
+                "derivative": [
+                    {"index": int(i), "timestamp": int(timestamps[i]), "rising": bool(rising[i])}
+                    for i in deriv_idx
+                ]
+            }
+        }
+
+    def analyze_series(self, series, t_from=None, t_to=None, smoothing_window=5):
+        """analyze_batch() over a RingSeries time range (zero-copy views in)."""
+        times, flux = series.slice(t_from, t_to)
+        return self.analyze_batch(times, flux, smoothing_window)
+
+    # --- D. STREAMING MODE (stateful, O(1) per sample) ---
+
+    def push(self, sample, stream="live"):
+        """
+        Streaming Hybrid Analysis with memory between samples.
+        Supports:
+        - SolarPoint for X-Ray Flux
+        - Dict for Telemetry (full telemetry or a partial 'telemetry_sim' packet)
+        stream: independent state namespace ("live", "simulation", a replay...)
+        Returns the same shape as analyze(), plus "ema_slope".
+        """
+        if isinstance(sample, dict):
+            return self._push_telemetry(sample, stream)
+        return self.push_flux(_epoch(sample.timestamp), sample.flux, stream)
+
+    def reset(self, stream):
+        """Forgets all channel state of a stream (e.g. when a simulation ends)."""
+        for key in [key for key in self.streams if key[0] == stream]:
+            del self.streams[key]
+
+    def _state(self, stream, channel):
+        state = self.streams.get((stream, channel))
+        if state is None:
+            state = self.streams[(stream, channel)] = ChannelState()
+        return state
+
+    def _step(self, state, t, value):
+        # Rolling derivative + time-aware EMA; out-of-order samples are ignored
+        if state.last_time is not None:
+            dt = t - state.last_time
+            if dt <= 0:
+                return
+            state.slope = (value - state.last_value) / (dt / 60.0)
+            alpha = 1.0 - math.exp(-dt / self.EMA_TAU_SECONDS)
+            state.ema_slope += alpha * (state.slope - state.ema_slope)
+        state.last_time = t
+        state.last_value = value
+        state.samples += 1
+
+    def push_flux(self, t, flux, stream="live"):
+        """push() for raw columns: t in epoch seconds, flux in W/m²."""
+        state = self._state(stream, "flux")
+        self._step(state, t, flux)
+        previous = state.status
+        details = "Calm"
+
+        # 1. CHECK THRESHOLDS (with hysteresis on the way down)
+        if flux >= self.X_CLASS_LIMIT or (
+                previous == "X_CLASS_FLARE" and flux >= self.X_CLASS_LIMIT * self.HYSTERESIS):
+            status = "X_CLASS_FLARE"
+            details = "MAJOR EVENT IN PROGRESS"
+        elif flux >= self.M_CLASS_LIMIT or (
+                previous in ("X_CLASS_FLARE", "M_CLASS_FLARE") and flux >= self.M_CLASS_LIMIT * self.HYSTERESIS):
+            status = "M_CLASS_FLARE"
+            details = "Moderate Flare Ongoing"
+
+        # 2. CHECK CALCULUS (enter on the raw slope, clear on the smoothed one)
+        elif state.slope > self.DERIVATIVE_WARNING or (
+                previous == "RAPID_INTENSIFICATION" and state.ema_slope > self.DERIVATIVE_WARNING * self.HYSTERESIS):
+            status = "RAPID_INTENSIFICATION"
+            details = "Early Warning: Flux Rising Fast"
+        else:
+            status = "STABLE"
+            # 3. CHECK DECAY
+            if state.slope < -1e-8 and flux > 1e-6:
+                details = "Flux Decay (Cooling)"
+
+        state.status = status
+        return {
+            "slope": state.slope,
+            "ema_slope": state.ema_slope,
+            "status": status,
+            "details": details,
+            "is_warning": status != "STABLE",
+            "threshold": self.DERIVATIVE_WARNING,
+            "value_display": f"{flux:.2e} W/m²",
+            "engine_type": "HYBRID (Streaming)"
+        }
+
+    def _push_telemetry(self, sample, stream):
+        t = _epoch(datetime.fromisoformat(sample["timestamp"])) if sample.get("timestamp") else time.time()
+
+        for rule in TELEMETRY_RULES:
+            if sample.get(rule["key"]) is None:
+                continue
+            value = float(sample[rule["key"]])
+            state = self._state(stream, rule["channel"])
+            self._step(state, t, value)
+            entered = value > rule["enter"] if rule["strict"] else value >= rule["enter"]
+            held = state.status == rule["status"] and value >= rule["release"]
+            state.status = rule["status"] if entered or held else "STABLE"
+
+        # Report the highest-priority active threat (same order as analyze())
+        for rule in TELEMETRY_RULES:
+            state = self.streams.get((stream, rule["channel"]))
+            if state is not None and state.status != "STABLE":
+                value = state.last_value
+                return {
+                    "slope": state.slope,
+                    "ema_slope": state.ema_slope,
+                    "status": state.status,
+                    "details": rule["details"].format(value=value),
+                    "is_warning": True,
+                    "threshold": 0,
+                    "value_display": rule["display"].format(value=value),
+                    "engine_type": "TELEMETRY_CHECK (Streaming)"
+                }
+
+        return {
+            "slope": 0,
+            "ema_slope": 0,
+            "status": "STABLE",
+            "details": "Calm",
+            "is_warning": False,
+            "threshold": 0,
+            "value_display": "N/A",
+            "engine_type": "TELEMETRY_CHECK (Streaming)"
+        }
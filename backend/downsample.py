@@ -0,0 +1,91 @@
+"""
+Downsampling - Fewer points for the charts, same shape (and the same peaks).
+
+- minmax: splits the range into buckets and keeps each bucket's lowest and
+  highest sample (in time order). Every local extreme survives, so a flare peak
+  is never averaged away. Works on rollups too (bucket min/max columns).
+- lttb: Largest-Triangle-Three-Buckets (Steinarsson 2013). Keeps the sample
+  per bucket that forms the largest triangle with its neighbours: visually
+  the closest line, peaks usually (not always) kept.
+
+Both take and return NumPy columns and keep the first and last sample.
+"""
+
+import numpy as np
+
+ALGORITHMS = ("minmax", "lttb")
+
+
+def minmax(times, values, max_points, mins=None, maxs=None):
+    """
+    <= max_points samples: per bucket, the min and the max.
+    mins/maxs: per-row extremes when the rows are rollup buckets (default: values).
+    Returns (times, values).
+    """
+    n = len(times)
+    if n <= max_points or max_points < 6:
+        return times, values
+    mins = values if mins is None else mins
+    maxs = values if maxs is None else maxs
+
+    buckets = (max_points - 2) // 2  # Two per bucket, plus the first and last sample
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    # argmin/argmax per bucket via reduceat on the bucket minima/maxima
+    bucket_min = np.minimum.reduceat(mins, starts)
+    bucket_max = np.maximum.reduceat(maxs, starts)
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+    min_idx = _first_per_bucket(mins == bucket_min[bucket_of], bucket_of)
+    max_idx = _first_per_bucket(maxs == bucket_max[bucket_of], bucket_of)
+
+    idx = np.unique(np.concatenate([min_idx, max_idx, [0, n - 1]]))
+    out = values.copy()
+    out[min_idx] = mins[min_idx]
+    out[max_idx] = maxs[max_idx]
+    return times[idx], out[idx]
+
+
+def _first_per_bucket(mask, bucket_of):
+    # Index of the first True row in every bucket (each bucket has one)
+    rows = np.flatnonzero(mask)
+    _, first = np.unique(bucket_of[rows], return_index=True)
+    return rows[first]
+
+
+def lttb(times, values, max_points):
+    """Largest-Triangle-Three-Buckets down to max_points samples. Returns (times, values)."""
+    n = len(times)
+    if n <= max_points or max_points < 3:
+        return times, values
+
+    x = times.astype(np.float64)
+    y = values.astype(np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)  # Interior buckets
+    buckets = max_points - 2
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+
+    # Vectorized up front: each bucket's next-bucket average (the last bucket's
+    # "next" is the last point) and its candidates as one padded row (padding
+    # repeats the bucket's last sample; argmax returns the first maximum)
+    next_edges = np.append(edges[1:], n)
+    avg_x = np.add.reduceat(x, next_edges[:-1])[:buckets] / np.diff(next_edges)[:buckets]
+    avg_y = np.add.reduceat(y, next_edges[:-1])[:buckets] / np.diff(next_edges)[:buckets]
+    lo = edges[:-1]
+    width = int(np.diff(edges).max())
+    offsets = np.minimum(np.arange(width), (np.diff(edges) - 1)[:, None])
+    cand = lo[:, None] + offsets
+    cand_x, cand_y = x[cand], y[cand]
+
+    # Twice the triangle area (a, candidate, next-bucket average) is
+    # |(x_a - X) * y + (Y - y_a) * x + (X * y_a - x_a * Y)|: only the chosen
+    # previous point a is sequential
+    ax, ay = x[0], y[0]
+    avg_x, avg_y = avg_x.tolist(), avg_y.tolist()
+    for i in range(buckets):
+        X, Y = avg_x[i], avg_y[i]
+        j = int(np.abs((ax - X) * cand_y[i] + (Y - ay) * cand_x[i] + (X * ay - ax * Y)).argmax())
+        a = cand[i, j]
+        keep[i + 1] = a
+        ax, ay = x[a], y[a]
+    return times[keep], values[keep]
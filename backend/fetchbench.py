@@ -0,0 +1,282 @@
+"""
+Fetch Benchmark - NOAA feed fetch + parse throughput and failure modes, offline.
+
+Runs fetcher.py against the NOAA stand-in (noaa_mock.py) inside this process
+(httpx.ASGITransport: no sockets, no network), or against a running stand-in
+with --url, and reports:
+
+- throughput per feed: full downloads (200, JSON decode, parse), conditional
+  GETs answered with 304 (cached parse), and large payloads (--scale copies
+  of the history feeds): fetches/s, MB/s, parse time, p50/p90/p99 latency,
+- failure modes: one injected fault each, driven through a scheduler FeedJob
+  (retries, timeout, circuit breaker) and checked against what the app is
+  meant to do: 5xx storms open the circuit and it closes again once NOAA
+  recovers, flaky feeds are absorbed by retries, slow feeds time out,
+  truncated JSON fails the run, 304s reuse the cached parse, a 304 with
+  nothing cached is an error, large payloads still parse within the timeout.
+
+The synthetic feeds end at a fixed time and the faults come from a seeded
+generator, so runs fetch the same bytes and hit the same faults; --fixtures
+benchmarks recorded feeds instead (noaa_mock.py --record DIR; none are
+committed, recording needs access to NOAA). Exits 1 if a failure-mode check
+fails.
+
+    python fetchbench.py [--iterations 50] [--scale 10] [--report fetchbench.json]
+    python fetchbench.py --url http://127.0.0.1:8090   # a running noaa_mock.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+import httpx
+from loadtest import environment, flatten, percentiles
+import noaa_mock
+from scheduler import CircuitBreaker, FeedJob
+
+MOCK_URL = "http://noaa-mock"  # Host name for the in-process stand-in (never resolved)
+FROZEN_NOW = datetime(2024, 5, 10, 12, 0, tzinfo=timezone.utc)
+LARGE_FEEDS = ("xray", "wind_history", "proton_history")
+
+
+class MockControl:
+    """The stand-in's /__mock__ endpoints (fault rules and request counters)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def set(self, feed="*", **values):
+        r = await self.client.put("/__mock__/faults", json={"feed": feed, **values})
+        r.raise_for_status()
+
+    async def reset(self, seed):
+        (await self.client.delete("/__mock__/faults", params={"seed": seed})).raise_for_status()
+        (await self.client.delete("/__mock__/stats")).raise_for_status()
+
+    async def requests(self, feed):
+        r = await self.client.get("/__mock__/stats")
+        return r.json().get(feed, {}).get("requests", 0)
+
+
+# --- THROUGHPUT ---
+
+async def bench_feed(fetcher, control, name, iterations, not_modified="never", scale=1):
+    await control.set(name, not_modified=not_modified, payload_scale=scale)
+    fetcher._validator_cache.clear()
+    # Warm-up: primes the validators ("auto") and has the stand-in encode the body
+    await fetcher.fetch_feed(name)
+    before = dict(fetcher.conditional_stats)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        await fetcher.fetch_feed(name)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    after = fetcher.conditional_stats
+    downloaded = after["bytes_downloaded"] - before["bytes_downloaded"]
+    return {
+        "fetches_per_s": round(iterations / elapsed, 1),
+        "mb_per_s": round(downloaded / elapsed / 1e6, 2),
+        "bytes_per_fetch": downloaded // iterations,
+        "parse_ms": round(1000 * (after["parse_seconds"] - before["parse_seconds"]) / iterations, 3),
+        "not_modified": after["not_modified"] - before["not_modified"],
+        "latency": percentiles(latencies),
+    }
+
+
+async def run_throughput(fetcher, control, args):
+    results = {}
+    for name in fetcher.FEEDS:
+        results[name] = {}
+        for label, mode, scale in (("full", "never", 1), ("not_modified", "auto", 1), ("large", "never", args.scale)):
+            if label == "large" and name not in LARGE_FEEDS:
+                continue
+            await control.reset(args.seed)
+            results[name][label] = await bench_feed(fetcher, control, name, args.iterations, mode, scale)
+            line = results[name][label]
+            print(f"  {name:15} {label:13} {line['fetches_per_s']:>8} /s {line['mb_per_s']:>8} MB/s "
+                  f"parse {line['parse_ms']:>8} ms  p99 {line['latency']['p99_ms']:>8} ms")
+    return results
+
+
+# --- FAILURE MODES ---
+# Each returns (passed, details); the job settings are short so the run stays fast
+
+def make_job(fetcher, name, **overrides):
+    async def on_result(result):
+        pass
+
+    settings = {"timeout": fetcher.FEEDS[name]["timeout"], "retries": 2, "backoff": 0.01, "max_backoff": 0.05,
+                "breaker": CircuitBreaker(failure_threshold=3, reset_timeout=0.2)}
+    settings.update(overrides)
+    return FeedJob(name, lambda: fetcher.fetch_feed(name), on_result, interval=0, **settings)
+
+
+async def server_errors(fetcher, control, args):
+    """503 on every request: each run retries, three runs open the circuit; recovery closes it."""
+    await control.set("plasma", error_rate=1.0, error_status=503)
+    job = make_job(fetcher, "plasma")
+    for _ in range(4):
+        await job.run_once()
+    opened = job.breaker.state
+    requests = await control.requests("plasma")
+    await control.set("plasma", error_rate=0.0)
+    await asyncio.sleep(job.breaker.reset_timeout)
+    recovered = await job.run_once()
+    details = {"circuit_after_errors": opened, "requests": requests, "recovered": recovered, **job.stats}
+    passed = opened == "open" and requests == 9 and job.stats["skipped_open"] == 1 and recovered \
+        and job.breaker.state == "closed"
+    return passed, details
+
+
+async def flaky_feed(fetcher, control, args):
+    """30% errors: retries absorb nearly all of them."""
+    await control.set("plasma", error_rate=0.3)
+    job = make_job(fetcher, "plasma", breaker=CircuitBreaker(failure_threshold=1000))
+    for _ in range(40):
+        await job.run_once()
+    details = dict(job.stats)
+    return job.stats["successes"] >= 36 and job.stats["retries"] > 0, details
+
+
+async def slow_feed(fetcher, control, args):
+    """Answers after 300 ms with a 100 ms timeout: every attempt times out and the run fails."""
+    await control.set("proton", latency_ms=300)
+    job = make_job(fetcher, "proton", timeout=0.1, retries=1)
+    ok = await job.run_once()
+    details = dict(job.stats)
+    return not ok and job.stats["timeouts"] == 2, details
+
+
+async def malformed_json(fetcher, control, args):
+    """Truncated bodies: the parse fails, so the run fails instead of merging garbage."""
+    await control.set("kp", malformed_rate=1.0)
+    job = make_job(fetcher, "kp", retries=1)
+    ok = await job.run_once()
+    details = dict(job.stats)
+    return not ok and job.stats["failures"] == 1, details
+
+
+async def not_modified(fetcher, control, args):
+    """A 304 returns the cached parse: no download, no parse."""
+    first = await fetcher.fetch_feed("regions")
+    before = dict(fetcher.conditional_stats)
+    second = await fetcher.fetch_feed("regions")
+    after = fetcher.conditional_stats
+    details = {
+        "not_modified": after["not_modified"] - before["not_modified"],
+        "bytes_downloaded": after["bytes_downloaded"] - before["bytes_downloaded"],
+    }
+    return second is first and details["not_modified"] == 1 and details["bytes_downloaded"] == 0, details
+
+
+async def unsolicited_304(fetcher, control, args):
+    """A 304 with nothing cached has no data to reuse: the run fails (and would be retried)."""
+    await control.set("regions", not_modified="always")
+    job = make_job(fetcher, "regions", retries=0)
+    ok = await job.run_once()
+    details = dict(job.stats)
+    return not ok, details
+
+
+async def large_payload(fetcher, control, args):
+    """--scale copies of the 3-day proton history still fetch and parse within the feed timeout."""
+    await control.set("proton_history", payload_scale=args.scale)
+    job = make_job(fetcher, "proton_history", retries=0)
+    before = fetcher.conditional_stats["bytes_downloaded"]
+    ok = await job.run_once()
+    details = {"bytes": fetcher.conditional_stats["bytes_downloaded"] - before, **job.stats}
+    return ok, details
+
+
+FAILURE_MODES = [server_errors, flaky_feed, slow_feed, malformed_json, not_modified, unsolicited_304, large_payload]
+
+
+async def run_failures(fetcher, control, args):
+    results = {}
+    for check in FAILURE_MODES:
+        await control.reset(args.seed)
+        fetcher._validator_cache.clear()
+        passed, details = await check(fetcher, control, args)
+        results[check.__name__] = {"passed": passed, **details}
+        print(f"  {'PASS' if passed else 'FAIL'} {check.__name__}: {check.__doc__}")
+    return results
+
+
+# --- RUN ---
+
+async def run(args):
+    os.environ["NOAA_BASE_URL"] = args.url or MOCK_URL
+    import fetcher  # After NOAA_BASE_URL: the feed URLs are built at import
+
+    if args.url:
+        control_client = httpx.AsyncClient(base_url=args.url, timeout=10)
+    else:
+        if args.fixtures:
+            feeds = noaa_mock.load_fixtures(args.fixtures)
+        else:
+            feeds = noaa_mock.synthetic_feeds(FROZEN_NOW, seed=args.seed)
+        mock = noaa_mock.create_app(feeds, noaa_mock.FeedFaults(args.seed))
+        transport = httpx.ASGITransport(app=mock)
+        control_client = httpx.AsyncClient(transport=transport, base_url=MOCK_URL)
+        fetcher._http_client = httpx.AsyncClient(transport=transport, headers={"User-Agent": "Helios-Watch/1.0"})
+
+    control = MockControl(control_client)
+    report = {"label": args.label, "environment": environment(None),
+              "config": {key: value for key, value in vars(args).items() if key not in ("report", "compare")}}
+    try:
+        if not args.skip_throughput:
+            print("Throughput:")
+            report["throughput"] = await run_throughput(fetcher, control, args)
+        print("Failure modes:")
+        report["failures"] = await run_failures(fetcher, control, args)
+        await control.reset(args.seed)
+    finally:
+        await control_client.aclose()
+        await fetcher.close_http_client()
+    return report
+
+
+def compare(old, new):
+    old_values = flatten({"throughput": old.get("throughput")})
+    new_values = flatten({"throughput": new.get("throughput")})
+    lines = [f"{old.get('label') or old['environment'].get('commit')} -> {new.get('label') or new['environment'].get('commit')}"]
+    for key in sorted(old_values.keys() & new_values.keys()):
+        before, after = old_values[key], new_values[key]
+        change = f"{100 * (after - before) / before:+.1f}%" if before else "n/a"
+        lines.append(f"  {key}: {before} -> {after} ({change})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline NOAA fetch/parse benchmark and failure-mode checks")
+    parser.add_argument("--iterations", type=int, default=50, help="fetches per feed and mode")
+    parser.add_argument("--scale", type=int, default=10, help="payload copies for the large-payload runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", help="recorded feeds to serve (noaa_mock.py --record DIR)")
+    parser.add_argument("--url", help="a running noaa_mock.py instead of the in-process one")
+    parser.add_argument("--skip-throughput", action="store_true", help="failure modes only")
+    parser.add_argument("--label", help="name of this run in the report")
+    parser.add_argument("--report", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous report to diff the throughput against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report: {args.report}")
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), report)))
+    failed = [name for name, result in report["failures"].items() if not result["passed"]]
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,95 +1,343 @@
 import httpx
 import asyncio
-from datetime import datetime
-from schemas import SolarPoint
+import os
+import time
+import numpy as np
+from ingest import FluxIngester
+from timeseries import SeriesStore, to_epoch_seconds
+
+# NOAA SWPC, or a stand-in with the same paths (e.g. noaa_mock.py for offline runs)
+NOAA_BASE_URL = os.getenv("NOAA_BASE_URL", "https://services.swpc.noaa.gov").rstrip("/")
 
 # The Official NOAA 3-day JSON (Robust source for full 24h+)
-NOAA_URL = "https://services.swpc.noaa.gov/json/goes/primary/xrays-3-day.json"
+NOAA_URL = f"{NOAA_BASE_URL}/json/goes/primary/xrays-3-day.json"
+
+# Telemetry & Region feeds
+PLASMA_5MIN_URL = f"{NOAA_BASE_URL}/products/solar-wind/plasma-5-minute.json"
+PLASMA_3DAY_URL = f"{NOAA_BASE_URL}/products/solar-wind/plasma-3-day.json"
+KP_URL = f"{NOAA_BASE_URL}/products/noaa-planetary-k-index.json"
+PROTON_1DAY_URL = f"{NOAA_BASE_URL}/json/goes/primary/integral-protons-1-day.json"
+PROTON_3DAY_URL = f"{NOAA_BASE_URL}/json/goes/primary/integral-protons-3-day.json"
+REGIONS_URL = f"{NOAA_BASE_URL}/json/solar_regions.json"
+
+# --- SHARED HTTP CLIENT ---
+# One pooled client for the whole app lifetime, so the 60s heartbeat and every
+# WebSocket connect reuse warm keep-alive connections instead of a new TCP+TLS
+# handshake to services.swpc.noaa.gov per request.
+# keepalive_expiry is kept above the heartbeat interval so idle sockets survive
+# between cycles.
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("NOAA_HTTP_MAX_CONNECTIONS", "10")),
+    max_keepalive_connections=int(os.getenv("NOAA_HTTP_MAX_KEEPALIVE", "6")),
+    keepalive_expiry=float(os.getenv("NOAA_HTTP_KEEPALIVE_EXPIRY", "120")),
+)
+HTTP_TIMEOUT = float(os.getenv("NOAA_HTTP_TIMEOUT", "10"))
+
+_http_client = None
+
+
+async def start_http_client():
+    """
+    Creates the app-lifetime pooled client. Called from the app startup hook.
+    """
+    return get_http_client()
+
+
+async def close_http_client():
+    """
+    Closes the pooled client and its keep-alive connections (app shutdown hook).
+    """
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_http_client():
+    """
+    Returns the shared client. Lazily creates it for scripts that never ran
+    the startup hook (e.g. `python fetcher.py`).
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=HTTP_LIMITS,
+            timeout=HTTP_TIMEOUT,
+            headers={"User-Agent": "Helios-Watch/1.0"},
+        )
+    return _http_client
+
+# --- COLUMNAR SERIES STORE ---
+# flux / wind / kp / proton live here between cycles (see timeseries.py)
+series_store = SeriesStore()
+
+# Incremental X-ray ingestion into series_store["flux"] (see ingest.py)
+xray_ingester = FluxIngester(series_store["flux"])
+
+# Retention per channel in memory (matches the NOAA feed windows)
+HISTORY_WINDOW_SECONDS = {"flux": 3 * 86400, "wind": 3 * 86400, "kp": 7 * 86400, "proton": 3 * 86400}
+
+# --- CONDITIONAL GET CACHE ---
+# NOAA serves ETag/Last-Modified on its JSON feeds. We remember the validators
+# and the PARSED result per (url, parser), send If-None-Match/If-Modified-Since,
+# and on 304 reuse the parsed result: no download, no json decode, no parse.
+# NOTE: cached results are shared between cycles; callers must not mutate them.
+_validator_cache = {}  # {(url, parser_name): {etag, last_modified, parsed, size, parse_seconds}}
+
+conditional_stats = {
+    "requests": 0,
+    "not_modified": 0,        # 304 responses
+    "bytes_downloaded": 0,
+    "bytes_saved": 0,         # body size of the cached copy, per 304
+    "parse_seconds": 0.0,
+    "parse_seconds_skipped": 0.0,  # parse time of the cached copy, per 304
+}
+
+
+def get_conditional_stats():
+    """Snapshot of the conditional GET counters (for /api/metrics/fetch)."""
+    stats = dict(conditional_stats)
+    stats["cached_feeds"] = len(_validator_cache)
+    stats["xray_ingest"] = dict(xray_ingester.stats)
+    return stats
+
+
+async def get_json_cached(url, parse, timeout):
+    """
+    Conditional GET of a JSON feed.
+    Returns parse(json) for a 200, or the previously parsed result for a 304.
+    Raises httpx.HTTPStatusError for any other status.
+    """
+    client = get_http_client()
+    key = (url, parse.__name__)
+    cached = _validator_cache.get(key)
+
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    r = await client.get(url, headers=headers, timeout=timeout)
+    conditional_stats["requests"] += 1
+
+    if r.status_code == 304 and cached:
+        conditional_stats["not_modified"] += 1
+        conditional_stats["bytes_saved"] += cached["size"]
+        conditional_stats["parse_seconds_skipped"] += cached["parse_seconds"]
+        return cached["parsed"]
+
+    r.raise_for_status()
+
+    started = time.perf_counter()
+    parsed = parse(r.json())
+    parse_seconds = time.perf_counter() - started
+
+    conditional_stats["bytes_downloaded"] += len(r.content)
+    conditional_stats["parse_seconds"] += parse_seconds
+
+    etag = r.headers.get("ETag")
+    last_modified = r.headers.get("Last-Modified")
+    if etag or last_modified:
+        _validator_cache[key] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "parsed": parsed,
+            "size": len(r.content),
+            "parse_seconds": parse_seconds,
+        }
+    else:
+        _validator_cache.pop(key, None)
+
+    return parsed
+
+
+# --- FEED PARSERS (raw NOAA JSON -> our shapes) ---
+
+def _ingest_xray_points(data):
+    # Incremental: only entries newer than the last time_tag are merged
+    # (plus NOAA corrections inside the backfill horizon)
+    return xray_ingester.ingest(data)
+
+
+def _merge_history(channel, time_tags, values):
+    # Upsert by timestamp into the channel, then drop what fell out of the window
+    series = series_store[channel]
+    series.merge(to_epoch_seconds(time_tags), np.array(values, dtype=np.float64))
+    last = series.last_time()
+    if last is not None:
+        series.evict_before(last - HISTORY_WINDOW_SECONDS[channel])
+    return series
+
+
+def _parse_latest_plasma(data):
+    # Format: [time, density, speed, temp] - Last entry is newest
+    latest = data[-1]
+    return {
+        "density": float(latest[1]),
+        "wind_speed": float(latest[2]),
+        "temp": float(latest[3]),
+    }
+
+
+def _parse_latest_kp(data):
+    # Format: [time, kp, a_running, station_count]
+    return float(data[-1][1])
+
+
+def _parse_latest_proton(data):
+    # We want >10MeV flux
+    for entry in reversed(data):
+        if entry['energy'] == '>=10 MeV':
+            return float(entry['flux'])
+    return None
+
+
+def _parse_kp(data):
+    # One download feeds both the 7-day history and the latest value
+    _parse_kp_history(data)
+    return _parse_latest_kp(data)
+
+
+def _parse_regions(data):
+    regions = []
+    for entry in data:
+        # Only take regions that are officially NAMED (Active Regions)
+        # This filters out hundreds of small "plages" or unnamed spots (noise)
+        if entry.get('observed_region_number'):
+            regions.append({
+                "region_number": entry.get('observed_region_number'),
+                "latitude": float(entry.get('latitude')),
+                "longitude": float(entry.get('longitude')),
+                "class_type": entry.get('magnetic_class', 'Alpha'),
+                "observed_date": entry.get('observed_date')
+            })
+    return regions
+
+
+def _parse_wind_history(data):
+    times, values = [], []
+    # List of lists: [time, density, speed, temp]
+    # Skip header
+    start_idx = 1 if isinstance(data[0][0], str) and "time" in data[0][0].lower() else 0
+
+    for entry in data[start_idx:]:
+        # entry: [time_tag, density, speed, temp]
+        try:
+            if entry[2]:
+                values.append(float(entry[2]))
+                times.append(entry[0])
+        except: continue
+    return _merge_history("wind", times, values)
+
+
+def _parse_kp_history(data):
+    times, values = [], []
+    # Gemini said "Array of Objects" but existing code and standard NOAA JSON often use "Array of Arrays" for products.
+    # We will handle both just in case.
+    is_dict = isinstance(data[0], dict) if data else False
+    start_idx = 1 if not is_dict and isinstance(data[0][0], str) and "time" in data[0][0].lower() else 0
+
+    for entry in data[start_idx:]:
+        try:
+            if is_dict:
+                # Object format
+                ts = entry.get("time_tag")
+                val = float(entry.get("Kp", 0))
+            else:
+                # List format: [time, kp, ...]
+                ts = entry[0]
+                val = float(entry[1])
+
+            values.append(val)
+            times.append(ts)
+        except: continue
+    return _merge_history("kp", times, values)
+
+
+def _parse_proton_history(data):
+    times, values = [], []
+    # Array of Objects
+    for entry in data:
+        # Filter for >=10 MeV
+        if entry.get('energy') == '>=10 MeV':
+            try:
+                values.append(float(entry['flux']))
+                times.append(entry['time_tag'])
+            except: continue
+    return _merge_history("proton", times, values)
+
+
+# --- SCHEDULED FEEDS (see scheduler.py) ---
+# Each feed is polled on its own cadence, close to how often NOAA updates it:
+# X-ray and plasma every minute, protons every 5 minutes, Kp every 3 hours
+# (estimated values land more often), sunspot regions once a day.
+# "channel": the series_store channel the feed merges into (archived by app.py)
+FEEDS = {
+    "xray": {"channel": "flux", "url": NOAA_URL, "parse": _ingest_xray_points, "timeout": 5.0, "interval": 60, "jitter": 3},
+    "plasma": {"url": PLASMA_5MIN_URL, "parse": _parse_latest_plasma, "timeout": 2.0, "interval": 60, "jitter": 3},
+    "proton": {"url": PROTON_1DAY_URL, "parse": _parse_latest_proton, "timeout": 2.0, "interval": 300, "jitter": 15},
+    "kp": {"channel": "kp", "url": KP_URL, "parse": _parse_kp, "timeout": 4.0, "interval": 900, "jitter": 30},
+    "wind_history": {"channel": "wind", "url": PLASMA_3DAY_URL, "parse": _parse_wind_history, "timeout": 6.0, "interval": 300, "jitter": 15},
+    "proton_history": {"channel": "proton", "url": PROTON_3DAY_URL, "parse": _parse_proton_history, "timeout": 6.0, "interval": 300, "jitter": 15},
+    "regions": {"url": REGIONS_URL, "parse": _parse_regions, "timeout": 5.0, "interval": 3600, "jitter": 60},
+}
+
+# Values used until the first successful poll of each telemetry feed
+DEFAULT_TELEMETRY = {"wind_speed": 450.0, "temp": 100000.0, "density": 5.0, "kp_index": 3.0, "proton_flux": 10.0}
+
+
+async def fetch_feed(name):
+    """
+    One poll of a scheduled feed. Unlike the fetch_* helpers below it raises
+    on failure, so the scheduler can retry and trip the circuit breaker.
+    """
+    feed = FEEDS[name]
+    return await get_json_cached(feed["url"], feed["parse"], timeout=feed["timeout"])
+
 
 async def fetch_noaa_data():
     """
     Fetches X-ray flux data.
-    Returns the last 24 hours of SolarPoint objects.
+    Returns the flux RingSeries (FULL history, approx 3 days / 4320 points).
+    On failure the series keeps the last good data.
     """
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(NOAA_URL, timeout=5.0)
-            response.raise_for_status()
-            data = response.json()
-            
-            clean_points = []
-            
-            for entry in data:
-                # We only want the 'long' channel (0.1-0.8nm) for standard classification
-                if entry.get('energy') == '0.1-0.8nm':
-                    flux = entry.get('flux')
-                    
-                    # Determine Class (Physics Logic)
-                    class_type = "Quiet"
-                    if flux >= 1e-4: class_type = "X"
-                    elif flux >= 1e-5: class_type = "M"
-                    elif flux >= 1e-6: class_type = "C"
-                    
-                    point = SolarPoint(
-                        timestamp=datetime.fromisoformat(entry['time_tag'].replace('Z', '+00:00')),
-                        flux=flux,
-                        class_type=class_type,
-                        source="noaa"
-                    )
-                    clean_points.append(point)
-            
-            # Return FULL history (approx 3 days / 4320 points)
-            return clean_points
-            
-        except Exception as e:
-            print(f"[ERROR] NOAA Fetch Failed: {e}")
-            return []
+    try:
+        return await get_json_cached(NOAA_URL, _ingest_xray_points, timeout=5.0)
+
+    except Exception as e:
+        print(f"[ERROR] NOAA Fetch Failed: {e}")
+        return series_store["flux"]
 
 async def fetch_telemetry():
     """
     Fetches real-time Solar Wind, Proton Flux, and Kp Index.
     Returns a dict with the latest values.
     """
-    async with httpx.AsyncClient() as client:
-        telemetry = {"wind_speed": 450.0, "temp": 100000.0, "density": 5.0, "kp_index": 3.0, "proton_flux": 10.0}
-        
-        # 1. Solar Wind (Plasma)
-        try:
-            r = await client.get("https://services.swpc.noaa.gov/products/solar-wind/plasma-5-minute.json", timeout=2.0)
-            if r.status_code == 200:
-                data = r.json()
-                # Format: [time, density, speed, temp] - Last entry is newest
-                latest = data[-1] 
-                telemetry["density"] = float(latest[1])
-                telemetry["wind_speed"] = float(latest[2])
-                telemetry["temp"] = float(latest[3])
-        except Exception as e:
-            print(f"[WARN] Wind Fetch: {e}")
-
-        # 2. Kp Index
-        try:
-            r = await client.get("https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json", timeout=2.0)
-            if r.status_code == 200:
-                data = r.json()
-                # Format: [time, kp, a_running, station_count]
-                telemetry["kp_index"] = float(data[-1][1])
-        except Exception as e:
-            print(f"[WARN] Kp Fetch: {e}")
-
-        # 3. Proton Flux (Integral)
-        try:
-            r = await client.get("https://services.swpc.noaa.gov/json/goes/primary/integral-protons-1-day.json", timeout=2.0)
-            if r.status_code == 200:
-                data = r.json()
-                # We want >10MeV flux
-                for entry in reversed(data):
-                    if entry['energy'] == '>=10 MeV':
-                        telemetry["proton_flux"] = float(entry['flux'])
-                        break
-        except Exception as e:
-             print(f"[WARN] Proton Fetch: {e}")
-
-        return telemetry
+    telemetry = dict(DEFAULT_TELEMETRY)
+
+    # 1. Solar Wind (Plasma)
+    try:
+        telemetry.update(await get_json_cached(PLASMA_5MIN_URL, _parse_latest_plasma, timeout=2.0))
+    except Exception as e:
+        print(f"[WARN] Wind Fetch: {e}")
+
+    # 2. Kp Index
+    try:
+        telemetry["kp_index"] = await get_json_cached(KP_URL, _parse_latest_kp, timeout=2.0)
+    except Exception as e:
+        print(f"[WARN] Kp Fetch: {e}")
+
+    # 3. Proton Flux (Integral)
+    try:
+        proton_flux = await get_json_cached(PROTON_1DAY_URL, _parse_latest_proton, timeout=2.0)
+        if proton_flux is not None:
+            telemetry["proton_flux"] = proton_flux
+    except Exception as e:
+         print(f"[WARN] Proton Fetch: {e}")
+
+    return telemetry
 
 # Fetch NOAA Active Regions (Sunspots)
 async def fetch_solar_regions():
@@ -97,117 +345,52 @@ async def fetch_solar_regions():
     Fetches active sunspot regions from NOAA.
     Returns: List of dicts {region_number, latitude, longitude, class_type}
     """
-    url = "https://services.swpc.noaa.gov/json/solar_regions.json"
-    regions = []
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            r = await client.get(url, timeout=5.0)
-            if r.status_code == 200:
-                data = r.json()
-                for entry in data:
-                    # Only take regions that are officially NAMED (Active Regions)
-                    # This filters out hundreds of small "plages" or unnamed spots (noise)
-                    if entry.get('observed_region_number'):
-                        regions.append({
-                            "region_number": entry.get('observed_region_number'),
-                            "latitude": float(entry.get('latitude')),
-                            "longitude": float(entry.get('longitude')),
-                            "class_type": entry.get('magnetic_class', 'Alpha')
-                        })
-        except Exception as e:
-            print(f"[WARN] Region Fetch: {e}")
-            
-    return regions
+    try:
+        return await get_json_cached(REGIONS_URL, _parse_regions, timeout=5.0)
+    except Exception as e:
+        print(f"[WARN] Region Fetch: {e}")
+        return []
 
 # Fetch Historical Telemetry (Wind, Kp, Proton) for Graph Initialization
 async def fetch_telemetry_history():
     """
     Fetches the last 24 hours of Solar Wind, Kp Index, and Proton Flux.
-    Returns: { "wind": [...], "kp": [...], "proton": [...] }
+    Returns: { "wind": RingSeries, "kp": RingSeries, "proton": RingSeries }
+    A failed feed leaves its series holding the last good data.
     """
-    history = {"wind": [], "kp": [], "proton": []}
-    
-    async with httpx.AsyncClient() as client:
-        # 1. Solar Wind History (3 DAYS)
-        # URL: https://services.swpc.noaa.gov/products/solar-wind/plasma-3-day.json
-        try:
-            r = await client.get("https://services.swpc.noaa.gov/products/solar-wind/plasma-3-day.json", timeout=6.0)
-            if r.status_code == 200:
-                data = r.json() # List of lists: [time, density, speed, temp]
-                # Skip header
-                start_idx = 1 if isinstance(data[0][0], str) and "time" in data[0][0].lower() else 0
-                
-                for entry in data[start_idx:]:
-                    # entry: [time_tag, density, speed, temp]
-                    try:
-                        if entry[2]: 
-                            history["wind"].append({
-                                "timestamp": entry[0],
-                                "value": float(entry[2])
-                            })
-                    except: continue
-        except Exception as e:
-            print(f"[WARN] Wind History Fetch: {e}")
-
-        # 2. Kp Index History (7 DAYS)
-        try:
-            r = await client.get("https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json", timeout=4.0)
-            if r.status_code == 200:
-                data = r.json() 
-                # Gemini said "Array of Objects" but existing code and standard NOAA JSON often use "Array of Arrays" for products.
-                # We will handle both just in case.
-                
-                is_dict = isinstance(data[0], dict) if data else False
-                start_idx = 1 if not is_dict and isinstance(data[0][0], str) and "time" in data[0][0].lower() else 0
-
-                for entry in data[start_idx:]:
-                    try:
-                        if is_dict:
-                            # Object format
-                            ts = entry.get("time_tag")
-                            val = float(entry.get("Kp", 0))
-                        else:
-                            # List format: [time, kp, ...]
-                            ts = entry[0]
-                            val = float(entry[1])
-                            
-                        history["kp"].append({
-                            "timestamp": ts,
-                            "value": val
-                        })
-                    except: continue
-        except Exception as e:
-            print(f"[WARN] Kp History Fetch: {e}")
-
-        # 3. Proton Flux History (3 DAYS)
-        # URL: https://services.swpc.noaa.gov/json/goes/primary/integral-protons-3-day.json
-        try:
-            r = await client.get("https://services.swpc.noaa.gov/json/goes/primary/integral-protons-3-day.json", timeout=6.0)
-            if r.status_code == 200:
-                data = r.json() # Array of Objects
-                
-                for entry in data:
-                    # Filter for >=10 MeV
-                    if entry.get('energy') == '>=10 MeV':
-                        try:
-                            history["proton"].append({
-                                "timestamp": entry['time_tag'],
-                                "value": float(entry['flux'])
-                            })
-                        except: continue
-        except Exception as e:
-            print(f"[WARN] Proton History Fetch: {e}")
-            
+    history = {channel: series_store[channel] for channel in ("wind", "kp", "proton")}
+
+    # 1. Solar Wind History (3 DAYS)
+    try:
+        await get_json_cached(PLASMA_3DAY_URL, _parse_wind_history, timeout=6.0)
+    except Exception as e:
+        print(f"[WARN] Wind History Fetch: {e}")
+
+    # 2. Kp Index History (7 DAYS)
+    try:
+        await get_json_cached(KP_URL, _parse_kp_history, timeout=4.0)
+    except Exception as e:
+        print(f"[WARN] Kp History Fetch: {e}")
+
+    # 3. Proton Flux History (3 DAYS)
+    try:
+        await get_json_cached(PROTON_3DAY_URL, _parse_proton_history, timeout=6.0)
+    except Exception as e:
+        print(f"[WARN] Proton History Fetch: {e}")
+
     return history
 
-if __name__ == "__main__":
-    # Quick Test
-    points = asyncio.run(fetch_noaa_data())
+async def _quick_test():
+    points = await fetch_noaa_data()
     print(f"Fetched {len(points)} valid points.")
-    
-    hist = asyncio.run(fetch_telemetry_history())
+
+    hist = await fetch_telemetry_history()
     print(f"Wind History: {len(hist['wind'])} points")
     print(f"Kp History: {len(hist['kp'])} points")
     print(f"Proton History: {len(hist['proton'])} points")
-        
\ No newline at end of file
+
+    await close_http_client()
+
+if __name__ == "__main__":
+    # Quick Test (single event loop so the pooled client is reused)
+    asyncio.run(_quick_test())
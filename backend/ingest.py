@@ -0,0 +1,101 @@
+"""
+Incremental Ingestion - Append-only X-ray flux series.
+
+NOAA republishes the whole 3-day window every minute, but only the last minute
+or two are new. FluxIngester keeps the series in memory (a columnar RingSeries,
+see timeseries.py) and, per cycle, only walks the tail of the feed: new entries
+are appended, entries inside a short backfill horizon are checked for NOAA
+corrections, and samples older than the window are evicted from the front.
+"""
+
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from schemas import SolarPoint
+from timeseries import epoch_to_iso
+
+
+def classify_flux(flux):
+    """GOES long-channel flux -> flare class (Physics Logic)."""
+    if flux >= 1e-4: return "X"
+    if flux >= 1e-5: return "M"
+    if flux >= 1e-6: return "C"
+    return "Quiet"
+
+
+def classify_flux_array(flux):
+    """Vectorized classify_flux over a NumPy array."""
+    return np.select(
+        [flux >= 1e-4, flux >= 1e-5, flux >= 1e-6],
+        ["X", "M", "C"],
+        default="Quiet"
+    )
+
+
+def parse_time_tag(time_tag):
+    return datetime.fromisoformat(time_tag.replace('Z', '+00:00'))
+
+
+def solar_points(times, values):
+    """(epoch, flux) columns as SolarPoint objects."""
+    return [
+        SolarPoint(
+            timestamp=datetime.fromtimestamp(t, tz=timezone.utc),
+            flux=flux,
+            class_type=classify_flux(flux),
+            source="noaa"
+        )
+        for t, flux in zip(times.tolist(), values.tolist())
+    ]
+
+
+def flux_records(times, values):
+    """history_update payload rows (SolarPoint-shaped dicts) built from the columns."""
+    return [
+        {"timestamp": ts, "flux": flux, "class_type": class_type, "source": "noaa"}
+        for ts, flux, class_type in zip(
+            epoch_to_iso(times), values.tolist(), classify_flux_array(values).tolist()
+        )
+    ]
+
+
+class FluxIngester:
+    # We only want the 'long' channel (0.1-0.8nm) for standard classification
+    ENERGY = '0.1-0.8nm'
+
+    def __init__(self, series, window=timedelta(days=3), backfill_horizon=timedelta(minutes=30)):
+        self.series = series  # timeseries.RingSeries (float64 flux)
+        self.window = int(window.total_seconds())
+        self.backfill_horizon = int(backfill_horizon.total_seconds())
+        self.stats = {"cycles": 0, "appended": 0, "corrected": 0, "inserted": 0, "evicted": 0}
+
+    def ingest(self, data):
+        """
+        Merges one NOAA xrays JSON payload. Walks the feed from the newest end and
+        stops as soon as it passes the backfill horizon, so the cost scales with
+        the number of new (or corrected) entries, not with the window size.
+        Returns the series.
+        """
+        self.stats["cycles"] += 1
+        last_time = self.series.last_time()
+        horizon = last_time - self.backfill_horizon if last_time is not None else None
+
+        times, fluxes = [], []
+        for entry in reversed(data):
+            if entry.get('energy') != self.ENERGY or entry.get('flux') is None:
+                continue
+            t = int(parse_time_tag(entry['time_tag']).timestamp())
+            if horizon is not None and t < horizon:
+                break  # Everything older is already ingested and settled
+            times.append(t)
+            fluxes.append(entry['flux'])
+
+        # Appends new samples, overwrites corrections, inserts late gap-fillers
+        merged = self.series.merge(np.array(times, dtype=np.int64), np.array(fluxes, dtype=np.float64))
+        self.stats["appended"] += merged["appended"]
+        self.stats["corrected"] += merged["updated"]
+        self.stats["inserted"] += merged["inserted"]
+
+        newest = self.series.last_time()
+        if newest is not None:
+            self.stats["evicted"] += self.series.evict_before(newest - self.window)
+        return self.series
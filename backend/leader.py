@@ -0,0 +1,116 @@
+"""
+Leader Election - One NOAA fetcher across all workers.
+
+Every copy of app.py would otherwise run its own heartbeat and poll all the
+NOAA feeds. Instead, workers compete for a lease row in the existing database
+(models.LeaderLease): the holder fetches and publishes snapshots over the bus,
+everybody else consumes them.
+
+The lease is taken with a single conditional UPDATE (or INSERT for the first
+holder), so it is atomic on SQLite and on any server database:
+    UPDATE leader_leases SET holder=me, expires_at=now+ttl
+     WHERE name=? AND (holder=me OR expires_at < now)
+
+The leader renews every `renew_interval` seconds. If it dies, a follower takes
+over once the lease expires: failover is bounded by ttl + renew_interval. A
+leader that cannot renew (database unreachable) steps down when its own lease
+runs out, so two fetchers never overlap for longer than clock skew between
+hosts.
+"""
+
+import asyncio
+import os
+import secrets
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from models import SessionLocal, LeaderLease
+
+
+class LeaderElector:
+    def __init__(self, name="noaa-fetcher", ttl=30.0, renew_interval=10.0, on_change=None):
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.on_change = on_change  # Called with is_leader on every transition
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.is_leader = False
+        self.lease_expires = datetime.min
+        self.stats = {"acquired": 0, "lost": 0, "errors": 0}
+        self._task = None
+
+    def try_acquire(self):
+        """One election round (blocking DB call). Returns True if we hold the lease."""
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.ttl)
+        session = SessionLocal()
+        try:
+            taken = session.query(LeaderLease).filter(
+                LeaderLease.name == self.name,
+                or_(LeaderLease.holder == self.holder, LeaderLease.expires_at < now),
+            ).update({"holder": self.holder, "expires_at": expires}, synchronize_session=False)
+            if not taken:
+                if session.get(LeaderLease, self.name) is not None:
+                    session.rollback()
+                    return False
+                # First worker ever: create the row (a racing insert loses)
+                session.add(LeaderLease(name=self.name, holder=self.holder, expires_at=expires))
+            session.commit()
+            self.lease_expires = expires
+            return True
+        except IntegrityError:
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    def release(self):
+        """Expires our lease immediately so a follower takes over on its next round."""
+        session = SessionLocal()
+        try:
+            session.query(LeaderLease).filter(
+                LeaderLease.name == self.name, LeaderLease.holder == self.holder
+            ).update({"expires_at": datetime.min}, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            print(f"[WARN] Could not release leader lease: {e}")
+        finally:
+            session.close()
+
+    def _set_leader(self, is_leader):
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        self.stats["acquired" if is_leader else "lost"] += 1
+        print(f"Leader election ({self.name}): {self.holder} is now {'LEADER' if is_leader else 'a follower'}")
+        if self.on_change:
+            self.on_change(is_leader)
+
+    async def run(self):
+        while True:
+            try:
+                self._set_leader(await asyncio.to_thread(self.try_acquire))
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[WARN] Leader election failed: {e}")
+                # Keep leading only while our last lease is still valid
+                if self.is_leader and datetime.utcnow() >= self.lease_expires:
+                    self._set_leader(False)
+            await asyncio.sleep(self.renew_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.is_leader:
+            await asyncio.to_thread(self.release)
+            self._set_leader(False)
+
+    def get_stats(self):
+        return {
+            "name": self.name, "holder": self.holder, "is_leader": self.is_leader,
+            "ttl": self.ttl, "renew_interval": self.renew_interval, **self.stats,
+        }
@@ -0,0 +1,427 @@
+"""
+Load Test - How many dashboards can one app.py process serve?
+
+Starts the NOAA stand-in (noaa_mock.py) and the app (uvicorn, a scratch SQLite
+database, HELIOS_STAMP_FRAMES=1), opens N concurrent /ws clients, fires
+/simulate bursts and measures:
+
+- fan-out latency: hub publish ("sent_at") -> client receive, p50/p90/p99/max,
+- dropped frames: seq numbers a client never received (frames the hub
+  coalesced or dropped under backpressure) and lag disconnects,
+- memory per connection: server RSS growth / clients (Linux /proc),
+- CPU: server and harness CPU time per phase, in % of one core.
+
+The JSON report holds the configuration, the environment (commit, Python,
+CPU count) and the results; --compare OLD.json prints the differences, so
+releases can be compared run for run on the same machine.
+
+    python loadtest.py --clients 2000 --bursts 3 --report loadtest.json
+    python loadtest.py --clients 500 --scenario cme_chain --compression 14400
+    python loadtest.py --url http://127.0.0.1:8000 --pid 1234   # a running server
+
+All clients run in this process. If the harness CPU nears 100% it is the
+bottleneck, not the server: use fewer clients or several harnesses. Against
+another host (--url) latencies include the clock offset between the machines.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+import websockets
+from wire import orjson
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+loads = orjson.loads if orjson is not None else json.loads
+
+
+# --- PROCESS METRICS (Linux /proc; None elsewhere) ---
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS  # utime + stime
+    except (OSError, IndexError):
+        return None
+
+
+class CpuMeter:
+    """CPU % of one core for the server (pid) and for this harness between start() and stop()."""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def start(self):
+        self.wall = time.monotonic()
+        self.server = cpu_seconds(self.pid) if self.pid else None
+        self.harness = time.process_time()
+        return self
+
+    def stop(self):
+        wall = max(time.monotonic() - self.wall, 1e-9)
+        server = cpu_seconds(self.pid) if self.pid else None
+        return {
+            "seconds": round(wall, 2),
+            "server_cpu_pct": round(100 * (server - self.server) / wall, 1) if server is not None and self.server is not None else None,
+            "harness_cpu_pct": round(100 * (time.process_time() - self.harness) / wall, 1),
+        }
+
+
+# --- CLIENTS ---
+
+class SwarmClient:
+    """One dashboard: connects, reads every frame, records latency and seq gaps."""
+
+    def __init__(self, url):
+        self.url = url
+        self.connect_seconds = None
+        self.error = None
+        self.closed_by_server = False
+        self.first_seq = None  # seq at connect (sync frame)
+        self.max_seq = 0
+        self.frames = 0
+        self.latencies = []
+        self.recording = False
+
+    @property
+    def dropped(self):
+        # Published while connected (up to the newest frame seen) but never received
+        return self.max_seq - self.first_seq - self.frames if self.first_seq is not None else 0
+
+    async def run(self, ready):
+        started = time.perf_counter()
+        try:
+            async with websockets.connect(self.url, max_size=None, open_timeout=60, ping_interval=None) as ws:
+                async for raw in ws:
+                    received = time.time()
+                    msg = loads(raw)
+                    payload = msg.get("payload") or {}
+                    if msg.get("type") == "sync":
+                        # Everything after the sync frame is live broadcast
+                        self.first_seq = self.max_seq = payload.get("seq", 0)
+                        self.connect_seconds = time.perf_counter() - started
+                        ready.set()
+                        continue
+                    seq = msg.get("seq")
+                    if seq is None or self.first_seq is None or seq <= self.first_seq:
+                        continue  # Snapshot frames
+                    # Not necessarily in order: a coalesced frame takes the place of an older one
+                    self.max_seq = max(self.max_seq, seq)
+                    self.frames += 1
+                    if self.recording and isinstance(payload, dict) and payload.get("sent_at"):
+                        self.latencies.append(received - payload["sent_at"])
+            self.closed_by_server = True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = type(e).__name__
+            self.closed_by_server = True
+        finally:
+            ready.set()
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    values = np.array(samples) * 1000
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"p50_ms": round(p50, 2), "p90_ms": round(p90, 2), "p99_ms": round(p99, 2),
+            "max_ms": round(float(values.max()), 2), "samples": len(samples)}
+
+
+# --- SERVERS ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def raise_fd_limit():
+    # Thousands of sockets on both ends; children inherit the limit
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return hard
+    except (ValueError, OSError):
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+async def wait_ready(url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url, timeout=2)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def start_servers(workdir, mock_base_url=None):
+    """NOAA stand-in (unless mock_base_url is given) + the app. Returns (app_url, [processes])."""
+    processes = []
+    if mock_base_url is None:
+        mock_port = free_port()
+        processes.append(subprocess.Popen(
+            [sys.executable, "noaa_mock.py", "--port", str(mock_port)], cwd=BACKEND_DIR,
+            stdout=open(os.path.join(workdir, "noaa_mock.log"), "w"), stderr=subprocess.STDOUT,
+        ))
+        mock_base_url = f"http://127.0.0.1:{mock_port}"
+
+    port = free_port()
+    env = {
+        **os.environ,
+        "NOAA_BASE_URL": mock_base_url,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        "HELIOS_STAMP_FRAMES": "1",
+        "HELIOS_FETCHER": "1",
+        "PYTHONUNBUFFERED": "1",
+    }
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+        stdout=open(os.path.join(workdir, "app.log"), "w"), stderr=subprocess.STDOUT,
+    ))
+    return f"http://127.0.0.1:{port}", processes
+
+
+def stop_servers(processes):
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# --- RUN ---
+
+async def trigger_bursts(http, args, burst):
+    if args.scenario:
+        body = {"scenario": args.scenario, "name": f"load-{burst}", "seed": burst}
+        if args.compression:
+            body["compression"] = args.compression
+        bodies = [body]
+    else:
+        bodies = [{"name": f"load-{burst}-{i}", "type": args.flare_class, "duration": args.burst_duration,
+                   "seed": burst * 1000 + i} for i in range(args.burst_size)]
+    responses = await asyncio.gather(*(http.post("/simulate", json=body) for body in bodies))
+    for response in responses:
+        response.raise_for_status()
+
+
+async def wait_simulations_done(http, timeout):
+    deadline = time.monotonic() + timeout
+    await asyncio.sleep(0.5)  # The request reaches the fetcher over the bus
+    while time.monotonic() < deadline:
+        if not (await http.get("/api/simulations")).json()["simulations"]:
+            return True
+        await asyncio.sleep(0.5)
+    return False
+
+
+async def run(args):
+    fd_limit = raise_fd_limit()
+    workdir = tempfile.mkdtemp(prefix="helios-loadtest-")
+    processes = []
+    base_url, pid = args.url, args.pid
+    if base_url is None:
+        base_url, processes = start_servers(workdir, args.noaa_url)
+        pid = processes[-1].pid
+    ws_url = base_url.replace("http", "ws", 1) + "/ws"
+
+    report = {
+        "label": args.label,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {key: value for key, value in vars(args).items() if key not in ("report", "compare")},
+        "environment": environment(fd_limit),
+    }
+    clients, tasks = [], []
+    try:
+        await wait_ready(base_url + "/health")
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as http:
+            await http.get("/api/metrics/broadcast")  # Warm the app (imports, first snapshot)
+            rss_before = rss_bytes(pid) if pid else None
+
+            # 1. CONNECT: at most --connect-concurrency handshakes in flight
+            meter = CpuMeter(pid).start()
+            gate = asyncio.Semaphore(args.connect_concurrency)
+
+            async def connect(client):
+                ready = asyncio.Event()
+                async with gate:
+                    tasks.append(asyncio.create_task(client.run(ready)))
+                    await ready.wait()
+
+            clients = [SwarmClient(ws_url) for _ in range(args.clients)]
+            await asyncio.gather(*(connect(client) for client in clients))
+            connect_phase = meter.stop()
+            connected = [client for client in clients if client.connect_seconds is not None]
+            await asyncio.sleep(1.0)  # Let the writer tasks settle before measuring memory
+            rss_after = rss_bytes(pid) if pid else None
+            report["connect"] = {
+                **connect_phase,
+                "connected": len(connected),
+                "failed": len(clients) - len(connected),
+                "errors": sorted({client.error for client in clients if client.error}),
+                "handshake": percentiles([client.connect_seconds for client in connected]),
+                "server_rss_mb": round(rss_after / 2 ** 20, 1) if rss_after else None,
+                "rss_per_client_kb": round((rss_after - rss_before) / 1024 / max(len(connected), 1), 1)
+                if rss_after and rss_before else None,
+            }
+
+            # 2. IDLE: the live feeds only
+            hub_before = (await http.get("/api/metrics/broadcast")).json()
+            for client in clients:
+                client.recording = True
+            meter.start()
+            await asyncio.sleep(args.idle)
+            report["idle"] = {**meter.stop(), "latency": percentiles(collect_latencies(clients))}
+
+            # 3. BURSTS: /simulate, wait for every simulation to finish
+            bursts = []
+            for burst in range(args.bursts):
+                meter.start()
+                await trigger_bursts(http, args, burst)
+                finished = await wait_simulations_done(http, args.burst_timeout)
+                await asyncio.sleep(1.0)  # Drain the queues
+                bursts.append({**meter.stop(), "finished": finished,
+                               "latency": percentiles(collect_latencies(clients))})
+            hub_after = (await http.get("/api/metrics/broadcast")).json()
+
+        report["bursts"] = bursts
+        report["results"] = summarize(clients, bursts, hub_before, hub_after)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        stop_servers(processes)
+        report["logs"] = workdir
+    return report
+
+
+def collect_latencies(clients):
+    # Latencies since the previous call (per phase)
+    samples = []
+    for client in clients:
+        samples.extend(client.latencies)
+        client.latencies = []
+    return samples
+
+
+def summarize(clients, bursts, hub_before, hub_after):
+    published = hub_after["published"] - hub_before["published"]
+    received = sum(client.frames for client in clients)
+    dropped = sum(client.dropped for client in clients)
+    burst_latencies = [burst["latency"] for burst in bursts if burst["latency"]]
+    worst = max(burst_latencies, key=lambda latency: latency["p99_ms"]) if burst_latencies else None
+    return {
+        "clients": len(clients),
+        "frames_published": published,
+        "frames_received": received,
+        "frames_dropped": dropped,
+        "drop_pct": round(100 * dropped / max(received + dropped, 1), 3),
+        "disconnected": sum(client.closed_by_server for client in clients),
+        "hub": {key: hub_after[key] - hub_before.get(key, 0)
+                for key in ("sent", "coalesced", "dropped", "lag_disconnects", "send_failures") if key in hub_after},
+        "burst_latency_worst": worst,
+        "burst_server_cpu_pct_max": max((burst["server_cpu_pct"] or 0 for burst in bursts), default=None),
+        "burst_harness_cpu_pct_max": max((burst["harness_cpu_pct"] for burst in bursts), default=None),
+    }
+
+
+def environment(fd_limit):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+        "cpus": os.cpu_count(), "fd_limit": fd_limit,
+    }
+
+
+# --- REPORTS ---
+
+def flatten(data, prefix=""):
+    out = {}
+    for key, value in (data or {}).items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(old, new):
+    """Lines of 'metric: old -> new (change)' for every numeric result both reports have."""
+    old_values = flatten({"connect": old.get("connect"), "results": old.get("results")})
+    new_values = flatten({"connect": new.get("connect"), "results": new.get("results")})
+    lines = [f"{old.get('label') or old['environment'].get('commit')} -> {new.get('label') or new['environment'].get('commit')}"]
+    for key in sorted(old_values.keys() & new_values.keys()):
+        before, after = old_values[key], new_values[key]
+        change = f"{100 * (after - before) / before:+.1f}%" if before else "n/a"
+        lines.append(f"  {key}: {before} -> {after} ({change})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket swarm load test for the Helios-Watch backend")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--connect-concurrency", type=int, default=100, help="handshakes in flight")
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds of live-only traffic")
+    parser.add_argument("--bursts", type=int, default=3)
+    parser.add_argument("--burst-size", type=int, default=4, help="concurrent simulations per burst")
+    parser.add_argument("--burst-duration", type=int, default=30, help="simulated seconds (0.3s each)")
+    parser.add_argument("--burst-timeout", type=float, default=120.0)
+    parser.add_argument("--flare-class", default="X")
+    parser.add_argument("--scenario", help="bundled scenario per burst instead of flare simulations")
+    parser.add_argument("--compression", type=float, help="scenario time compression")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--pid", type=int, help="server pid for memory/CPU with --url")
+    parser.add_argument("--noaa-url", help="existing NOAA stand-in (default: start noaa_mock.py)")
+    parser.add_argument("--label", help="name of this run in the report")
+    parser.add_argument("--report", default="loadtest_report.json")
+    parser.add_argument("--compare", help="previous report to diff against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({key: report[key] for key in ("connect", "idle", "results")}, indent=2))
+    print(f"Report: {args.report} (server logs in {report['logs']})")
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), report)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Alert Mailer - Pooled, rate-limited delivery of threat alert emails.
+
+Sending one alert used to mean: spawn a thread, load every user, then for each
+one open a fresh SMTP_SSL connection, log in, send, disconnect. With thousands
+of subscribers a storm took minutes. AlertMailer instead:
+
+- keeps a small pool of authenticated SMTP sessions (one per worker task),
+  reused across messages and batches; idle sessions are closed after a while
+  and dropped connections are re-opened transparently,
+- sends concurrently (pool_size in flight) behind a shared token-bucket rate
+  limit, so the provider's sending limits are respected,
+- retries transient failures (4xx, disconnects, timeouts) with exponential
+  backoff; permanent 5xx rejections are not retried,
+- reports throughput per batch and overall (/api/metrics/alerts).
+
+smtplib is blocking, so each send runs in a worker thread; the event loop is
+never blocked. Configuration (environment):
+    ALERT_SMTP_HOST / ALERT_SMTP_PORT   default smtp.gmail.com:465
+    ALERT_SMTP_SECURITY                 "ssl" (default), "starttls" or "none"
+    ALERT_SMTP_POOL                     concurrent sessions (default 4)
+    ALERT_RATE_PER_SEC                  messages per second (default 10)
+Credentials are EMAIL_USER / EMAIL_PASS (see brownie_auth.routes). Pointing
+ALERT_SMTP_HOST at a local stand-in (e.g. `python -m aiosmtpd -n -l
+localhost:8025` with ALERT_SMTP_SECURITY=none) works without credentials.
+"""
+
+import asyncio
+import os
+import random
+import smtplib
+import ssl
+import time
+from collections import deque
+from brownie_auth.routes import EMAIL_USER, EMAIL_PASS, GMAIL_SMTP_SERVER, GMAIL_SMTP_PORT, build_alert_message
+
+
+class SMTPSession:
+    """One persistent (optionally authenticated) SMTP connection. Blocking API."""
+
+    def __init__(self, host, port, security="ssl", username="", password="", timeout=30.0):
+        self.host = host
+        self.port = port
+        self.security = security
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.server = None
+        self.connects = 0
+
+    def connect(self):
+        if self.security == "ssl":
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                      context=ssl.create_default_context())
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == "starttls":
+                server.starttls(context=ssl.create_default_context())
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        self.server = server
+        self.connects += 1
+
+    def send(self, msg):
+        if self.server is None:
+            self.connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped our idle session: reconnect once and resend
+            self.close()
+            self.connect()
+            self.server.send_message(msg)
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
+
+class RateLimiter:
+    """Token bucket shared by all senders: `rate` messages/sec, bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return  # Unlimited
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def is_transient(error):
+    """Worth retrying? 4xx replies, dropped connections and network errors are."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+
+class AlertMailer:
+    def __init__(self, host, port, security="ssl", username="", password="", sender="",
+                 pool_size=4, rate_per_sec=10.0, max_retries=3, backoff=2.0,
+                 idle_timeout=60.0, enabled=True):
+        self.session_args = dict(host=host, port=port, security=security,
+                                 username=username, password=password)
+        self.sender = sender
+        self.pool_size = pool_size
+        self.limiter = RateLimiter(rate_per_sec)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.enabled = enabled  # False = console mode (nothing configured)
+
+        self.queue = None
+        self._workers = []
+        self._sessions = []
+        self._batch_ids = 0
+        self.batches = deque(maxlen=20)  # Most recent batch records, newest last
+        self.stats = {
+            "enqueued": 0, "sent": 0, "failed": 0, "retried": 0, "skipped": 0,
+            "send_seconds": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        host = os.getenv("ALERT_SMTP_HOST")
+        return cls(
+            host=host or GMAIL_SMTP_SERVER,
+            port=int(os.getenv("ALERT_SMTP_PORT", str(GMAIL_SMTP_PORT))),
+            security=os.getenv("ALERT_SMTP_SECURITY", "ssl").lower(),
+            username=EMAIL_USER,
+            password=EMAIL_PASS,
+            sender=EMAIL_USER or "alerts@helios-watch.local",
+            pool_size=int(os.getenv("ALERT_SMTP_POOL", "4")),
+            rate_per_sec=float(os.getenv("ALERT_RATE_PER_SEC", "10")),
+            # Gmail needs credentials; an explicit host (local relay/stand-in) may not
+            enabled=bool(host) or bool(EMAIL_USER and EMAIL_PASS),
+        )
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.pool_size)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await asyncio.gather(*(asyncio.to_thread(s.close) for s in self._sessions))
+        self._sessions = []
+
+    def send_batch(self, recipients, alert_data):
+        """
+        Queues one alert for every recipient and returns the batch record
+        (updated in place as messages go out). Never blocks.
+        """
+        self._batch_ids += 1
+        batch = {
+            "id": self._batch_ids, "status": alert_data.get("status"), "total": 0,
+            "sent": 0, "failed": 0, "started": time.time(), "finished": None,
+        }
+        self.batches.append(batch)
+
+        if not self.enabled:
+            batch["total"] = sum(1 for _ in recipients)
+            batch["finished"] = time.time()
+            self.stats["skipped"] += batch["total"]
+            print(f"DEBUG: {batch['total']} alert(s) skipped (Console Mode - No SMTP Configured)")
+            return batch
+        if self.queue is None:
+            raise RuntimeError("AlertMailer.start() has not been called")
+
+        for email in recipients:
+            batch["total"] += 1
+            self.queue.put_nowait((batch, email, alert_data, 0))
+        self.stats["enqueued"] += batch["total"]
+        if batch["total"] == 0:
+            batch["finished"] = time.time()
+        return batch
+
+    async def _worker(self):
+        session = SMTPSession(**self.session_args)
+        self._sessions.append(session)
+        while True:
+            try:
+                job = await asyncio.wait_for(self.queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(session.close)  # Don't hold idle logins open
+                continue
+            await self._deliver(session, *job)
+
+    async def _deliver(self, session, batch, email, alert_data, attempt):
+        await self.limiter.acquire()
+        msg = build_alert_message(email, alert_data)
+        msg.replace_header("From", self.sender)
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(session.send, msg)
+        except Exception as e:
+            if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                # Broken connection; a rejected message leaves the session usable
+                await asyncio.to_thread(session.close)
+            if attempt < self.max_retries and is_transient(e):
+                self.stats["retried"] += 1
+                delay = self.backoff * 2 ** attempt
+                # Re-queued later instead of sleeping here: the session keeps working
+                asyncio.get_running_loop().call_later(
+                    delay + random.uniform(0, delay / 2),
+                    self.queue.put_nowait, (batch, email, alert_data, attempt + 1)
+                )
+                return
+            self.stats["failed"] += 1
+            batch["failed"] += 1
+            print(f"❌ Alert to {email} failed: {e}")
+        else:
+            self.stats["sent"] += 1
+            batch["sent"] += 1
+        finally:
+            self.stats["send_seconds"] += time.perf_counter() - started
+
+        if batch["sent"] + batch["failed"] == batch["total"]:
+            batch["finished"] = time.time()
+            print(f"✔ Alert batch {batch['id']}: {batch['sent']}/{batch['total']} sent in {batch['finished'] - batch['started']:.1f}s")
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        attempts = stats["sent"] + stats["failed"] + stats["retried"]
+        stats["avg_send_ms"] = round(1000 * stats["send_seconds"] / attempts, 2) if attempts else None
+        stats["queued"] = self.queue.qsize() if self.queue is not None else 0
+        stats["connects"] = sum(session.connects for session in self._sessions)
+        stats["pool_size"] = self.pool_size
+        stats["rate_per_sec"] = self.limiter.rate
+        stats["enabled"] = self.enabled
+
+        batches = []
+        for batch in self.batches:
+            elapsed = (batch["finished"] or time.time()) - batch["started"]
+            done = batch["sent"] + batch["failed"]
+            batches.append({**batch, "per_second": round(done / elapsed, 2) if elapsed > 0 else None})
+        stats["batches"] = batches
+        return stats
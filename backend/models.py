@@ -1,11 +1,13 @@
 """
 Database Models - SQLAlchemy ORM Models
 
-Defines the User model with OTP support for session-based authentication.
+Defines the User model with OTP support for session-based authentication,
+plus alert preferences/state, the time-series archive and the lease table
+used for leader election.
 """
 
 from datetime import datetime, timedelta
-from sqlalchemy import Column, String, DateTime, Integer, create_engine
+from sqlalchemy import Column, String, DateTime, Integer, Float, Boolean, ForeignKey, Index, UniqueConstraint, create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 import secrets
@@ -19,6 +21,15 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if "sqlite" in DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL: the archive writer never blocks readers (API queries, logins)
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 Base = declarative_base()
 
 
@@ -52,6 +63,90 @@ class LoginHistory(Base):
     ip_address = Column(String, nullable=True)
 
 
+class AlertPreference(Base):
+    """Per-user alert opt-in: which threat types, from which severity up (see subscribers.py)."""
+    __tablename__ = "alert_preferences"
+    __table_args__ = (
+        UniqueConstraint("user_id", "threat_type"),
+        # Fan-out looks up one threat type at a time
+        Index("ix_alert_preferences_threat", "threat_type", "user_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    threat_type = Column(String, nullable=False)  # "flux", "wind", "kp", "proton"
+    min_severity = Column(Integer, nullable=False, default=1)  # 1 (watch) .. 5 (extreme)
+    enabled = Column(Boolean, nullable=False, default=True)
+
+
+class AlertState(Base):
+    """Persisted alert state machine per threat type (alerts.py), so restarts don't re-alert."""
+    __tablename__ = "alert_states"
+
+    key = Column(String, primary_key=True)  # "<stream>:<threat_type>", e.g. "live:flux"
+    level = Column(Integer, nullable=False, default=0)  # 0 = clear, else alerted severity
+    status = Column(String, nullable=True)  # Engine status when opened/escalated
+    value = Column(Float, nullable=True)  # Peak observed value of the incident
+    opened_at = Column(Float, nullable=True)  # Epoch seconds
+    clear_since = Column(Float, nullable=True)  # Epoch seconds the threat has been quiet since
+
+
+class SeriesSample(Base):
+    """Archived samples of every channel (archive.py), one row per (channel, time)."""
+    __tablename__ = "series_samples"
+    __table_args__ = {"sqlite_with_rowid": False}  # Clustered on the primary key
+
+    channel = Column(String, primary_key=True)  # "flux", "wind", "kp", "proton"
+    t = Column(Integer, primary_key=True)  # Epoch seconds (UTC)
+    value = Column(Float, nullable=False)
+
+
+class SeriesRollup(Base):
+    """Per-bucket aggregates of series_samples (1m / 5m / 1h), kept up to date by archive.py."""
+    __tablename__ = "series_rollups"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    channel = Column(String, primary_key=True)
+    resolution = Column(Integer, primary_key=True)  # Bucket width in seconds
+    t = Column(Integer, primary_key=True)  # Bucket start, epoch seconds
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+    sum = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+
+
+class SeriesStat(Base):
+    """Hourly/daily event counters per channel (flares per class, Kp histogram), see archive.py."""
+    __tablename__ = "series_stats"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    channel = Column(String, primary_key=True)
+    resolution = Column(Integer, primary_key=True)  # 3600 or 86400
+    t = Column(Integer, primary_key=True)  # Bucket start, epoch seconds
+    key = Column(String, primary_key=True)  # e.g. "flare_M", "kp_7"
+    count = Column(Integer, nullable=False)
+
+
+class RegionObservation(Base):
+    """Archived active sunspot regions, one row per region per observation day."""
+    __tablename__ = "region_observations"
+
+    observed_date = Column(String, primary_key=True)  # YYYY-MM-DD
+    region_number = Column(Integer, primary_key=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    class_type = Column(String, nullable=True)
+
+
+class LeaderLease(Base):
+    """Time-bounded lease naming the one process that runs a singleton job (leader.py)."""
+    __tablename__ = "leader_leases"
+
+    name = Column(String, primary_key=True)  # e.g. "noaa-fetcher"
+    holder = Column(String, nullable=False)  # host:pid:token of the current leader
+    expires_at = Column(DateTime, nullable=False)  # UTC; anyone may take over after this
+
+
 # Create tables if they don't exist (Persistence Enabled)
 # Base.metadata.drop_all(bind=engine) # DISABLED: To preserve users/history
 Base.metadata.create_all(bind=engine)
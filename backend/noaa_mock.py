@@ -0,0 +1,422 @@
+"""
+NOAA Stand-in - The SWPC feeds fetcher.py polls, served locally.
+
+For offline runs and benchmarks (loadtest.py, fetchbench.py): point the app
+at it with NOAA_BASE_URL=http://127.0.0.1:8090. It serves the same paths and
+JSON shapes as services.swpc.noaa.gov, from either:
+
+- synthetic quiet-Sun data ending now (3 days, 7 for Kp), generated at
+  startup; --now freezes the clock so every run serves the same bytes,
+- recorded fixtures: --record DIR downloads every feed once from NOAA into
+  DIR/<feed path>, --fixtures DIR serves them back (--shift moves the time
+  tags so the newest sample is now, for the app's history windows).
+
+Like NOAA it sends ETag / Last-Modified and answers conditional GETs with 304.
+Faults are injected per feed (fetcher.FEEDS names) or for all ("*"), from the
+command line or at runtime (GET/PUT/DELETE /__mock__/faults):
+
+- latency_ms, jitter_ms: delay before answering,
+- error_rate, error_status: that share of requests fails (default 503),
+- malformed_rate: that share gets a truncated JSON body,
+- not_modified: "auto" (honour validators), "never" (always 200 + body),
+  "always" (304 even without validators, as a misbehaving cache would),
+- payload_scale: N time-shifted copies of the feed (large payloads).
+
+Random faults come from one seeded generator, so a sequential run is
+reproducible. GET /__mock__/stats counts requests and statuses per feed.
+
+    python noaa_mock.py [--port 8090] [--fixtures DIR --shift] [--error-rate 0.2 --latency-ms 300]
+    python noaa_mock.py --record DIR
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+from wire import orjson
+
+XRAY_PATH = "json/goes/primary/xrays-3-day.json"
+PLASMA_5MIN_PATH = "products/solar-wind/plasma-5-minute.json"
+PLASMA_3DAY_PATH = "products/solar-wind/plasma-3-day.json"
+KP_PATH = "products/noaa-planetary-k-index.json"
+PROTON_1DAY_PATH = "json/goes/primary/integral-protons-1-day.json"
+PROTON_3DAY_PATH = "json/goes/primary/integral-protons-3-day.json"
+REGIONS_PATH = "json/solar_regions.json"
+
+# fetcher.FEEDS name -> path (fault rules and stats are per feed)
+FEED_PATHS = {
+    "xray": XRAY_PATH, "plasma": PLASMA_5MIN_PATH, "wind_history": PLASMA_3DAY_PATH, "kp": KP_PATH,
+    "proton": PROTON_1DAY_PATH, "proton_history": PROTON_3DAY_PATH, "regions": REGIONS_PATH,
+}
+PATH_FEEDS = {path: name for name, path in FEED_PATHS.items()}
+NOAA_SWPC_URL = "https://services.swpc.noaa.gov"
+
+# time_tag formats in the feeds ("%f" ones are written with milliseconds)
+TAG_FORMATS = ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d")
+
+encode = orjson.dumps if orjson is not None else lambda data: json.dumps(data).encode()
+
+
+def _tags(start, count, step, fmt):
+    return [(start + step * i).strftime(fmt) for i in range(count)]
+
+
+def synthetic_feeds(now=None, seed=0):
+    """{path: JSON-ready data} for every feed, newest sample at `now`."""
+    now = (now or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+    rng = np.random.default_rng(seed)
+    minutes = 3 * 1440
+    start = now - timedelta(minutes=minutes - 1)
+
+    xray_tags = _tags(start, minutes, timedelta(minutes=1), "%Y-%m-%dT%H:%M:%SZ")
+    long_flux = 1e-6 * np.exp(0.2 * rng.standard_normal(minutes))
+    xray = []
+    for tag, flux in zip(xray_tags, long_flux.tolist()):
+        xray.append({"time_tag": tag, "satellite": 16, "flux": flux * 0.05, "energy": "0.05-0.4nm"})
+        xray.append({"time_tag": tag, "satellite": 16, "flux": flux, "energy": "0.1-0.8nm"})
+
+    plasma = [["time_tag", "density", "speed", "temperature"]]
+    speeds = 420 + 30 * rng.standard_normal(minutes)
+    for tag, speed in zip(_tags(start, minutes, timedelta(minutes=1), "%Y-%m-%d %H:%M:%S.000"), speeds.tolist()):
+        plasma.append([tag, "5.10", f"{speed:.1f}", "98000"])
+
+    kp_bins = 7 * 8
+    kp_start = now.replace(hour=now.hour // 3 * 3, minute=0) - timedelta(hours=3 * (kp_bins - 1))
+    kp = [["time_tag", "Kp", "a_running", "station_count"]]
+    for tag, value in zip(_tags(kp_start, kp_bins, timedelta(hours=3), "%Y-%m-%d %H:%M:%S.000"),
+                          np.clip(np.round(2 + rng.standard_normal(kp_bins), 2), 0, 9).tolist()):
+        kp.append([tag, f"{value:.2f}", "7", "8"])
+
+    proton_samples = minutes // 5
+    protons = []
+    for tag, flux in zip(_tags(start, proton_samples, timedelta(minutes=5), "%Y-%m-%dT%H:%M:%SZ"),
+                         (0.4 * np.exp(0.1 * rng.standard_normal(proton_samples))).tolist()):
+        for energy, scale in ((">=1 MeV", 10.0), (">=10 MeV", 1.0), (">=100 MeV", 0.1)):
+            protons.append({"time_tag": tag, "satellite": 18, "flux": flux * scale, "energy": energy})
+
+    today = now.strftime("%Y-%m-%d")
+    regions = [
+        {"observed_date": today, "observed_region_number": 3800 + i, "latitude": lat, "longitude": lon,
+         "magnetic_class": cls}
+        for i, (lat, lon, cls) in enumerate([(-18, 30, "Beta-Gamma-Delta"), (12, -45, "Beta"), (-7, 62, "Alpha")])
+    ]
+
+    return {
+        XRAY_PATH: xray,
+        PLASMA_3DAY_PATH: plasma,
+        PLASMA_5MIN_PATH: [plasma[0]] + plasma[-5:],
+        KP_PATH: kp,
+        PROTON_3DAY_PATH: protons,
+        PROTON_1DAY_PATH: protons[-3 * 288:],
+        REGIONS_PATH: regions,
+    }
+
+
+# --- FIXTURES ---
+
+def load_fixtures(directory):
+    """{path: data} from DIR/<feed path>; feeds without a file fall back to synthetic data."""
+    feeds, missing = {}, []
+    for path in FEED_PATHS.values():
+        file = os.path.join(directory, path)
+        if os.path.exists(file):
+            with open(file, "rb") as f:
+                feeds[path] = json.loads(f.read())
+        else:
+            missing.append(path)
+    if missing:
+        print(f"[WARN] No fixture for {', '.join(missing)}; serving synthetic data")
+        synthetic = synthetic_feeds()
+        feeds.update({path: synthetic[path] for path in missing})
+    return feeds
+
+
+def record_fixtures(directory, base_url=NOAA_SWPC_URL, timeout=30.0):
+    """Downloads every feed once into DIR/<feed path>, as served. Returns {path: bytes}."""
+    import httpx
+
+    sizes = {}
+    with httpx.Client(timeout=timeout, headers={"User-Agent": "Helios-Watch/1.0"}) as client:
+        for path in FEED_PATHS.values():
+            r = client.get(f"{base_url.rstrip('/')}/{path}")
+            r.raise_for_status()
+            r.json()  # Refuse to record an unreadable body
+            file = os.path.join(directory, path)
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            with open(file, "wb") as f:
+                f.write(r.content)
+            sizes[path] = len(r.content)
+    return sizes
+
+
+def _parse_tag(tag):
+    for fmt in TAG_FORMATS:
+        try:
+            return datetime.strptime(tag, fmt).replace(tzinfo=timezone.utc), fmt
+        except (TypeError, ValueError):
+            continue
+    return None, None
+
+
+def _format_tag(t, fmt):
+    text = t.strftime(fmt)
+    return text[:-3] if fmt.endswith("%f") else text
+
+
+def _shift_rows(data, delta):
+    """A copy of one feed with every time tag moved by `delta` (timedelta)."""
+    rows = []
+    for row in data:
+        if isinstance(row, dict):
+            row = dict(row)
+            for key in ("time_tag", "observed_date"):
+                t, fmt = _parse_tag(row.get(key))
+                if t is not None:
+                    row[key] = _format_tag(t + delta, fmt)
+        elif isinstance(row, list) and row:
+            t, fmt = _parse_tag(row[0])
+            if t is not None:  # The header row has no time
+                row = [_format_tag(t + delta, fmt)] + row[1:]
+        rows.append(row)
+    return rows
+
+
+def _time_range(data):
+    times = []
+    for row in data:
+        tag = (row.get("time_tag") or row.get("observed_date")) if isinstance(row, dict) else (row[0] if row else None)
+        t, _ = _parse_tag(tag)
+        if t is not None:
+            times.append(t)
+    return (min(times), max(times)) if times else (None, None)
+
+
+def shift_to_now(feeds, now=None):
+    """
+    Recorded feeds moved in time so the newest sample of any feed is `now`
+    (minute). One offset for all, so the feeds stay aligned with each other.
+    """
+    now = (now or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+    newest = [_time_range(data)[1] for data in feeds.values()]
+    newest = max((t for t in newest if t is not None), default=None)
+    if newest is None:
+        return feeds
+    return {path: _shift_rows(data, now - newest) for path, data in feeds.items()}
+
+
+def scale_feed(data, scale):
+    """`scale` back-to-back copies of a feed, oldest first: a large payload with the same shape."""
+    oldest, newest = _time_range(data)
+    if scale <= 1 or oldest is None:
+        return data
+    header = data[:1] if isinstance(data[0], list) and _parse_tag(data[0][0])[0] is None else []
+    rows = data[len(header):]
+    span = max(newest - oldest, timedelta(days=1)) + timedelta(minutes=1)
+    scaled = list(header)
+    for k in range(scale - 1, 0, -1):
+        scaled.extend(_shift_rows(rows, -span * k))
+    scaled.extend(rows)
+    return scaled
+
+
+# --- FAULT INJECTION ---
+
+class FeedFaults:
+    """Fault rules: "*" for every feed, overridden field by field per feed name."""
+
+    DEFAULTS = {
+        "latency_ms": 0.0, "jitter_ms": 0.0, "error_rate": 0.0, "error_status": 503,
+        "malformed_rate": 0.0, "not_modified": "auto", "payload_scale": 1,
+    }
+    NOT_MODIFIED_MODES = ("auto", "never", "always")
+
+    def __init__(self, seed=0, **defaults):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.rules = {"*": dict(self.DEFAULTS)}
+        self.set("*", **defaults)
+
+    def set(self, feed="*", **values):
+        """Raises ValueError for an unknown feed, field or mode."""
+        if feed != "*" and feed not in FEED_PATHS:
+            raise ValueError(f"Unknown feed: {feed}")
+        unknown = set(values) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown fault: {', '.join(sorted(unknown))}")
+        if values.get("not_modified", "auto") not in self.NOT_MODIFIED_MODES:
+            raise ValueError(f"not_modified must be one of {', '.join(self.NOT_MODIFIED_MODES)}")
+        if values.get("payload_scale", 1) < 1:
+            raise ValueError("payload_scale must be at least 1")
+        self.rules.setdefault(feed, {}).update(values)
+
+    def reset(self, seed=None):
+        self.__init__(self.seed if seed is None else seed)
+
+    def get(self, feed):
+        return {**self.rules["*"], **self.rules.get(feed, {})}
+
+    def chance(self, rate):
+        return rate > 0 and self.rng.random() < rate
+
+    def delay(self, rule):
+        return (rule["latency_ms"] + self.rng.uniform(0, rule["jitter_ms"])) / 1000.0
+
+
+class FaultRequest(BaseModel):
+    feed: str = "*"
+    latency_ms: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    error_rate: Optional[float] = None
+    error_status: Optional[int] = None
+    malformed_rate: Optional[float] = None
+    not_modified: Optional[str] = None
+    payload_scale: Optional[int] = None
+
+
+class FeedBodies:
+    """Encoded bodies and validators per (path, payload_scale), built once each."""
+
+    def __init__(self, feeds):
+        self.feeds = feeds
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self._bodies = {}
+
+    def get(self, path, scale=1):
+        key = (path, scale)
+        if key not in self._bodies:
+            body = encode(scale_feed(self.feeds[path], scale))
+            etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+            self._bodies[key] = (body, etag)
+        return self._bodies[key]
+
+    def not_modified(self, request, etag):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        since = request.headers.get("if-modified-since")
+        if since is not None:
+            try:
+                return self.last_modified <= parsedate_to_datetime(since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def create_app(feeds=None, faults=None):
+    """The stand-in app; app.state.faults / app.state.stats are the live fault rules and counters."""
+    # Encoded once: the stand-in should never be the slow side of a benchmark
+    bodies = FeedBodies(feeds or synthetic_feeds())
+    faults = faults or FeedFaults()
+    stats = {}
+    app = FastAPI(title="NOAA SWPC stand-in")
+    app.state.faults, app.state.stats = faults, stats
+
+    @app.get("/__mock__/faults")
+    async def get_faults():
+        return {"seed": faults.seed, "rules": faults.rules}
+
+    @app.put("/__mock__/faults")
+    async def set_faults(req: FaultRequest):
+        values = {key: value for key, value in req.model_dump().items() if key != "feed" and value is not None}
+        try:
+            faults.set(req.feed, **values)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"seed": faults.seed, "rules": faults.rules}
+
+    @app.delete("/__mock__/faults")
+    async def reset_faults(seed: Optional[int] = None):
+        faults.reset(seed)
+        return {"seed": faults.seed, "rules": faults.rules}
+
+    @app.get("/__mock__/stats")
+    async def get_stats():
+        return stats
+
+    @app.delete("/__mock__/stats")
+    async def reset_stats():
+        stats.clear()
+        return stats
+
+    @app.get("/{path:path}")
+    async def feed(path: str, request: Request):
+        name = PATH_FEEDS.get(path)
+        if name is None or path not in bodies.feeds:
+            raise HTTPException(status_code=404, detail=f"No such feed: {path}")
+        rule = faults.get(name)
+        counts = stats.setdefault(name, {"requests": 0, "bytes": 0})
+        counts["requests"] += 1
+
+        delay = faults.delay(rule)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        status, body, headers = 200, b"", {}
+        if faults.chance(rule["error_rate"]):
+            status = rule["error_status"]
+        else:
+            body, etag = bodies.get(path, rule["payload_scale"])
+            headers = {"ETag": etag, "Last-Modified": format_datetime(bodies.last_modified, usegmt=True)}
+            mode = rule["not_modified"]
+            if mode == "always" or (mode == "auto" and bodies.not_modified(request, etag)):
+                status, body = 304, b""
+            elif faults.chance(rule["malformed_rate"]):
+                body = body[:len(body) // 2]  # Cut off mid-document, as a dropped connection would
+
+        counts[str(status)] = counts.get(str(status), 0) + 1
+        counts["bytes"] += len(body)
+        if status == 304:
+            return Response(status_code=304, headers=headers)
+        return Response(body, status_code=status, media_type="application/json", headers=headers)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--fixtures", default=os.getenv("NOAA_FIXTURES_DIR"), help="recorded feeds to serve")
+    parser.add_argument("--shift", action="store_true", help="move fixture time tags so the newest is now")
+    parser.add_argument("--record", metavar="DIR", help="download every NOAA feed into DIR and exit")
+    parser.add_argument("--record-from", default=NOAA_SWPC_URL)
+    parser.add_argument("--now", help="synthetic data ends at this ISO time (default: now)")
+    parser.add_argument("--seed", type=int, default=0, help="synthetic data and fault generator seed")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--not-modified", choices=FeedFaults.NOT_MODIFIED_MODES, default="auto")
+    parser.add_argument("--payload-scale", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.record:
+        for path, size in record_fixtures(args.record, args.record_from).items():
+            print(f"{path}: {size} bytes")
+        raise SystemExit(0)
+
+    if args.fixtures:
+        feeds = load_fixtures(args.fixtures)
+        if args.shift:
+            feeds = shift_to_now(feeds)
+    else:
+        now = datetime.fromisoformat(args.now).replace(tzinfo=timezone.utc) if args.now else None
+        feeds = synthetic_feeds(now, seed=args.seed)
+    faults = FeedFaults(
+        args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        error_status=args.error_status, malformed_rate=args.malformed_rate, not_modified=args.not_modified,
+        payload_scale=args.payload_scale,
+    )
+    uvicorn.run(create_app(feeds, faults), host=args.host, port=args.port, log_level="warning")
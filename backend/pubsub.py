@@ -0,0 +1,112 @@
+"""
+Pub/Sub - Cross-worker fan-out for broadcasts, simulations and snapshots.
+
+With a single uvicorn worker everything can live in module globals, but with
+N workers (or N hosts) a POST /simulate or a NOAA update must reach every
+worker's WebSocket clients. app.py talks to a bus instead:
+
+- "broadcast": WSMessages; every worker relays them to its local BroadcastHub.
+- "simulate": /simulate requests; consumed by the fetcher process only.
+- "replay": /api/replay start/stop requests; also fetcher only (replay.py).
+- "snapshot": the fetcher's NOAA snapshot; followers serve connects from it.
+
+Backends (HELIOS_PUBSUB_URL):
+- memory://            in-process (single worker, the default)
+- redis://host:6379/0  Redis pub/sub (optional `redis` package); a local
+  redis-server, or unix:///path/to/redis.sock, is enough as a stand-in.
+"""
+
+import asyncio
+import json
+from collections import defaultdict
+
+
+class Subscription:
+    """Async iterator over one channel's messages (dicts)."""
+
+    def __init__(self, queue, on_close):
+        self._queue = queue
+        self._on_close = on_close
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
+    async def close(self):
+        await self._on_close()
+
+
+class InProcessPubSub:
+    """Single-process bus: publish() hands the dict straight to subscriber queues."""
+
+    is_local = True
+
+    def __init__(self):
+        self._queues = defaultdict(set)  # channel -> {asyncio.Queue}
+
+    async def publish(self, channel, data):
+        for queue in list(self._queues[channel]):
+            queue.put_nowait(data)
+
+    async def subscribe(self, channel):
+        # Registered immediately: nothing published after this call is missed
+        queue = asyncio.Queue()
+        self._queues[channel].add(queue)
+
+        async def unsubscribe():
+            self._queues[channel].discard(queue)
+
+        return Subscription(queue, unsubscribe)
+
+    async def close(self):
+        self._queues.clear()
+
+
+class RedisPubSub:
+    """Networked bus over Redis PUBLISH/SUBSCRIBE (JSON-encoded dicts)."""
+
+    is_local = False
+
+    def __init__(self, url, prefix="helios:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("HELIOS_PUBSUB_URL uses Redis but the 'redis' package is not installed")
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def publish(self, channel, data):
+        await self.redis.publish(self.prefix + channel, json.dumps(data))
+
+    async def subscribe(self, channel):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.prefix + channel)
+        queue = asyncio.Queue()
+
+        async def pump():
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    queue.put_nowait(json.loads(message["data"]))
+
+        task = asyncio.create_task(pump())
+
+        async def unsubscribe():
+            task.cancel()
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+        return Subscription(queue, unsubscribe)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_pubsub(url):
+    """Bus for a HELIOS_PUBSUB_URL (memory:// or redis:// / rediss:// / unix://)."""
+    if not url or url.startswith("memory://"):
+        return InProcessPubSub()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisPubSub(url)
+    raise ValueError(f"Unsupported HELIOS_PUBSUB_URL: {url}")
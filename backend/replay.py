@@ -0,0 +1,208 @@
+"""
+Event Replay - Historical storms streamed over /ws at 1x-10000x.
+
+The dashboard's Event Replay used to be random-noise Gaussians built in the
+browser (HistoricalData.ts). ReplayEngine plays a dataset on the server
+instead, sample by sample in time order, through the same path as live data:
+HybridEngine (stream "replay") -> AlertTracker -> announce() -> every worker's
+BroadcastHub. A replay is deterministic (same dataset and speed, same frames
+and alerts), which makes it a realistic high-rate load for clients and alerting.
+
+Datasets:
+- archived: any [from, to] range of the time-series archive (archive.py),
+- bundled: the README's famous storms (EVENTS), rebuilt from their published
+  peaks (GOES class, solar wind, Kp, proton flux) with the usual shapes:
+  impulsive flare rise and exponential decay, protons rising over hours, the
+  CME shock arriving a day or two later (wind jump, Kp steps). There are no
+  instrument records for 1859 and the others are not shipped, so these are
+  models with realistic timing and magnitudes, not measurements.
+
+speed: dataset seconds per wall second. The samples due in one tick go out
+together, so 10000x of a 1-minute dataset is ~170 flux frames per second
+instead of a sleep per sample.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+import numpy as np
+from archive import archive
+from timeseries import epoch_to_iso
+
+MIN_SPEED, MAX_SPEED = 1, 10000
+CHANNELS = ("flux", "wind", "kp", "proton")
+TELEMETRY_KEYS = {"wind": "wind_speed", "kp": "kp_index", "proton": "proton_flux"}
+
+
+class ReplayDataset:
+    """(times, values) columns per channel: epoch seconds, oldest first."""
+
+    def __init__(self, name, channels, title=None):
+        self.name = name
+        self.title = title or name
+        self.channels = {
+            channel: (np.asarray(times, dtype=np.int64), np.asarray(values, dtype=np.float64))
+            for channel, (times, values) in channels.items() if len(times)
+        }
+
+    def __len__(self):
+        return sum(len(times) for times, _ in self.channels.values())
+
+    def merged(self):
+        """(channel names, times, channel index, values): every channel in one time-ordered stream."""
+        names = list(self.channels)
+        times = np.concatenate([self.channels[name][0] for name in names])
+        values = np.concatenate([self.channels[name][1] for name in names])
+        which = np.concatenate([np.full(len(self.channels[name][0]), i) for i, name in enumerate(names)])
+        order = np.argsort(times, kind="stable")
+        return names, times[order], which[order], values[order]
+
+
+def archived_dataset(t_from, t_to):
+    """Every archived channel between t_from and t_to. Blocking."""
+    channels = {channel: archive.query(channel, t_from, t_to) for channel in CHANNELS}
+    name = f"archive:{t_from}-{t_to}"
+    return ReplayDataset(name, channels, title=f"Archive {epoch_to_iso([t_from])[0]} - {epoch_to_iso([t_to])[0]}")
+
+
+# --- BUNDLED EVENTS ---
+# onset: flare start (UTC); transit: hours until the CME shock reaches L1
+EVENTS = {
+    "carrington": {
+        "title": "The Carrington Event", "onset": "1859-09-01T11:15:00",
+        "flux": 4.5e-3, "wind": 2400, "kp": 9.0, "proton": 5e4, "transit": 17.6,
+    },
+    "quebec": {
+        "title": "Quebec Blackout", "onset": "1989-03-10T19:00:00",
+        "flux": 4.5e-4, "wind": 985, "kp": 9.0, "proton": 3.5e3, "transit": 54.0,
+    },
+    "bastille": {
+        "title": "Bastille Day Event", "onset": "2000-07-14T10:03:00",
+        "flux": 5.7e-4, "wind": 1100, "kp": 9.0, "proton": 2.4e4, "transit": 28.0,
+    },
+    "halloween": {
+        "title": "Halloween Storms of 2003", "onset": "2003-10-28T09:51:00",
+        "flux": 1.72e-3, "wind": 2000, "kp": 9.0, "proton": 2.95e4, "transit": 19.0,
+    },
+    "may2024": {
+        "title": "May 2024 (Gannon) Storm", "onset": "2024-05-09T08:45:00",
+        "flux": 2.2e-4, "wind": 950, "kp": 9.0, "proton": 2.1e2, "transit": 32.0,
+    },
+}
+
+
+def storm_dataset(name, lead=6 * 3600, tail=36 * 3600):
+    """One bundled event, 1-minute flux/wind, 5-minute protons, 3-hourly Kp."""
+    event = EVENTS[name]
+    onset = int(datetime.fromisoformat(event["onset"]).replace(tzinfo=timezone.utc).timestamp())
+    arrival = onset + int(event["transit"] * 3600)
+    start, end = onset - lead, arrival + tail
+    # Seeded noise: replays of the same event are identical
+    rng = np.random.default_rng(sum(map(ord, name)))
+
+    t = np.arange(start, end, 60, dtype=np.int64)
+    minutes = (t - onset) / 60.0
+    # 12-minute impulsive rise, ~45-minute e-folding decay over a C-level background
+    flare = np.where(minutes < 0, 0.0, np.where(minutes < 12, minutes / 12, np.exp(-(minutes - 12) / 45)))
+    flux = 2e-6 * (1 + 0.01 * rng.standard_normal(len(t))) + event["flux"] * flare
+
+    # Shock: jump to the peak over 30 minutes, relax over a day
+    hours = (t - arrival) / 3600.0
+    shock = np.where(hours < 0, 0.0, np.where(hours < 0.5, hours / 0.5, np.exp(-(hours - 0.5) / 24)))
+    wind = (400 + (event["wind"] - 400) * shock) * (1 + 0.02 * rng.standard_normal(len(t)))
+
+    # Protons: onset ~30 minutes after the flare, log-linear rise over 6 hours
+    tp = t[::5]
+    hours = (tp - onset) / 3600.0 - 0.5
+    rise = np.clip(hours / 6, 0, 1)
+    decay = np.where(hours > 6, np.exp(-(hours - 6) / 24), 1.0)
+    proton = np.where(hours < 0, 0.3, 0.3 * (event["proton"] / 0.3) ** rise * decay)
+
+    # Kp: 3-hour bins, main phase for 9 hours after the arrival, in thirds (5-, 5o, 5+)
+    tk = np.arange(start // 10800 * 10800, end, 10800, dtype=np.int64)
+    hours = (tk - arrival) / 3600.0
+    storm = np.where(hours < -3, 0.0, np.where(hours < 9, 1.0, np.exp(-(hours - 9) / 12)))
+    kp = np.clip(np.round((2 + (event["kp"] - 2) * storm) * 3) / 3, 0, 9)
+
+    return ReplayDataset(name, {"flux": (t, flux), "wind": (t, wind), "proton": (tp, proton), "kp": (tk, kp)},
+                         title=event["title"])
+
+
+class ReplayEngine:
+    """
+    Plays one dataset at a time. on_samples(dataset, [(channel, t, value), ...])
+    is awaited once per tick with the samples that fell due; on_end(dataset)
+    when the replay finishes or is stopped.
+    """
+
+    def __init__(self, on_samples, on_end, tick=0.1):
+        self.on_samples = on_samples
+        self.on_end = on_end
+        self.tick = tick
+        self.dataset = None
+        self.speed = None
+        self.options = {}
+        self.position = None  # Dataset time of the last sample sent
+        self.sent = 0
+        self.started_at = None
+        self._task = None
+        self.stats = {"started": 0, "completed": 0, "stopped": 0, "samples": 0}
+
+    @property
+    def active(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self, dataset, speed, **options):
+        """Replaces any running replay. options are kept for the callbacks (e.g. send_emails)."""
+        if not MIN_SPEED <= speed <= MAX_SPEED:
+            raise ValueError(f"speed must be between {MIN_SPEED} and {MAX_SPEED}")
+        if not len(dataset):
+            raise ValueError(f"{dataset.name}: no samples to replay")
+        await self.stop()
+        self.dataset, self.speed, self.options = dataset, speed, options
+        self.position, self.sent, self.started_at = None, 0, time.time()
+        self.stats["started"] += 1
+        self._task = asyncio.create_task(self._run(dataset, speed))
+
+    async def stop(self):
+        if not self.active:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.stats["stopped"] += 1
+
+    async def _run(self, dataset, speed):
+        names, times, which, values = dataset.merged()
+        channels = [names[i] for i in which.tolist()]
+        times_list, values_list = times.tolist(), values.tolist()
+        wall_start, i = time.monotonic(), 0
+        try:
+            while i < len(times_list):
+                due = times_list[0] + (time.monotonic() - wall_start) * speed
+                j = int(np.searchsorted(times, due, side="right"))
+                if j > i:
+                    batch = list(zip(channels[i:j], times_list[i:j], values_list[i:j]))
+                    await self.on_samples(dataset, batch)
+                    self.position, self.sent = times_list[j - 1], self.sent + len(batch)
+                    self.stats["samples"] += len(batch)
+                    i = j
+                if i < len(times_list):
+                    # Sleep a tick, or less when the next sample is due sooner
+                    await asyncio.sleep(min(self.tick, max(0.0, (times_list[i] - due) / speed)))
+            self.stats["completed"] += 1
+        finally:
+            await self.on_end(dataset)
+
+    def get_stats(self):
+        status = {**self.stats, "active": self.active}
+        if self.dataset is not None:
+            first = min(times[0] for times, _ in self.dataset.channels.values())
+            last = max(times[-1] for times, _ in self.dataset.channels.values())
+            status.update({
+                "dataset": self.dataset.name, "title": self.dataset.title, "speed": self.speed,
+                "samples_total": len(self.dataset), "samples_sent": self.sent,
+                "position": epoch_to_iso([self.position])[0] if self.position is not None else None,
+                "progress": round((self.position - first) / max(last - first, 1), 4) if self.position is not None else 0.0,
+                "started_at": self.started_at,
+            })
+        return status
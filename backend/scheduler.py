@@ -0,0 +1,161 @@
+"""
+Feed Scheduler - Independent polling loops for the NOAA feeds.
+
+Each feed runs as its own asyncio task with its own cadence, so the minutely
+X-ray and plasma feeds are not held back by (or hold back) the 3-hourly Kp
+index or the daily sunspot regions, and one slow endpoint never delays the
+others. Per job:
+
+- interval + jitter: runs every `interval` seconds, +/- `jitter` so workers and
+  feeds don't hit NOAA in lockstep.
+- timeout: each attempt is cancelled after `timeout` seconds.
+- retries: a failed attempt is retried with exponential backoff (plus jitter).
+- circuit breaker: after `failure_threshold` failed runs in a row the feed is
+  skipped for `reset_timeout` seconds, then one trial run decides whether it
+  closes again. The series keep the last good data meanwhile.
+
+Results are handed to the job's on_result coroutine as soon as they arrive
+(app.py pushes them straight to the broadcast hub).
+"""
+
+import asyncio
+import random
+import time
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half_open after a cool-down."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"  # Let one trial run through
+        return self.state != "open"
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class FeedJob:
+    def __init__(self, name, fetch, on_result, interval, jitter=0.0, timeout=10.0,
+                 retries=2, backoff=1.0, max_backoff=30.0, breaker=None):
+        self.name = name
+        self.fetch = fetch  # async () -> result; raises on failure
+        self.on_result = on_result  # async (result) -> None
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.next_run = 0.0  # time.monotonic(); 0 = as soon as the gate opens
+        self.stats = {
+            "runs": 0, "successes": 0, "failures": 0, "retries": 0, "timeouts": 0,
+            "skipped_open": 0, "last_duration": None, "last_success": None, "last_error": None,
+        }
+
+    def _schedule_next(self):
+        delay = self.interval + random.uniform(-self.jitter, self.jitter)
+        self.next_run = time.monotonic() + max(delay, 0.0)
+
+    async def run_once(self):
+        """One scheduled run: the attempt plus its retries. Returns True on success."""
+        if not self.breaker.allow():
+            self.stats["skipped_open"] += 1
+            return False
+
+        self.stats["runs"] += 1
+        started = time.monotonic()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            try:
+                result = await asyncio.wait_for(self.fetch(), self.timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                self.stats["last_error"] = f"timed out after {self.timeout}s"
+                continue
+            except Exception as e:
+                self.stats["last_error"] = str(e) or type(e).__name__
+                continue
+
+            self.breaker.record_success()
+            self.stats["successes"] += 1
+            self.stats["last_duration"] = round(time.monotonic() - started, 3)
+            self.stats["last_success"] = time.time()
+            try:
+                await self.on_result(result)
+            except Exception as e:
+                print(f"[ERROR] Feed '{self.name}' handler failed: {e}")
+            return True
+
+        self.breaker.record_failure()
+        self.stats["failures"] += 1
+        print(f"[WARN] Feed '{self.name}' failed ({self.stats['last_error']}); circuit {self.breaker.state}")
+        return False
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            "interval": self.interval,
+            "circuit": self.breaker.state,
+            "next_run_in": round(max(self.next_run - time.monotonic(), 0.0), 1),
+        }
+
+
+class FeedScheduler:
+    """
+    Runs every FeedJob concurrently. `gate` (a plain callable) pauses all
+    polling while it returns False, e.g. no clients or not the leader; jobs
+    that fell due meanwhile run as soon as it opens again.
+    """
+
+    def __init__(self, gate=None, idle_poll=1.0):
+        self.jobs = {}
+        self.gate = gate or (lambda: True)
+        self.idle_poll = idle_poll
+        self._tasks = []
+
+    def add(self, job):
+        self.jobs[job.name] = job
+        return job
+
+    async def _loop(self, job):
+        while True:
+            delay = job.next_run - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if not self.gate():
+                await asyncio.sleep(self.idle_poll)
+                continue
+            await job.run_once()
+            job._schedule_next()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get_stats(self):
+        return {name: job.get_stats() for name, job in self.jobs.items()}
@@ -20,6 +20,7 @@ class Alert(BaseModel):
 class WSMessage(BaseModel):
     type: str            # "heartbeat", "data_update", "alert", "telemetry_update"
     payload: dict
+    seq: Optional[int] = None  # Broadcast sequence number (for resume on reconnect)
 
 # 4. Space Weather Telemetry (New)
 class Telemetry(BaseModel):
@@ -1,71 +1,319 @@
-import math
+"""
+Simulator - Synthetic flares and storms, generated lazily with NumPy.
+
+generate_flare used to build one SolarPoint / dict per simulated second in a
+Python loop, and /simulate extended a global list that the heartbeat drained
+with pop(0) (O(n) per pop). A Simulation is now:
+
+- a list of components, overlaid per channel: "flare" (X-ray flux), "wind",
+  "kp", "proton", and "cme" (wind + Kp together). Each has its own start
+  offset, duration and peak, so a flare + CME + proton storm is one request.
+- generated in vectorized chunks only as the heartbeat consumes them (a 24h
+  simulation never holds 86,400 objects), buffered in a deque (O(1) pops).
+- seeded: the same components and seed give the same samples.
+- named: several simulations run at once, each in its own HybridEngine stream
+  and alert tracker, so they never disturb each other's slopes or incidents.
+
+Scenarios (scenarios/*.yaml|json, or inline) describe a whole storm chain
+declaratively: events with start offsets and durations in scenario time
+("20m", "36h", "2d"), a sample cadence and a time compression (scenario
+seconds per wall second). compile_scenario() turns one into a Simulation
+whose steps merge every channel in time order, e.g. flare -> protons within
+minutes -> CME arrival (wind + Kp) a day and a half later, in a minute.
+The bundled scenarios are JSON; YAML files or text also work when PyYAML is
+installed (optional, not in requirements.txt).
+"""
+
+import json
+import os
+import re
+from collections import deque
 from datetime import datetime, timedelta
+import numpy as np
 from schemas import SolarPoint
 
-def generate_flare(class_type: str, duration_seconds: int = 60, event_type: str = "flux"):
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+TICK_SECONDS = 0.3  # Heartbeat period: one step per tick unless compressed
+
+FLARE_PEAKS = {"X": 5e-4, "M": 2e-5, "C": 5e-6}
+
+# channel: (telemetry key or None for flux, baseline, default peak, rise fraction, default noise)
+CHANNELS = {
+    "flux": (None, 1e-7, 1e-4, 0.2, 0.05),  # Fast rise (20%), slow decay
+    "wind": ("wind_speed", 350.0, 1200.0, 0.4, 0.0),  # >800 Critical (boosted for alert testing)
+    "kp": ("kp_index", 2.0, 9.0, 0.4, 0.0),  # >7 Storm
+    "proton": ("proton_flux", 0.5, 2000.0, 0.4, 0.0),  # >100 S2 Storm
+}
+COMPONENT_CHANNELS = {"flare": ("flux",), "wind": ("wind",), "kp": ("kp",), "proton": ("proton",), "cme": ("wind", "kp")}
+EVENT_COMPONENTS = {"flux": "flare", "wind": "wind", "kp": "kp", "proton": "proton"}
+
+
+class Component:
+    """One overlaid event on one channel: triangular rise/decay from `start` for `duration` seconds."""
+
+    def __init__(self, channel, start, duration, peak, noise):
+        self.channel = channel
+        self.start = start
+        self.duration = max(duration, 1)
+        self.peak = peak
+        self.noise = noise
+
+    def factor(self, seconds):
+        progress = (seconds - self.start) / self.duration
+        rise = CHANNELS[self.channel][3]
+        shape = np.where(progress < rise, progress / rise, 1 - (progress - rise) / (1 - rise))
+        return np.where((progress >= 0) & (progress < 1), shape, 0.0)
+
+
+def build_components(specs, duration):
     """
-    Generates synthetic data points for Flux (SolarPoint) OR Telemetry (dict).
+    Request specs ({kind, level, peak, start, duration, noise}) -> Components.
+    Raises ValueError for an unknown kind.
     """
-    points = []
-    start_time = datetime.utcnow()
-    
-    # 1. FLUX SIMULATION (SolarPoint)
-    if event_type == "flux":
-        base_flux = 1e-7
-        peaks = { "X": 5e-4, "M": 2e-5, "C": 5e-6 }
-        peak_val = peaks.get(class_type, 1e-4) # Default to X
-        
-        for i in range(duration_seconds):
-            t = start_time + timedelta(seconds=i)
-            progress = i / duration_seconds
-            
-            # Fast Rise (20%), Slow Decay (80%)
-            if progress < 0.2: factor = (progress / 0.2)
-            else: factor = 1 - ((progress - 0.2) / 0.8)
-            
-            current_flux = base_flux + (peak_val * factor)
-            noise = (current_flux * 0.05) * math.sin(i)
-            
-            points.append(SolarPoint(
-                timestamp=t, flux=current_flux + noise, class_type=class_type, source="simulation"
+    components = []
+    for spec in specs:
+        kind = spec.get("kind", "flare")
+        if kind not in COMPONENT_CHANNELS:
+            raise ValueError(f"Unknown simulation component: {kind}")
+        for channel in COMPONENT_CHANNELS[kind]:
+            _, _, default_peak, _, default_noise = CHANNELS[channel]
+            peak = spec.get("peak")
+            if peak is None:
+                peak = FLARE_PEAKS.get(spec.get("level"), default_peak) if channel == "flux" else default_peak
+            noise = spec.get("noise")
+            components.append(Component(
+                channel, spec.get("start") or 0, spec.get("duration") or duration, peak,
+                default_noise if noise is None else noise,
             ))
-            
-    # 2. TELEMETRY SIMULATION (Wind, Kp, Proton) -> Returns list of DICTS
-    else:
-        # Define Baselines & Peaks
-        if event_type == "wind":
-            base = 350.0
-            peak = 1200.0 # >800 Critical (Boosted for Alert Testing)
-            key = "wind_speed"
-        elif event_type == "kp":
-            base = 2.0
-            peak = 9.0 # >7 Storm (Boosted from 7.0 to ensure trigger)
-            key = "kp_index"
-        elif event_type == "proton":
-            base = 0.5
-            peak = 2000.0 # >100 S2 Storm (Boosted for drama)
-            key = "proton_flux"
-        else:
+    return components
+
+
+class Simulation:
+    """
+    A lazily generated, seeded simulation. next_step() returns the items of
+    the next simulated second: a SolarPoint if it has flux, one telemetry_sim
+    dict with every simulated telemetry key.
+    """
+
+    def __init__(self, name, components, duration, seed=None, start_time=None, chunk=256,
+                 cadence=1, compression=None):
+        self.name = name
+        self.components = components
+        self.cadence = cadence  # Simulated seconds between steps
+        self.steps = max(duration, 0) // cadence
+        self.duration = self.steps * cadence
+        self.seed = seed
+        self.start_time = start_time or datetime.utcnow()
+        self.chunk = chunk
+        # Simulated seconds per wall second (default: one step per heartbeat tick)
+        self.compression = compression or cadence / TICK_SECONDS
+        self.channels = [channel for channel in CHANNELS if any(c.channel == channel for c in components)]
+        self.position = 0  # Steps generated so far
+        self.sent = 0
+        self._due = 0.0
+        self._rng = np.random.default_rng(seed)
+        self._buffer = deque()
+
+    @property
+    def stream(self):
+        # HybridEngine / AlertTracker namespace; the unnamed one keeps the old name
+        return "simulation" if self.name == "default" else f"simulation:{self.name}"
+
+    @property
+    def done(self):
+        return not self._buffer and self.position >= self.steps
+
+    def next_step(self):
+        if not self._buffer and self.position < self.steps:
+            end = min(self.position + self.chunk, self.steps)
+            self._buffer.extend(self._generate(self.position, end))
+            self.position = end
+        if not self._buffer:
             return []
+        self.sent += 1
+        return self._buffer.popleft()
+
+    def next_steps(self, elapsed):
+        """The steps due after `elapsed` wall seconds at this compression (fractions carry over)."""
+        self._due += elapsed * self.compression / self.cadence
+        count = int(self._due + 1e-9)
+        self._due -= count
+        steps = []
+        while count > 0 and not self.done:
+            steps.append(self.next_step())
+            count -= 1
+        return steps
+
+    def columns(self, i0, i1):
+        """{channel: values} for steps [i0, i1): baseline + every overlapping component."""
+        seconds = np.arange(i0, i1, dtype=np.float64) * self.cadence
+        out = {}
+        for channel in self.channels:
+            base = CHANNELS[channel][1]
+            values = np.full(len(seconds), base)
+            for component in self.components:
+                if component.channel != channel:
+                    continue
+                factor = component.factor(seconds)
+                excess = (component.peak - base) if channel != "flux" else component.peak
+                signal = excess * factor
+                if component.noise:
+                    signal = signal + (base + signal) * component.noise * self._rng.standard_normal(len(seconds))
+                values += signal
+            out[channel] = np.maximum(values, 0.0)
+        return out
+
+    def _generate(self, i0, i1):
+        columns = self.columns(i0, i1)
+        stamps = [self.start_time + timedelta(seconds=i * self.cadence) for i in range(i0, i1)]
+        flux = columns.pop("flux", None)
+        flux_list = flux.tolist() if flux is not None else None
+        telemetry = {CHANNELS[channel][0]: values.tolist() for channel, values in columns.items()}
+        classes = np.select([flux >= 1e-4, flux >= 1e-5, flux >= 1e-6], ["X", "M", "C"], default="Quiet").tolist() \
+            if flux is not None else None
 
-        for i in range(duration_seconds):
-            t = start_time + timedelta(seconds=i)
-            progress = i / duration_seconds
-            
-            # Slower Rise (40%), Slow Decay (60%) for massive mass events
-            if progress < 0.4: factor = (progress / 0.4)
-            else: factor = 1 - ((progress - 0.4) / 0.6)
-            
-            val = base + ((peak - base) * factor)
-            
-            # Construct Partial Telemetry Update
-            # (Only the simulated key updates, others unknown/omitted implies strict update)
-            # Actually, to be safe, we just send a dict with this key and a flag.
-            
-            points.append({
-                "type": "telemetry_sim",
-                "timestamp": t.isoformat(),
-                key: val
-            })
-
-    return points
\ No newline at end of file
+        steps = []
+        for k, t in enumerate(stamps):
+            step = []
+            if flux_list is not None:
+                step.append(SolarPoint(timestamp=t, flux=flux_list[k], class_type=classes[k], source="simulation"))
+            if telemetry:
+                packet = {"type": "telemetry_sim", "timestamp": t.isoformat()}
+                for key, values in telemetry.items():
+                    packet[key] = values[k]
+                step.append(packet)
+            steps.append(step)
+        return steps
+
+    def get_stats(self):
+        return {
+            "name": self.name, "stream": self.stream, "seed": self.seed, "duration": self.duration,
+            "cadence": self.cadence, "compression": self.compression,
+            "steps": self.steps, "sent": self.sent, "channels": self.channels,
+            "components": [{"channel": c.channel, "start": c.start, "duration": c.duration, "peak": c.peak}
+                           for c in self.components],
+        }
+
+
+def generate_flare(class_type: str, duration_seconds: int = 60, event_type: str = "flux", seed=None):
+    """
+    Generates synthetic data points for Flux (SolarPoint) OR Telemetry (dict).
+    Eager list of the single-component simulation (small durations only).
+    """
+    if event_type not in EVENT_COMPONENTS:
+        return []
+    specs = [{"kind": EVENT_COMPONENTS[event_type], "level": class_type}]
+    simulation = Simulation("default", build_components(specs, duration_seconds), duration_seconds, seed=seed)
+    points = []
+    while not simulation.done:
+        points.extend(simulation.next_step())
+    return points
+
+
+# --- SCENARIOS ---
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value):
+    """Seconds from a number or "90s" / "20m" / "36h" / "2d" / "1h30m"."""
+    if value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"Bad duration: {value!r}")
+    parts = re.findall(r"(\d+(?:\.\d+)?)\s*([smhd])", value.strip().lower())
+    if not parts or re.sub(r"[\d.\s smhd]", "", value.lower()):
+        raise ValueError(f"Bad duration: {value!r}")
+    return int(sum(float(number) * DURATION_UNITS[unit] for number, unit in parts))
+
+
+def load_scenario(source):
+    """A scenario dict from a bundled name, a .yaml/.json path or YAML/JSON text."""
+    if isinstance(source, dict):
+        return source
+    path = source
+    if not os.path.exists(path):
+        matches = [os.path.join(SCENARIO_DIR, source + ext) for ext in (".yaml", ".yml", ".json")]
+        path = next((match for match in matches if os.path.exists(match)), None)
+    text = source
+    if path is not None:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        if path.endswith(".json"):
+            return json.loads(text)
+    try:
+        import yaml
+    except ImportError:
+        if path is None and text.lstrip().startswith("{"):
+            return json.loads(text)
+        raise RuntimeError("YAML scenarios need PyYAML (pip install pyyaml); JSON ones do not")
+    return yaml.safe_load(text)  # JSON is YAML too
+
+
+def list_scenarios():
+    """Bundled scenario names -> titles."""
+    scenarios = {}
+    for filename in sorted(os.listdir(SCENARIO_DIR)):
+        name, ext = os.path.splitext(filename)
+        if ext in (".yaml", ".yml", ".json"):
+            try:
+                scenarios[name] = load_scenario(os.path.join(SCENARIO_DIR, filename)).get("title", name)
+            except Exception as e:
+                print(f"[WARN] Scenario {filename} unreadable: {e}")
+    return scenarios
+
+
+def _number(where, key, value, minimum=0):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+        raise ValueError(f"{where}: {key} must be a number >= {minimum}, not {value!r}")
+    return value
+
+
+def _check_event(i, event):
+    """One scenario event, validated, with start/duration in seconds. Raises ValueError."""
+    where = f"Event {i + 1}"
+    if not isinstance(event, dict):
+        raise ValueError(f"{where}: must be a mapping, not {event!r}")
+    kind = event.get("kind", "flare")
+    if kind not in COMPONENT_CHANNELS:
+        raise ValueError(f"{where}: unknown kind {kind!r} (one of {', '.join(COMPONENT_CHANNELS)})")
+    if event.get("level") is not None and event["level"] not in FLARE_PEAKS:
+        raise ValueError(f"{where}: level must be one of {', '.join(FLARE_PEAKS)}")
+    _number(where, "peak", event.get("peak"))
+    _number(where, "noise", event.get("noise"))
+    try:
+        start, duration = parse_duration(event.get("start") or 0), parse_duration(event.get("duration"))
+    except ValueError as e:
+        raise ValueError(f"{where}: {e}")
+    return {**event, "kind": kind, "start": _number(where, "start", start),
+            "duration": _number(where, "duration", duration, minimum=1)}
+
+
+def compile_scenario(spec, name=None, seed=None, compression=None, start_time=None):
+    """
+    Scenario dict -> Simulation. Keys: duration, cadence (default 60s),
+    compression (default 3600: an hour per second), seed, and events, each a
+    component spec (kind, level, peak, noise) with start/duration in scenario
+    time. Arguments override the spec. Raises ValueError on a bad spec.
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get("events"), list) or not spec["events"]:
+        raise ValueError("A scenario needs a list of events")
+    events = [_check_event(i, event) for i, event in enumerate(spec["events"])]
+    # Default length: until the last event ends
+    duration = _number("Scenario", "duration", parse_duration(spec.get("duration")), minimum=1) or max(
+        event["start"] + (event["duration"] or 0) for event in events
+    )
+    cadence = _number("Scenario", "cadence", parse_duration(spec.get("cadence") or 60), minimum=1)
+    if duration <= 0:
+        raise ValueError("Scenario duration must be positive (give one, or event durations)")
+    spec_compression = _number("Scenario", "compression", parse_duration(spec.get("compression") or 3600), minimum=1)
+    if seed is None and spec.get("seed") is not None:
+        seed = spec["seed"]
+        if isinstance(seed, bool) or not isinstance(seed, int) or seed < 0:
+            raise ValueError(f"Scenario: seed must be a non-negative integer, not {seed!r}")
+    return Simulation(
+        name or spec.get("name", "scenario"), build_components(events, duration), duration,
+        seed=seed, start_time=start_time, cadence=cadence, compression=compression or spec_compression,
+    )
@@ -0,0 +1,176 @@
+"""
+Snapshot Store - Fetch once, fan out to many WebSocket clients.
+
+The feed scheduler rebuilds the store as data arrives; new /ws connections are
+served from it.
+Concurrent refreshes (e.g. 500 dashboards reconnecting after a deploy while the
+store is cold) are coalesced into a single in-flight NOAA fetch.
+Follower workers never fetch: they serve the snapshot the fetcher last
+published over the bus, stale or not, and a cold follower waits for the next one.
+"""
+
+import asyncio
+import time
+import numpy as np
+from fetcher import fetch_noaa_data, fetch_telemetry_history, series_store
+from ingest import flux_records, solar_points
+from schemas import WSMessage
+from timeseries import series_records
+from wire import encode_history_frames, encode_message
+
+
+class Snapshot:
+    """
+    One consistent view of the NOAA feeds, shared by every client.
+    Payloads are materialized here (once per refresh, not once per client);
+    the underlying series keep changing between cycles.
+    """
+
+    def __init__(self, flux_columns, telemetry_columns, calculus, fetched_at):
+        self.fetched_at = fetched_at  # time.monotonic() of the refresh
+        self.calculus = calculus  # HybridEngine streaming result for the newest sample
+
+        # (times, values) column copies: the live series keep changing
+        self.flux_columns = flux_columns
+        self.telemetry_columns = telemetry_columns  # {channel: (times, values)}
+        times, values = flux_columns
+        self.latest = solar_points(times[-1:], values[-1:])[0] if len(times) else None
+        self._frames = {}  # wire format -> encoded connect-time frames
+
+    @classmethod
+    def from_series(cls, flux, telemetry_history, calculus):
+        return cls(
+            (flux.times.copy(), flux.values.copy()),
+            {channel: (series.times.copy(), series.values.copy())
+             for channel, series in telemetry_history.items()},
+            calculus,
+            time.monotonic()
+        )
+
+    def to_dict(self):
+        """Plain-JSON form, published to follower workers over the bus."""
+        return {
+            "flux": [column.tolist() for column in self.flux_columns],
+            "telemetry": {
+                channel: [column.tolist() for column in columns]
+                for channel, columns in self.telemetry_columns.items()
+            },
+            "calculus": self.calculus,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        def columns(pair):
+            return (np.array(pair[0], dtype=np.int64), np.array(pair[1], dtype=np.float64))
+        return cls(
+            columns(data["flux"]),
+            {channel: columns(pair) for channel, pair in data["telemetry"].items()},
+            data["calculus"],
+            time.monotonic()
+        )
+
+    def initial_frames(self, fmt="json"):
+        """
+        The connect-time frames (history, calculus, telemetry history) in the
+        client's wire format, encoded once per snapshot and reused for every
+        connecting client.
+        """
+        frames = self._frames.get(fmt)
+        if frames is None:
+            if fmt == "json":
+                history = encode_message(WSMessage(
+                    type="history_update", payload={"history": flux_records(*self.flux_columns)}
+                ))
+                telemetry = encode_message(WSMessage(
+                    type="telemetry_history_update",
+                    payload={channel: series_records(*columns) for channel, columns in self.telemetry_columns.items()}
+                ))
+            else:
+                history, telemetry = encode_history_frames(self.flux_columns, self.telemetry_columns, fmt)
+
+            frames = []
+            if self.latest is not None:
+                frames.append(history)
+                frames.append(encode_message(WSMessage(type="calculus_update", payload=self.calculus)))
+            frames.append(telemetry)
+            self._frames[fmt] = frames
+        return frames
+
+
+class SnapshotStore:
+    def __init__(self, engine, max_age_seconds=90.0):
+        self.engine = engine
+        self.max_age_seconds = max_age_seconds
+        self.snapshot = None
+        self._inflight = None  # asyncio.Task of the running refresh
+        self._analyzed_until = None  # Newest flux timestamp pushed into the engine
+        self._calculus = None
+        self._installed = asyncio.Event()  # Set once a published snapshot arrived
+
+    def is_fresh(self):
+        if self.snapshot is None or self.snapshot.latest is None:
+            return False
+        return (time.monotonic() - self.snapshot.fetched_at) < self.max_age_seconds
+
+    async def get(self, fetch=True, wait=5.0):
+        """
+        Returns the current snapshot, fetching only if the store is cold or stale
+        (the heartbeat idles while nobody is connected).
+        fetch=False (followers): never goes to NOAA. Returns the last published
+        snapshot, waiting up to `wait` seconds for one if none arrived yet, or
+        None.
+        """
+        if self.is_fresh():
+            return self.snapshot
+        if fetch:
+            return await self.refresh()
+        if self.snapshot is None:
+            try:
+                await asyncio.wait_for(self._installed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        return self.snapshot
+
+    async def refresh(self):
+        """
+        Refreshes from NOAA. Callers arriving while a refresh is running await
+        the same task instead of starting another fetch.
+        """
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._refresh())
+        # shield: one cancelled waiter (client hung up) must not kill the fetch
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self):
+        # The series keep the last good data if NOAA hiccups
+        flux, telemetry_history = await asyncio.gather(
+            fetch_noaa_data(),
+            fetch_telemetry_history()
+        )
+        self.snapshot = Snapshot.from_series(flux, telemetry_history, self._analyze_new(flux))
+        return self.snapshot
+
+    def rebuild(self):
+        """
+        Re-snapshots the series store after a scheduled feed updated it
+        (no fetch). New flux samples go through the streaming engine.
+        """
+        flux = series_store["flux"]
+        telemetry_history = {channel: series_store[channel] for channel in ("wind", "kp", "proton")}
+        self.snapshot = Snapshot.from_series(flux, telemetry_history, self._analyze_new(flux))
+        return self.snapshot
+
+    def install(self, snapshot):
+        """Adopts a snapshot published by the fetcher process (follower workers)."""
+        self.snapshot = snapshot
+        self._installed.set()
+
+    def _analyze_new(self, flux):
+        # Only samples newer than the last refresh go through the streaming engine
+        t_from = None if self._analyzed_until is None else self._analyzed_until + 1
+        times, values = flux.slice(t_from, None)
+        for t, value in zip(times.tolist(), values.tolist()):
+            self._calculus = self.engine.push_flux(t, value, stream="live")
+        if len(times):
+            self._analyzed_until = int(times[-1])
+        return self._calculus
@@ -0,0 +1,97 @@
+"""
+Alert Subscribers - Who gets an email for which threat.
+
+Alert fan-out used to run `db.query(User).all()` (full ORM objects, OTP fields
+included) on every alert. SubscriberCache instead streams just the email
+column, in pages (yield_per), filtered by the indexed alert_preferences table,
+and caches the result per (threat type, severity).
+
+Preferences: a user with no row for a threat type gets the alerts of that
+type from DEFAULT_MIN_SEVERITY up (M-class flares, wind over 800 km/s, S2
+protons, G3 storms); the severity-1 early warnings (RAPID_INTENSIFICATION, S1 protons)
+stay on the dashboard unless a user opts in. A row overrides it:
+enabled=False opts out, min_severity picks the levels.
+
+The cache is invalidated whenever a user signs up or a preference changes in
+this process (SQLAlchemy mapper events); other workers pick changes up within
+`ttl` seconds.
+"""
+
+import threading
+import time
+from sqlalchemy import and_, event, or_
+from models import SessionLocal, User, AlertPreference
+
+THREAT_TYPES = ("flux", "wind", "kp", "proton")
+DEFAULT_MIN_SEVERITY = 2  # Users without a preference row
+
+class SubscriberCache:
+    def __init__(self, ttl=300.0, page_size=1000):
+        self.ttl = ttl
+        self.page_size = page_size
+        self._entries = {}  # (threat_type, severity) -> (loaded_at, [emails])
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "rows_streamed": 0}
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.stats["invalidations"] += 1
+
+    def recipients(self, threat_type, severity):
+        """
+        Emails to alert for this threat at this severity. Blocking (DB query on
+        a miss): call it via asyncio.to_thread from the event loop.
+        """
+        key = (threat_type, severity)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+
+        emails = list(self._stream(threat_type, severity))
+        with self._lock:
+            self._entries[key] = (time.monotonic(), emails)
+        return emails
+
+    def _stream(self, threat_type, severity):
+        subscribed = [and_(AlertPreference.enabled.is_(True), AlertPreference.min_severity <= severity)]
+        if severity >= DEFAULT_MIN_SEVERITY:
+            subscribed.append(AlertPreference.id.is_(None))  # No preference: the default levels
+        db = SessionLocal()
+        try:
+            query = (
+                db.query(User.email)
+                .outerjoin(AlertPreference, and_(
+                    AlertPreference.user_id == User.id,
+                    AlertPreference.threat_type == threat_type,
+                ))
+                .filter(or_(*subscribed))
+                .execution_options(yield_per=self.page_size)
+            )
+            for (email,) in query:
+                self.stats["rows_streamed"] += 1
+                yield email
+        finally:
+            db.close()
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "cached_keys": len(self._entries), "ttl": self.ttl}
+
+
+subscriber_cache = SubscriberCache()
+
+
+# Signups and preference changes drop the cached recipient lists
+def _invalidate(mapper, connection, target):
+    subscriber_cache.invalidate()
+
+
+# (User updates are OTP churn on every login and don't change who is subscribed)
+event.listen(User, "after_insert", _invalidate)
+event.listen(User, "after_delete", _invalidate)
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(AlertPreference, _event, _invalidate)
@@ -0,0 +1,215 @@
+"""
+Columnar Time-Series Store - NumPy ring buffers for flux, wind, Kp and proton.
+
+Each channel is a pair of parallel arrays (int64 epoch seconds + float values)
+instead of a list of pydantic models / dicts: ~12-16 bytes per sample, and
+slicing, scans and analysis are vectorized.
+
+Views returned by `times`, `values` and `slice()` are zero-copy and read-only.
+They stay valid until the next write to the series; copy them if you need to
+keep them across a fetch cycle.
+"""
+
+import numpy as np
+
+
+def to_epoch_seconds(time_tags):
+    """NOAA time tags ('2024-01-01T00:00:00Z' / '2024-01-01 00:00:00.000') -> int64 epoch seconds."""
+    # numpy refuses explicit timezones; every NOAA tag is UTC
+    tags = [t[:-1] if t.endswith('Z') else t for t in time_tags]
+    return np.array(tags, dtype='datetime64[s]').astype(np.int64)
+
+
+def epoch_to_iso(epochs):
+    """int64 epoch seconds -> ISO-8601 UTC strings ('...Z'), vectorized."""
+    stamps = np.datetime_as_string(np.asarray(epochs).astype('datetime64[s]'), unit='s')
+    return np.char.add(stamps, 'Z').tolist()
+
+
+class RingSeries:
+    """
+    Fixed-capacity, time-ordered series.
+
+    Storage is a 2x-capacity buffer written append-only; when the write cursor
+    hits the end, the live window is moved back to the front (amortized O(1)).
+    That keeps the live data contiguous, so views never need a copy.
+    """
+
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self._times = np.empty(capacity * 2, dtype=np.int64)
+        self._values = np.empty(capacity * 2, dtype=dtype)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def times(self):
+        return self._view(self._times, self._start, self._end)
+
+    @property
+    def values(self):
+        return self._view(self._values, self._start, self._end)
+
+    @staticmethod
+    def _view(buffer, start, end):
+        view = buffer[start:end]
+        view.flags.writeable = False
+        return view
+
+    def last_time(self):
+        return int(self._times[self._end - 1]) if len(self) else None
+
+    def slice(self, t_from=None, t_to=None):
+        """Zero-copy (times, values) views for t_from <= t <= t_to (epoch seconds)."""
+        times = self._times[self._start:self._end]
+        lo = 0 if t_from is None else int(np.searchsorted(times, t_from, side='left'))
+        hi = len(times) if t_to is None else int(np.searchsorted(times, t_to, side='right'))
+        return (
+            self._view(self._times, self._start + lo, self._start + hi),
+            self._view(self._values, self._start + lo, self._start + hi),
+        )
+
+    def append(self, t, value):
+        """Appends one sample; an equal or older timestamp goes through merge()."""
+        last = self.last_time()
+        if last is not None and t <= last:
+            self.merge(np.array([t], dtype=np.int64), np.array([value]))
+            return
+        if self._end == len(self._times):
+            self._compact()
+        self._times[self._end] = t
+        self._values[self._end] = value
+        self._end += 1
+        self._trim()
+
+    def extend(self, times, values):
+        """Appends samples that are all newer than the current tail (sorted)."""
+        n = len(times)
+        if n == 0:
+            return
+        if n > self.capacity:
+            times, values = times[-self.capacity:], values[-self.capacity:]
+            n = self.capacity
+        if self._end + n > len(self._times):
+            self._compact()
+        self._times[self._end:self._end + n] = times
+        self._values[self._end:self._end + n] = values
+        self._end += n
+        self._trim()
+
+    def merge(self, times, values):
+        """
+        Upserts samples by timestamp (vectorized).
+        Newer samples are appended, existing timestamps are overwritten
+        (NOAA corrections) and older gaps are inserted in order.
+        Returns {"appended", "updated", "inserted"}.
+        """
+        times = np.asarray(times, dtype=np.int64)
+        # In the storage dtype, so unchanged samples compare equal (float32 vs float64)
+        values = np.asarray(values, dtype=self._values.dtype)
+        result = {"appended": 0, "updated": 0, "inserted": 0}
+        if len(times) == 0:
+            return result
+
+        if len(times) > 1 and np.any(times[1:] < times[:-1]):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        # Last write wins for duplicate timestamps inside one batch
+        keep = np.append(times[1:] != times[:-1], True)
+        times, values = times[keep], values[keep]
+
+        last = self.last_time()
+        if last is None:
+            self.extend(times, values)
+            result["appended"] = len(times)
+            return result
+
+        newer = times > last
+        old_times, old_values = times[~newer], values[~newer]
+        if len(old_times):
+            current = self._times[self._start:self._end]
+            idx = np.searchsorted(current, old_times)
+            hit = current[np.minimum(idx, len(current) - 1)] == old_times
+            hit &= idx < len(current)
+
+            target = self._values[self._start:self._end]
+            changed = hit.copy()
+            changed[hit] = target[idx[hit]] != old_values[hit]
+            target[idx[changed]] = old_values[changed]
+            result["updated"] = int(changed.sum())
+
+            gaps = ~hit & (old_times >= current[0])
+            if gaps.any():
+                self._insert(old_times[gaps], old_values[gaps])
+                result["inserted"] = int(gaps.sum())
+
+        self.extend(times[newer], values[newer])
+        result["appended"] = int(newer.sum())
+        return result
+
+    def evict_before(self, t):
+        """Drops every sample older than t. Returns the number evicted."""
+        times = self._times[self._start:self._end]
+        n = int(np.searchsorted(times, t, side='left'))
+        self._start += n
+        return n
+
+    def clear(self):
+        self._start = self._end = 0
+
+    def _insert(self, times, values):
+        # Rare path (late samples filling a gap): rebuild the live window
+        all_times = np.concatenate([self._times[self._start:self._end], times])
+        all_values = np.concatenate([self._values[self._start:self._end], values])
+        order = np.argsort(all_times, kind='stable')
+        self.clear()
+        self.extend(all_times[order], all_values[order].astype(self._values.dtype))
+
+    def _compact(self):
+        n = len(self)
+        self._times[:n] = self._times[self._start:self._end]
+        self._values[:n] = self._values[self._start:self._end]
+        self._start, self._end = 0, n
+
+    def _trim(self):
+        if len(self) > self.capacity:
+            self._start = self._end - self.capacity
+
+
+class SeriesStore:
+    """The live channels, keyed by name."""
+
+    # 3-day minutely X-ray window (4320) + headroom; 7-day 3-hourly Kp is tiny
+    CHANNELS = {
+        "flux": (8192, np.float64),
+        "wind": (8192, np.float32),
+        "kp": (1024, np.float32),
+        "proton": (8192, np.float32),
+    }
+
+    def __init__(self):
+        self.channels = {
+            name: RingSeries(capacity, dtype)
+            for name, (capacity, dtype) in self.CHANNELS.items()
+        }
+
+    def __getitem__(self, channel):
+        return self.channels[channel]
+
+
+def to_float_list(values):
+    """Python floats for JSON; float32 goes via its shortest repr (3.33, not 3.3299999)."""
+    if values.dtype == np.float32:
+        return values.astype(str).astype(np.float64).tolist()
+    return values.tolist()
+
+
+def series_records(times, values):
+    """[{timestamp, value}] rows for JSON payloads (telemetry_history_update shape)."""
+    return [
+        {"timestamp": ts, "value": value}
+        for ts, value in zip(epoch_to_iso(times), to_float_list(values))
+    ]
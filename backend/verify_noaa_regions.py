@@ -1,8 +1,9 @@
 import httpx
 import asyncio
 import json
+from fetcher import NOAA_BASE_URL  # NOAA SWPC, or a stand-in with the same paths
 
-URL = "https://services.swpc.noaa.gov/json/solar_regions.json"
+URL = f"{NOAA_BASE_URL}/json/solar_regions.json"
 
 async def check_regions():
     print(f"Fetching from {URL}...")
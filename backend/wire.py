@@ -0,0 +1,94 @@
+"""
+Wire Encoding - WSMessage -> WebSocket frame.
+
+Broadcasts encode each message exactly once and send the same frame to every
+socket. orjson is used when installed (several times faster than pydantic's
+JSON for the large history payloads); the output matches model_dump_json():
+UTC datetimes end in 'Z', naive ones carry no offset.
+
+Compact history formats (opt-in, negotiated with /ws?format=...):
+- "json" (default): history_update rows as SolarPoint objects.
+- "compact": columnar JSON. Timestamps are an epoch base plus deltas, values
+  are float32-rounded, and class_type/source are no longer repeated per point:
+    {"encoding": "columnar", "t0": 1700000000, "dt": [60, 60, ...], "flux": [...]}
+  telemetry_history_update: {"encoding": "columnar", "wind": {"t0", "dt", "v"}, ...}
+- "msgpack": the same columnar payload as one binary MessagePack frame, with
+  "dt" as little-endian int32 bytes and values as little-endian float32 bytes
+  (ready for Int32Array/Float32Array). Needs the optional msgpack package,
+  otherwise the client gets "compact".
+Only the connect-time history frames change; live updates stay JSON text.
+Frames are further compressed by permessage-deflate (uvicorn's default).
+"""
+
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # Optional: fall back to pydantic's encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional: "msgpack" clients fall back to "compact"
+    msgpack = None
+
+ORJSON_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+FORMATS = ("json", "compact", "msgpack")
+
+
+def encode_message(msg):
+    """Serializes a WSMessage to the text frame sent to clients."""
+    if orjson is not None:
+        return orjson.dumps(msg.model_dump(), option=ORJSON_OPTIONS).decode()
+    return msg.model_dump_json()
+
+
+def negotiate_format(requested):
+    """Client's ?format= -> the format we will actually send."""
+    requested = (requested or "json").lower()
+    if requested not in FORMATS:
+        return "json"
+    if requested == "msgpack" and msgpack is None:
+        return "compact"
+    return requested
+
+
+def columnar(times, values, binary=False):
+    """(epoch int64, float) columns -> {"t0", "dt", "v"} (delta timestamps, float32 values)."""
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float32)
+    t0 = int(times[0]) if len(times) else 0
+    deltas = np.diff(times, prepend=t0).astype(np.int32)
+    if binary:
+        return {"t0": t0, "dt": deltas.astype('<i4').tobytes(), "v": values.astype('<f4').tobytes()}
+    # float32 shortest repr: 1.2e-06 instead of 1.2000000424450263e-06
+    return {"t0": t0, "dt": deltas.tolist(), "v": values.astype(str).astype(np.float64).tolist()}
+
+
+def encode_columnar_frame(msg_type, payload, fmt):
+    """A compact/msgpack frame: str for "compact", bytes for "msgpack"."""
+    if fmt == "msgpack":
+        return msgpack.packb({"type": msg_type, "payload": payload}, use_bin_type=True)
+    message = {"type": msg_type, "payload": payload}
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message, separators=(",", ":"))
+
+
+def encode_history_frames(flux_columns, telemetry_columns, fmt):
+    """
+    history_update + telemetry_history_update in a compact format.
+    flux_columns: (times, flux); telemetry_columns: {channel: (times, values)}
+    """
+    binary = fmt == "msgpack"
+    flux = columnar(*flux_columns, binary=binary)
+    history = {"encoding": "columnar", "t0": flux["t0"], "dt": flux["dt"], "flux": flux["v"]}
+    telemetry = {"encoding": "columnar"}
+    for channel, columns in telemetry_columns.items():
+        telemetry[channel] = columnar(*columns, binary=binary)
+    return (
+        encode_columnar_frame("history_update", history, fmt),
+        encode_columnar_frame("telemetry_history_update", telemetry, fmt),
+    )